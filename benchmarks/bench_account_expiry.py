@@ -0,0 +1,93 @@
+"""
+账户过期检查基准测试
+
+模拟 admin_stats / admin_get_accounts 对整个账户池的一次扫描，对比
+每次用 strptime 解析 expires_at 的旧实现与使用预解析 epoch 的 AccountConfig。
+
+用法:
+    python benchmarks/bench_account_expiry.py
+    python benchmarks/bench_account_expiry.py --accounts 50000 --repeat 5
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.account import AccountConfig  # noqa: E402
+
+
+def legacy_remaining_hours(expires_at):
+    """旧实现（仅用于对比）"""
+    if not expires_at:
+        return None
+    try:
+        beijing_tz = timezone(timedelta(hours=8))
+        expire_time = datetime.strptime(expires_at, "%Y-%m-%d %H:%M:%S")
+        expire_time = expire_time.replace(tzinfo=beijing_tz)
+        now = datetime.now(beijing_tz)
+        return (expire_time - now).total_seconds() / 3600
+    except Exception:
+        return None
+
+
+def legacy_is_expired(expires_at) -> bool:
+    remaining = legacy_remaining_hours(expires_at)
+    if remaining is None:
+        return False
+    return remaining <= 0
+
+
+def build_configs(count: int, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    now = datetime.now(timezone(timedelta(hours=8)))
+    configs = []
+    for i in range(count):
+        expires = now + timedelta(hours=rng.uniform(-2, 12))
+        configs.append(AccountConfig(
+            account_id=f"acc_{i}",
+            secure_c_ses="x",
+            host_c_oses=None,
+            csesidx="1",
+            config_id="c",
+            expires_at=expires.strftime("%Y-%m-%d %H:%M:%S"),
+        ))
+    return configs
+
+
+def best_of(repeat: int, func) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench(count: int, repeat: int) -> None:
+    configs = build_configs(count)
+    assert [legacy_is_expired(c.expires_at) for c in configs] == [c.is_expired() for c in configs]
+
+    legacy = best_of(repeat, lambda: [legacy_is_expired(c.expires_at) for c in configs])
+    cached = best_of(repeat, lambda: [c.is_expired() for c in configs])
+    print(
+        f"{count:>7} 账户 | 旧实现 {legacy * 1000:>9.2f} ms/次扫描 | "
+        f"预解析 {cached * 1000:>7.2f} ms/次扫描 | 加速 {legacy / cached:>6.1f}x"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--accounts", type=int, action="append", help="账户数量（可重复，默认 1000/10000）")
+    parser.add_argument("--repeat", type=int, default=5, help="重复次数（取最优）")
+    args = parser.parse_args()
+
+    for count in args.accounts or [1000, 10000]:
+        bench(count, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
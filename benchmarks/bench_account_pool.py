@@ -0,0 +1,109 @@
+"""
+账户选择基准测试
+
+对比旧的 get_account（遍历全部账户、解析过期时间、按健康度排序）与
+按健康度分桶的 AccountPool，输出不同账户规模下每秒可完成的选择次数。
+
+用法:
+    python benchmarks/bench_account_pool.py
+    python benchmarks/bench_account_pool.py --accounts 10000 --selections 20000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.account import AccountConfig, MultiAccountManager  # noqa: E402
+
+
+def build_manager(count: int, seed: int = 0) -> MultiAccountManager:
+    """构造 count 个账户：部分带错误计数、部分处于 429 冷却、少量禁用或已过期"""
+    rng = random.Random(seed)
+    beijing_tz = timezone(timedelta(hours=8))
+    now = datetime.now(beijing_tz)
+    manager = MultiAccountManager(session_cache_ttl_seconds=3600)
+    for i in range(count):
+        expires = now + timedelta(hours=rng.uniform(-1, 12))
+        config = AccountConfig(
+            account_id=f"acc_{i}",
+            secure_c_ses="x",
+            host_c_oses=None,
+            csesidx="1",
+            config_id="c",
+            expires_at=expires.strftime("%Y-%m-%d %H:%M:%S"),
+            disabled=rng.random() < 0.02,
+        )
+        manager.add_account(config, None, "bench", 3, 600, {})
+        account = manager.accounts[config.account_id]
+        roll = rng.random()
+        if roll < 0.2:
+            account.error_count = rng.randint(1, 2)
+        elif roll < 0.25:
+            account.last_429_time = time.time()
+            account.is_available = False
+    return manager
+
+
+def legacy_select(manager: MultiAccountManager, state: dict):
+    """旧实现（仅用于对比）"""
+    available_accounts = []
+    for acc_id in manager.account_list:
+        account = manager.accounts[acc_id]
+        if (account.should_retry() and
+                not account.config.is_expired() and
+                not account.config.disabled):
+            available_accounts.append((acc_id, -account.error_count))
+    if not available_accounts:
+        return None
+    available_accounts.sort(key=lambda x: x[1], reverse=True)
+    healthy_count = max(1, len(available_accounts) // 2)
+    healthy_accounts = [acc_id for acc_id, _ in available_accounts[:healthy_count]]
+    account_id = healthy_accounts[state["index"] % len(healthy_accounts)]
+    state["index"] = (state["index"] + 1) % len(healthy_accounts)
+    return manager.accounts[account_id]
+
+
+def bench(count: int, selections: int) -> None:
+    manager = build_manager(count)
+
+    # 两种实现应认为同一批账户可用，且都只从最健康的一半中选择
+    legacy_ids = {legacy_select(manager, {"index": i}).config.account_id for i in range(min(count, 200))}
+    pool_ids = {manager.pool.select().config.account_id for _ in range(min(count, 200))}
+    max_legacy_errors = max(manager.accounts[a].error_count for a in legacy_ids)
+    assert all(manager.accounts[a].error_count <= max_legacy_errors for a in pool_ids)
+
+    legacy_runs = max(1, min(selections, 200000 // max(count, 1)))
+    state = {"index": 0}
+    start = time.perf_counter()
+    for _ in range(legacy_runs):
+        legacy_select(manager, state)
+    legacy_rate = legacy_runs / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for _ in range(selections):
+        manager.pool.select()
+    pool_rate = selections / (time.perf_counter() - start)
+
+    print(
+        f"{count:>7} 账户 | 可用 {len(manager.pool):>6} | "
+        f"旧实现 {legacy_rate:>12,.0f} 次/秒 | AccountPool {pool_rate:>12,.0f} 次/秒 | "
+        f"加速 {pool_rate / legacy_rate:>8.1f}x"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--accounts", type=int, action="append", help="账户数量（可重复，默认 100/1000/10000）")
+    parser.add_argument("--selections", type=int, default=100000, help="AccountPool 的选择次数")
+    args = parser.parse_args()
+
+    for count in args.accounts or [100, 1000, 10000]:
+        bench(count, args.selections)
+
+
+if __name__ == "__main__":
+    main()
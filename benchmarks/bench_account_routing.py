@@ -0,0 +1,148 @@
+"""
+账户路由与并发控制模拟
+
+模拟一组账户，每个账户有一个未知的真实并发容量（超过后上游返回 429，账户进入冷却）。
+请求按泊松过程到达，失败后最多换账户重试 MAX_ATTEMPTS 次。对比：
+
+- 轮询：旧行为，在健康账户中轮询，不感知在途请求数
+- 自适应：按账户 AIMD 并发上限 + 负载最低优先，所有账户满载时排队
+
+统计完成数、429 次数、失败请求数与请求延迟（含排队与重试）。时间按 --speed 倍压缩。
+
+用法:
+    python benchmarks/bench_account_routing.py
+    python benchmarks/bench_account_routing.py --accounts 16 --load 1.2 --duration 60
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi import HTTPException  # noqa: E402
+
+from core.account import AccountConfig, AccountManager, MultiAccountManager  # noqa: E402
+from core.concurrency import AccountConcurrency, ConcurrencyPolicy  # noqa: E402
+
+MAX_ATTEMPTS = 3
+
+
+class Simulation:
+    def __init__(self, capacities, adaptive: bool, speed: float, cooldown: float, ttft: float, stream: float) -> None:
+        policy = ConcurrencyPolicy(
+            enabled=lambda: adaptive,
+            initial_limit=lambda: 4,
+            max_limit=lambda: 32,
+            queue_timeout_seconds=lambda: 5 / speed,
+        )
+        self.speed = speed
+        self.ttft = ttft
+        self.stream = stream
+        self.manager = MultiAccountManager(3600, 100)
+        self.capacities = {}
+        self.upstream_inflight = {}
+        for index, capacity in enumerate(capacities):
+            config = AccountConfig(
+                account_id=f"acc{index}", secure_c_ses="x", host_c_oses=None, csesidx=str(index), config_id="c"
+            )
+            account = AccountManager(config, None, "bench", 1000, max(1, int(cooldown / speed)))
+            account.concurrency = AccountConcurrency(policy)
+            self.manager.accounts[config.account_id] = account
+            self.manager.pool.add(account)
+            self.capacities[config.account_id] = capacity
+            self.upstream_inflight[config.account_id] = 0
+        self.completed = 0
+        self.failed = 0
+        self.rate_limited = 0
+        self.latencies = []
+
+    async def sleep(self, seconds: float) -> None:
+        await asyncio.sleep(seconds / self.speed)
+
+    async def attempt(self, account: AccountManager) -> bool:
+        account_id = account.config.account_id
+        async with account.concurrency.slot():
+            self.upstream_inflight[account_id] += 1
+            try:
+                if self.upstream_inflight[account_id] > self.capacities[account_id]:
+                    await self.sleep(0.05)
+                    self.rate_limited += 1
+                    account.concurrency.on_rate_limited()
+                    account.last_429_time = time.time()
+                    account.is_available = False
+                    return False
+                ttft = random.uniform(0.5, 1.5) * self.ttft
+                await self.sleep(ttft)
+                account.concurrency.on_success(ttft * 1000)
+                await self.sleep(random.uniform(0.5, 1.5) * self.stream)
+                return True
+            finally:
+                self.upstream_inflight[account_id] -= 1
+
+    async def request(self) -> None:
+        start = time.perf_counter()
+        for _ in range(MAX_ATTEMPTS):
+            try:
+                account = await self.manager.get_account()
+            except HTTPException:
+                # 所有账户都在冷却
+                await self.sleep(0.5)
+                continue
+            if await self.attempt(account):
+                self.completed += 1
+                self.latencies.append((time.perf_counter() - start) * self.speed)
+                return
+        self.failed += 1
+
+    async def run(self, rate: float, duration: float) -> None:
+        tasks = []
+        end = time.perf_counter() + duration / self.speed
+        while time.perf_counter() < end:
+            tasks.append(asyncio.create_task(self.request()))
+            await self.sleep(random.expovariate(rate))
+        await asyncio.gather(*tasks)
+
+
+def percentile(values, p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+async def bench(args) -> None:
+    rng = random.Random(args.seed)
+    capacities = [rng.randint(2, 6) for _ in range(args.accounts)]
+    service_time = args.ttft + args.stream
+    rate = sum(capacities) / service_time * args.load
+    print(f"{args.accounts} 个账户，真实容量合计 {sum(capacities)} 并发，到达率 {rate:.1f} 请求/秒（负载 {args.load:.0%}）")
+    for label, adaptive in (("轮询", False), ("自适应", True)):
+        random.seed(args.seed)
+        sim = Simulation(capacities, adaptive, args.speed, args.cooldown, args.ttft, args.stream)
+        await sim.run(rate, args.duration)
+        total = sim.completed + sim.failed
+        print(
+            f"{label:<4} | 完成 {sim.completed:>5}/{total:<5} | 429 {sim.rate_limited:>5} | "
+            f"失败 {sim.failed:>4} | p50 {percentile(sim.latencies, 0.5):>6.2f}s | p99 {percentile(sim.latencies, 0.99):>6.2f}s"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--accounts", type=int, default=8, help="账户数")
+    parser.add_argument("--load", type=float, default=0.9, help="到达率 / 池的真实容量")
+    parser.add_argument("--duration", type=float, default=120, help="模拟时长（秒，压缩前）")
+    parser.add_argument("--ttft", type=float, default=2.0, help="平均首字延迟（秒）")
+    parser.add_argument("--stream", type=float, default=6.0, help="平均流式输出时长（秒）")
+    parser.add_argument("--cooldown", type=float, default=60.0, help="429 冷却时间（秒）")
+    parser.add_argument("--speed", type=float, default=20.0, help="时间压缩倍数")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    asyncio.run(bench(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+URL 附件下载 + 上传的内存峰值基准测试
+
+对比旧实现（整体下载 → base64 字符串 → json= 序列化请求体）与流式附件管道
+（边下载边转存临时文件 → 按块编码 base64 → 流式请求体），用 tracemalloc 统计
+单个附件从下载到上传完成的 Python 内存峰值。上游为本地模拟传输，不产生网络请求。
+
+用法:
+    python benchmarks/bench_attachment_upload.py
+    python benchmarks/bench_attachment_upload.py --size-mb 50 --uploads 3
+"""
+import argparse
+import asyncio
+import base64
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx  # noqa: E402
+
+from core.attachments import AttachmentBudget, context_file_body, download_attachment  # noqa: E402
+
+CHUNK_SIZE = 64 * 1024
+
+
+class LocalTransport(httpx.AsyncBaseTransport):
+    """GET 返回固定内容；POST 逐块读取并丢弃请求体（与真实上游一样不整体缓存）"""
+
+    def __init__(self, payload: bytes) -> None:
+        self.payload = payload
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if request.method == "GET":
+            async def body():
+                view = memoryview(self.payload)
+                for start in range(0, len(view), CHUNK_SIZE):
+                    yield bytes(view[start:start + CHUNK_SIZE])
+            return httpx.Response(200, content=body(), headers={"content-type": "application/pdf"})
+        received = 0
+        async for chunk in request.stream:
+            received += len(chunk)
+        return httpx.Response(200, json={"received": received})
+
+
+def upload_body() -> dict:
+    return {
+        "configId": "bench",
+        "additionalParams": {"token": "-"},
+        "addContextFileRequest": {"name": "sessions/bench", "fileName": "bench.pdf", "mimeType": "application/pdf"},
+    }
+
+
+async def legacy(client: httpx.AsyncClient, uploads: int) -> None:
+    resp = await client.get("https://files.example/bench.pdf")
+    b64 = base64.b64encode(resp.content).decode()
+    for _ in range(uploads):
+        body = upload_body()
+        body["addContextFileRequest"]["fileContents"] = b64
+        await client.post("https://upstream.example/widgetAddContextFile", json=body)
+
+
+async def streaming(client: httpx.AsyncClient, uploads: int) -> None:
+    budget = AttachmentBudget(1 << 40, 1 << 40)
+    attachment = await download_attachment(client, "https://files.example/bench.pdf", budget)
+    try:
+        for _ in range(uploads):
+            content, length = context_file_body(upload_body(), attachment)
+            await client.post(
+                "https://upstream.example/widgetAddContextFile",
+                headers={"content-type": "application/json", "content-length": str(length)},
+                content=content,
+            )
+    finally:
+        attachment.close()
+
+
+async def measure(label: str, func, payload: bytes, uploads: int) -> None:
+    async with httpx.AsyncClient(transport=LocalTransport(payload)) as client:
+        tracemalloc.start()
+        start = time.perf_counter()
+        await func(client, uploads)
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    print(f"{label:<6} | 内存峰值 {peak / 1024 / 1024:>8.2f} MB | 耗时 {elapsed:>6.2f}s")
+
+
+async def bench(args) -> None:
+    payload = os.urandom(args.size_mb * 1024 * 1024)
+    print(f"附件 {args.size_mb}MB，上传 {args.uploads} 次（模拟重试/切换账户）")
+    await measure("旧实现", legacy, payload, args.uploads)
+    await measure("流式", streaming, payload, args.uploads)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=int, default=20, help="附件大小（MB）")
+    parser.add_argument("--uploads", type=int, default=2, help="同一附件的上传次数")
+    args = parser.parse_args()
+    asyncio.run(bench(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+SSE 分块编码基准测试
+
+对比旧的 create_chunk（每个增量重建整个 dict 再序列化）与
+预序列化信封的 ChunkEncoder，输出单核每秒可编码的分块数。
+
+用法:
+    python benchmarks/bench_chunk_encoder.py
+    python benchmarks/bench_chunk_encoder.py --chunks 200000 --text-size 64
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from util import json_codec  # noqa: E402
+from util.sse_encoder import ChunkEncoder  # noqa: E402
+
+
+def legacy_create_chunk(id: str, created: int, model: str, delta: dict, finish_reason) -> str:
+    """旧实现（仅用于对比）"""
+    chunk = {
+        "id": id,
+        "object": "chat.completion.chunk",
+        "created": created,
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "delta": delta,
+            "logprobs": None,
+            "finish_reason": finish_reason
+        }],
+        "system_fingerprint": None
+    }
+    return json.dumps(chunk)
+
+
+def build_texts(count: int, text_size: int) -> list:
+    base = "流式输出的增量文本 \"quoted\" and plain ascii "
+    text = (base * (text_size // len(base) + 1))[:text_size]
+    return [text + str(i % 10) for i in range(count)]
+
+
+def bench_legacy(texts, chat_id, created, model) -> float:
+    start = time.perf_counter()
+    for text in texts:
+        chunk = legacy_create_chunk(chat_id, created, model, {"content": text}, None)
+        f"data: {chunk}\n\n".encode("utf-8")  # StreamingResponse 需要的 str -> bytes
+    return time.perf_counter() - start
+
+
+def bench_codec_dict(texts, chat_id, created, model) -> float:
+    start = time.perf_counter()
+    for text in texts:
+        chunk = json_codec.dumps({
+            "id": chat_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "delta": {"content": text}, "logprobs": None, "finish_reason": None}],
+            "system_fingerprint": None
+        })
+        b"data: " + chunk + b"\n\n"
+    return time.perf_counter() - start
+
+
+def bench_encoder(texts, chat_id, created, model) -> float:
+    start = time.perf_counter()
+    encoder = ChunkEncoder(chat_id, created, model)
+    for text in texts:
+        encoder.content(text)
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=100000, help="每轮编码的分块数")
+    parser.add_argument("--text-size", type=int, default=32, help="每个增量的文本长度（字符）")
+    parser.add_argument("--repeat", type=int, default=3, help="重复次数（取最优）")
+    args = parser.parse_args()
+
+    chat_id = f"chatcmpl-{uuid.uuid4()}"
+    created = int(time.time())
+    model = "gemini-2.5-flash"
+    texts = build_texts(args.chunks, args.text_size)
+
+    # 校验两种实现输出的 JSON 语义一致
+    encoder = ChunkEncoder(chat_id, created, model)
+    sample = encoder.content(texts[0])
+    assert sample.startswith(b"data: ") and sample.endswith(b"\n\n")
+    assert json.loads(sample[6:]) == json.loads(legacy_create_chunk(chat_id, created, model, {"content": texts[0]}, None))
+
+    cases = [
+        ("create_chunk + json.dumps", bench_legacy),
+        (f"create_chunk + {json_codec.BACKEND}", bench_codec_dict),
+        ("ChunkEncoder", bench_encoder),
+    ]
+    print(f"JSON 后端: {json_codec.BACKEND}, 分块数: {args.chunks}, 增量长度: {args.text_size} 字符")
+    baseline = None
+    for name, func in cases:
+        best = min(func(texts, chat_id, created, model) for _ in range(args.repeat))
+        rate = args.chunks / best
+        baseline = baseline or rate
+        print(f"{name:<28} {rate:>12,.0f} chunks/s  ({rate / baseline:>4.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
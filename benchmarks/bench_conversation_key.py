@@ -0,0 +1,100 @@
+"""
+对话指纹基准测试
+
+对比旧实现（[m.model_dump() for m in messages] 复制整个对话后取前3条计算 md5）与
+直接读取 Message 对象、逐条写入哈希的新实现，输出每次计算的耗时与内存峰值，
+并校验两者的 md5 结果一致。
+
+用法:
+    python benchmarks/bench_conversation_key.py
+    python benchmarks/bench_conversation_key.py --messages 500 --image-kb 512
+"""
+import argparse
+import base64
+import hashlib
+import os
+import sys
+import time
+import tracemalloc
+from typing import Any, Dict, List, Union
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pydantic import BaseModel  # noqa: E402
+
+from core.message import extract_text_from_content, get_conversation_key, xxhash  # noqa: E402
+
+
+class Message(BaseModel):
+    """与 main.Message 相同的结构"""
+    role: str
+    content: Union[str, List[Dict[str, Any]]]
+
+
+def legacy_conversation_key(messages: List[Message], client_identifier: str = "") -> str:
+    """旧实现（仅用于对比）"""
+    dumped = [m.model_dump() for m in messages]
+    message_fingerprints = []
+    for msg in dumped[:3]:
+        content = msg.get("content", "")
+        text = extract_text_from_content(content) if isinstance(content, list) else str(content)
+        message_fingerprints.append(f"{msg.get('role', '')}:{text.strip().lower()}")
+    conversation_prefix = "|".join(message_fingerprints)
+    if client_identifier:
+        conversation_prefix = f"{client_identifier}|{conversation_prefix}"
+    return hashlib.md5(conversation_prefix.encode()).hexdigest()
+
+
+def build_conversation(count: int, image_kb: int, image_every: int) -> List[Message]:
+    image = "data:image/png;base64," + base64.b64encode(os.urandom(image_kb * 1024)).decode()
+    messages = [Message(role="system", content="You are a helpful assistant.")]
+    for index in range(1, count):
+        role = "user" if index % 2 else "assistant"
+        text = f"第 {index} 条消息：" + "lorem ipsum " * 20
+        if role == "user" and index % image_every == 1:
+            content = [{"type": "text", "text": text}, {"type": "image_url", "image_url": {"url": image}}]
+            messages.append(Message(role=role, content=content))
+        else:
+            messages.append(Message(role=role, content=text))
+    return messages
+
+
+def measure(label: str, func, messages: List[Message], rounds: int) -> str:
+    key = func(messages)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        func(messages)
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    func(messages)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<10} | {elapsed / rounds * 1e6:>10.1f} µs/次 | 内存峰值 {peak / 1024:>10.1f} KB")
+    return key
+
+
+def bench(args) -> None:
+    messages = build_conversation(args.messages, args.image_kb, args.image_every)
+    images = sum(1 for m in messages if isinstance(m.content, list))
+    print(f"{len(messages)} 条消息，{images} 张 {args.image_kb}KB 内联图片")
+    legacy = measure("旧实现", lambda m: legacy_conversation_key(m, "127.0.0.1"), messages, args.rounds)
+    current = measure("md5", lambda m: get_conversation_key(m, "127.0.0.1"), messages, args.rounds)
+    assert legacy == current, "md5 指纹与旧实现不一致"
+    if xxhash is not None:
+        measure("xxh3", lambda m: get_conversation_key(m, "127.0.0.1", "xxh3"), messages, args.rounds)
+    else:
+        print("xxh3       | 未安装 xxhash，跳过")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=200, help="对话消息数")
+    parser.add_argument("--image-kb", type=int, default=256, help="每张内联图片大小（KB）")
+    parser.add_argument("--image-every", type=int, default=10, help="每隔多少条消息附带一张图片")
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+    bench(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+JWT 获取并发基准测试
+
+500 个并发请求同时向同一账户获取 JWT（getoxsrf 用固定延迟模拟），对比
+旧实现（每次调用都获取 asyncio.Lock）与无锁快速路径 + 共享刷新 Future 的 JWTManager：
+
+- 有效 token：每个请求连续调用多次 get（一次对话会多次获取 JWT），统计单次 get 的开销
+- 后台刷新进行中：token 仍然有效，但后台刷新器正在续签；旧实现中请求会被锁阻塞
+- 过期 token：所有请求同时触发刷新，两种实现都应只发起一次 getoxsrf
+
+用法:
+    python benchmarks/bench_jwt_get.py
+    python benchmarks/bench_jwt_get.py --concurrency 2000 --latency-ms 80
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.account import AccountConfig  # noqa: E402
+from core.jwt import JWTManager  # noqa: E402
+
+
+class BenchJWTManager(JWTManager):
+    """用固定延迟代替真实的 getoxsrf 请求"""
+
+    def __init__(self, latency: float) -> None:
+        config = AccountConfig(
+            account_id="bench", secure_c_ses="x", host_c_oses=None, csesidx="1", config_id="c"
+        )
+        super().__init__(config, None, "bench")
+        self.latency = latency
+        self.fetches = 0
+
+    async def _fetch(self, request_id: str = "") -> None:
+        self.fetches += 1
+        await asyncio.sleep(self.latency)
+        self.jwt = "token"
+        self.issued_at = time.time()
+        self.expires = self.issued_at + 270
+
+
+class LegacyJWTManager(BenchJWTManager):
+    """旧实现（仅用于对比）：每次调用都获取锁"""
+
+    def __init__(self, latency: float) -> None:
+        super().__init__(latency)
+        self._lock = asyncio.Lock()
+
+    async def get(self, request_id: str = "") -> str:
+        async with self._lock:
+            if time.time() > self.expires:
+                await self._refresh(request_id)
+            return self.jwt
+
+    async def refresh(self, request_id: str = "") -> None:
+        async with self._lock:
+            await self._refresh(request_id)
+
+
+async def gather_latencies(concurrency: int, call) -> list:
+    latencies = []
+
+    async def one() -> None:
+        start = time.perf_counter()
+        await call()
+        latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(one() for _ in range(concurrency)))
+    latencies.sort()
+    return latencies
+
+
+def p99(latencies: list) -> float:
+    return latencies[max(0, int(len(latencies) * 0.99) - 1)] * 1000
+
+
+async def bench_valid(manager: BenchJWTManager, concurrency: int, calls_per_request: int) -> str:
+    await manager.get()
+
+    async def request() -> None:
+        for _ in range(calls_per_request):
+            await manager.get()
+
+    start = time.perf_counter()
+    await gather_latencies(concurrency, request)
+    elapsed = time.perf_counter() - start
+    return f"{elapsed * 1e9 / (concurrency * calls_per_request):>7.0f} ns/次"
+
+
+async def bench_refreshing(manager: BenchJWTManager, concurrency: int) -> str:
+    await manager.get()
+    refresh = asyncio.ensure_future(manager.refresh())
+    await asyncio.sleep(0)  # 让后台刷新先开始
+    latencies = await gather_latencies(concurrency, manager.get)
+    await refresh
+    return f"p99 {p99(latencies):>7.2f} ms"
+
+
+async def bench_expired(manager: BenchJWTManager, concurrency: int) -> str:
+    await manager.get()
+    manager.fetches = 0
+    manager.expires = 0
+    latencies = await gather_latencies(concurrency, manager.get)
+    return f"p99 {p99(latencies):>7.2f} ms getoxsrf {manager.fetches}"
+
+
+async def bench(concurrency: int, latency: float, calls_per_request: int) -> None:
+    scenarios = [
+        ("有效 token", lambda m: bench_valid(m, concurrency, calls_per_request)),
+        ("后台刷新进行中", lambda m: bench_refreshing(m, concurrency)),
+        ("过期 token", lambda m: bench_expired(m, concurrency)),
+    ]
+    print(f"{concurrency} 并发，getoxsrf 延迟 {latency * 1000:.0f} ms")
+    for label, scenario in scenarios:
+        legacy = await scenario(LegacyJWTManager(latency))
+        current = await scenario(BenchJWTManager(latency))
+        print(f"{label:<8} | 旧实现 {legacy:<28} | 无锁 {current}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=500, help="并发请求数")
+    parser.add_argument("--latency-ms", type=float, default=50, help="模拟的 getoxsrf 延迟（毫秒）")
+    parser.add_argument("--calls", type=int, default=5, help="每个请求调用 get 的次数")
+    args = parser.parse_args()
+    asyncio.run(bench(args.concurrency, args.latency_ms / 1000, args.calls))
+
+
+if __name__ == "__main__":
+    main()
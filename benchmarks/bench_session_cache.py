@@ -0,0 +1,94 @@
+"""
+会话缓存基准测试
+
+模拟聊天请求对会话缓存的读写（新对话写入、继续对话读取并刷新时间），对比旧实现
+（dict + 超限时按 updated_at 全量排序淘汰）与 LRU + 时间轮的 SessionCache。
+旧实现的排序会分摊到多次写入上，吞吐相近，差异主要体现在单次操作的最坏延迟：
+超限时那一次写入需要排序整个缓存，期间事件循环被阻塞。
+
+用法:
+    python benchmarks/bench_session_cache.py
+    python benchmarks/bench_session_cache.py --capacity 100000 --ops 500000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.session_cache import SessionCache  # noqa: E402
+
+
+class LegacySessionCache:
+    """旧实现（仅用于对比）"""
+
+    def __init__(self, ttl_seconds: int, capacity: int) -> None:
+        self.ttl = ttl_seconds
+        self.capacity = capacity
+        self.entries = {}
+
+    def _ensure_size(self) -> None:
+        if len(self.entries) > self.capacity:
+            sorted_items = sorted(self.entries.items(), key=lambda x: x[1]["updated_at"])
+            remove_count = len(sorted_items) - int(self.capacity * 0.8)
+            for key, _ in sorted_items[:remove_count]:
+                del self.entries[key]
+
+    def get(self, key: str):
+        return self.entries.get(key)
+
+    def set(self, key: str, account_id: str, session_id: str) -> None:
+        self.entries[key] = {"account_id": account_id, "session_id": session_id, "updated_at": time.time()}
+        self._ensure_size()
+
+    def touch(self, key: str) -> None:
+        if key in self.entries:
+            self.entries[key]["updated_at"] = time.time()
+
+
+def run(cache, ops: int, key_space: int, seed: int = 0):
+    """返回 (每秒操作数, 单次操作最坏延迟秒数)"""
+    rng = random.Random(seed)
+    keys = [f"conv_{i}" for i in range(key_space)]
+    perf_counter = time.perf_counter
+    worst = 0.0
+    start = perf_counter()
+    for _ in range(ops):
+        key = keys[rng.randrange(key_space)]
+        op_start = perf_counter()
+        if cache.get(key) is None:
+            cache.set(key, "acc", "sess")
+        else:
+            cache.touch(key)
+        worst = max(worst, perf_counter() - op_start)
+    return ops / (perf_counter() - start), worst
+
+
+def bench(capacity: int, ops: int) -> None:
+    # 对话数量为容量的 2 倍，保证持续触发淘汰
+    key_space = capacity * 2
+    legacy_rate, legacy_worst = run(LegacySessionCache(3600, capacity), ops, key_space)
+    cache = SessionCache(3600, capacity)
+    cache_rate, cache_worst = run(cache, ops, key_space)
+    metrics = cache.get_metrics()
+    print(
+        f"容量 {capacity:>8} | 旧实现 {legacy_rate:>10,.0f} 次/秒 最坏 {legacy_worst * 1000:>8.2f} ms | "
+        f"SessionCache {cache_rate:>10,.0f} 次/秒 最坏 {cache_worst * 1000:>6.2f} ms | "
+        f"命中率 {metrics['hit_rate']:.2%}"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--capacity", type=int, action="append", help="缓存容量（可重复，默认 1000/10000/100000）")
+    parser.add_argument("--ops", type=int, default=200000, help="读写操作次数")
+    args = parser.parse_args()
+
+    for capacity in args.capacity or [1000, 10000, 100000]:
+        bench(capacity, args.ops)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+JSON 数组流解析器基准测试
+
+对比逐字符解析的旧实现与按字节扫描的 JsonArrayStreamParser。
+默认使用合成的 widgetStreamAssist 响应（10 KB ~ 10 MB），
+也可以通过 --payload 传入录制下来的原始响应体文件。
+
+用法:
+    python benchmarks/bench_streaming_parser.py
+    python benchmarks/bench_streaming_parser.py --payload recorded.json --chunk-size 4096
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from util.streaming_parser import parse_json_array_stream  # noqa: E402
+
+SIZES = [10 * 1024, 100 * 1024, 1024 * 1024, 10 * 1024 * 1024]
+
+
+def legacy_parse(lines):
+    """旧实现：逐行、逐字符地拼接缓冲区后再 json.loads（仅用于对比）"""
+    buffer = []
+    brace_level = 0
+    in_string = False
+    escape_next = False
+    started = False
+    for line in lines:
+        if not started:
+            stripped = line.strip()
+            if not stripped.startswith("["):
+                continue
+            started = True
+            line = stripped[1:]
+        for char in line:
+            if escape_next:
+                if brace_level > 0:
+                    buffer.append(char)
+                escape_next = False
+                continue
+            if char == "\\":
+                if brace_level > 0:
+                    buffer.append(char)
+                escape_next = True
+                continue
+            if char == '"' and brace_level > 0:
+                in_string = not in_string
+                buffer.append(char)
+                continue
+            if not in_string:
+                if char == "{":
+                    if brace_level == 0:
+                        buffer = []
+                    brace_level += 1
+                if brace_level > 0:
+                    buffer.append(char)
+                if char == "}":
+                    brace_level -= 1
+                    if brace_level == 0 and buffer:
+                        yield json.loads("".join(buffer), strict=False)
+                        buffer = []
+                        in_string = False
+            elif brace_level > 0:
+                buffer.append(char)
+
+
+def build_payload(target_size: int) -> bytes:
+    """合成一个与 widgetStreamAssist 结构相同的、格式化的 JSON 数组"""
+    sentence = "Gemini 正在思考这个问题，并给出 \"带引号\" 与 {括号} 的回答。\\n"
+    objects = []
+    size = 2
+    index = 0
+    while size < target_size:
+        obj = {
+            "streamAssistResponse": {
+                "answer": {
+                    "state": "IN_PROGRESS",
+                    "replies": [{
+                        "groundedContent": {
+                            "content": {"role": "model", "text": sentence * (1 + index % 8)}
+                        }
+                    }]
+                },
+                "sessionInfo": {"session": "projects/123/locations/global/sessions/456"}
+            }
+        }
+        text = json.dumps(obj, ensure_ascii=False, indent=2)
+        objects.append(text)
+        size += len(text.encode("utf-8")) + 2
+        index += 1
+    return ("[" + ",\n".join(objects) + "]").encode("utf-8")
+
+
+def split_chunks(payload: bytes, chunk_size: int) -> list:
+    return [payload[i:i + chunk_size] for i in range(0, len(payload), chunk_size)]
+
+
+def run_once(name: str, func, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        count = sum(1 for _ in func())
+        best = min(best, time.perf_counter() - start)
+    return best, count
+
+
+def bench(payload: bytes, chunk_size: int, repeat: int) -> None:
+    lines = payload.decode("utf-8").splitlines()
+    chunks = split_chunks(payload, chunk_size)
+
+    legacy_time, legacy_count = run_once("legacy", lambda: legacy_parse(lines), repeat)
+    new_time, new_count = run_once("bytes", lambda: parse_json_array_stream(chunks), repeat)
+    assert legacy_count == new_count, "两种实现解析出的对象数量不一致"
+
+    size_mb = len(payload) / 1024 / 1024
+    print(
+        f"{len(payload) / 1024:>10.0f} KB | {new_count:>6} 对象 | "
+        f"旧实现 {legacy_time * 1000:>9.2f} ms ({size_mb / legacy_time:>7.1f} MB/s) | "
+        f"新实现 {new_time * 1000:>9.2f} ms ({size_mb / new_time:>7.1f} MB/s) | "
+        f"加速 {legacy_time / new_time:>5.1f}x"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--payload", action="append", help="录制的 widgetStreamAssist 响应体文件（可重复）")
+    parser.add_argument("--chunk-size", type=int, default=16 * 1024, help="模拟 aiter_bytes 的块大小")
+    parser.add_argument("--repeat", type=int, default=3, help="每个用例重复次数（取最优）")
+    args = parser.parse_args()
+
+    if args.payload:
+        payloads = []
+        for path in args.payload:
+            with open(path, "rb") as f:
+                payloads.append(f.read())
+    else:
+        payloads = [build_payload(size) for size in SIZES]
+
+    print(f"块大小: {args.chunk_size} 字节, 重复: {args.repeat}")
+    for payload in payloads:
+        bench(payload, args.chunk_size, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
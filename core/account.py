@@ -7,17 +7,23 @@ import json
 import logging
 import os
 import time
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from datetime import datetime, timedelta, timezone
-from typing import Dict, List, Optional, TYPE_CHECKING
+from typing import AsyncContextManager, Collection, Dict, List, Optional, TYPE_CHECKING
 
 from fastapi import HTTPException
 
 # 导入存储层（支持数据库）
 from core import storage
+from core.account_pool import AccountPool
+from core.concurrency import AccountConcurrency, ConcurrencyPolicy
+from core.config import config
+from core.session_cache import SessionCache
+from core.session_lock import SessionLockRegistry
 
 if TYPE_CHECKING:
     from core.jwt import JWTManager
+    from core.shared_state import AccountStateSync
 
 logger = logging.getLogger(__name__)
 
@@ -28,7 +34,21 @@ else:
     ACCOUNTS_FILE = "data/accounts.json"  # 本地存储（统一到 data 目录）
 
 
-@dataclass
+BEIJING_TZ = timezone(timedelta(hours=8))
+EXPIRES_AT_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def parse_expires_at(expires_at: Optional[str]) -> Optional[float]:
+    """解析账户过期时间（北京时间字符串）为 epoch 秒，未设置或格式错误返回 None"""
+    if not expires_at:
+        return None
+    try:
+        return datetime.strptime(expires_at, EXPIRES_AT_FORMAT).replace(tzinfo=BEIJING_TZ).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+@dataclass(slots=True)
 class AccountConfig:
     """单个账户配置"""
     account_id: str
@@ -44,32 +64,27 @@ class AccountConfig:
     mail_client_id: Optional[str] = None
     mail_refresh_token: Optional[str] = None
     mail_tenant: Optional[str] = None
+    # expires_at 解析后的 epoch 秒（修改 expires_at 时自动重新计算）
+    expires_ts: Optional[float] = field(default=None, init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        self.expires_ts = parse_expires_at(self.expires_at)
+
+    def __setattr__(self, name: str, value) -> None:
+        object.__setattr__(self, name, value)
+        if name == "expires_at":
+            object.__setattr__(self, "expires_ts", parse_expires_at(value))
 
     def get_remaining_hours(self) -> Optional[float]:
         """计算账户剩余小时数"""
-        if not self.expires_at:
-            return None
-        try:
-            # 解析过期时间（假设为北京时间）
-            beijing_tz = timezone(timedelta(hours=8))
-            expire_time = datetime.strptime(self.expires_at, "%Y-%m-%d %H:%M:%S")
-            expire_time = expire_time.replace(tzinfo=beijing_tz)
-
-            # 当前时间（北京时间）
-            now = datetime.now(beijing_tz)
-
-            # 计算剩余时间
-            remaining = (expire_time - now).total_seconds() / 3600
-            return remaining
-        except Exception:
+        if self.expires_ts is None:
             return None
+        return (self.expires_ts - time.time()) / 3600
 
     def is_expired(self) -> bool:
         """检查账户是否已过期"""
-        remaining = self.get_remaining_hours()
-        if remaining is None:
-            return False  # 未设置过期时间，默认不过期
-        return remaining <= 0
+        # 未设置过期时间，默认不过期
+        return self.expires_ts is not None and self.expires_ts <= time.time()
 
 
 def format_account_expiration(remaining_hours: Optional[float]) -> tuple:
@@ -93,6 +108,15 @@ def format_account_expiration(remaining_hours: Optional[float]) -> tuple:
         return ("正常", "#4caf50", f"{remaining_hours:.1f} 小时")
 
 
+# 所有账户共享的并发控制配置
+CONCURRENCY_POLICY = ConcurrencyPolicy(
+    enabled=lambda: config.performance.account_concurrency_enabled,
+    initial_limit=lambda: config.performance.account_concurrency_initial,
+    max_limit=lambda: config.performance.account_concurrency_max,
+    queue_timeout_seconds=lambda: config.performance.account_queue_timeout_seconds,
+)
+
+
 class AccountManager:
     """单个账户管理器"""
     def __init__(self, config: AccountConfig, http_client, user_agent: str, account_failure_threshold: int, rate_limit_cooldown_seconds: int):
@@ -102,11 +126,73 @@ class AccountManager:
         self.account_failure_threshold = account_failure_threshold
         self.rate_limit_cooldown_seconds = rate_limit_cooldown_seconds
         self.jwt_manager: Optional['JWTManager'] = None  # 延迟初始化
-        self.is_available = True
+        self._pool: Optional[AccountPool] = None  # 所属的可用账户索引（状态变化时通知）
+        self._state_sync: Optional["AccountStateSync"] = None  # 多 worker 状态同步（状态变化时通知）
+        self.state_updated_at = 0.0  # 健康状态最近一次变化的时间
+        self._is_available = True
         self.last_error_time = 0.0
-        self.last_429_time = 0.0  # 429错误专属时间戳
-        self.error_count = 0
+        self._last_429_time = 0.0  # 429错误专属时间戳
+        self._error_count = 0
         self.conversation_count = 0  # 累计对话次数
+        self.concurrency = AccountConcurrency(CONCURRENCY_POLICY, config.account_id)  # 在途请求数与自适应并发上限
+
+    # 影响账户选择的状态字段：变化时同步更新可用账户索引
+    @property
+    def is_available(self) -> bool:
+        return self._is_available
+
+    @is_available.setter
+    def is_available(self, value: bool) -> None:
+        if value != self._is_available:
+            self._is_available = value
+            self._state_changed()
+
+    @property
+    def error_count(self) -> int:
+        return self._error_count
+
+    @error_count.setter
+    def error_count(self, value: int) -> None:
+        if value != self._error_count:
+            self._error_count = value
+            self._state_changed()
+
+    @property
+    def last_429_time(self) -> float:
+        return self._last_429_time
+
+    @last_429_time.setter
+    def last_429_time(self, value: float) -> None:
+        if value != self._last_429_time:
+            self._last_429_time = value
+            self._state_changed()
+
+    def _state_changed(self) -> None:
+        self.state_updated_at = time.time()
+        if self._pool is not None:
+            self._pool.update(self)
+        if self._state_sync is not None:
+            self._state_sync.mark_dirty(self.config.account_id)
+
+    def apply_shared_state(self, is_available: bool, error_count: int, last_429_time: float,
+                           last_error_time: float, updated_at: float) -> bool:
+        """应用其他 worker 同步过来的健康状态（不再回推），返回是否生效"""
+        if updated_at <= self.state_updated_at:
+            return False
+        self.state_updated_at = updated_at
+        self._is_available = is_available
+        self._error_count = error_count
+        self._last_429_time = last_429_time
+        self.last_error_time = last_error_time
+        if self._pool is not None:
+            self._pool.update(self)
+        return True
+
+    def record_conversation(self) -> None:
+        """对话成功后累加对话次数"""
+        self.conversation_count += 1
+        if self._state_sync is not None:
+            self._state_sync.add_conversation(self.config.account_id)
 
     async def get_jwt(self, request_id: str = "") -> str:
         """获取 JWT token (带错误处理)"""
@@ -117,26 +203,35 @@ class AccountManager:
             raise HTTPException(403, f"Account {self.config.account_id} has expired")
 
         try:
-            if self.jwt_manager is None:
-                # 延迟初始化 JWTManager (避免循环依赖)
-                from core.jwt import JWTManager
-                self.jwt_manager = JWTManager(self.config, self.http_client, self.user_agent)
-            jwt = await self.jwt_manager.get(request_id)
-            self.is_available = True
-            self.error_count = 0
+            jwt = await self.get_jwt_manager().get(request_id)
+            self.record_jwt_success()
             return jwt
         except Exception as e:
-            self.last_error_time = time.time()
-            self.error_count += 1
-            # 使用配置的失败阈值
-            if self.error_count >= self.account_failure_threshold:
-                self.is_available = False
-                logger.error(f"[ACCOUNT] [{self.config.account_id}] JWT获取连续失败{self.error_count}次，账户已永久禁用")
-            else:
-                # 安全：只记录异常类型，不记录详细信息
-                logger.warning(f"[ACCOUNT] [{self.config.account_id}] JWT获取失败({self.error_count}/{self.account_failure_threshold}): {type(e).__name__}")
+            self.record_jwt_failure(e)
             raise
 
+    def get_jwt_manager(self) -> "JWTManager":
+        if self.jwt_manager is None:
+            # 延迟初始化 JWTManager (避免循环依赖)
+            from core.jwt import JWTManager
+            self.jwt_manager = JWTManager(self.config, self.http_client, self.user_agent)
+        return self.jwt_manager
+
+    def record_jwt_success(self) -> None:
+        self.is_available = True
+        self.error_count = 0
+
+    def record_jwt_failure(self, error: Exception) -> None:
+        self.last_error_time = time.time()
+        self.error_count += 1
+        # 使用配置的失败阈值
+        if self.error_count >= self.account_failure_threshold:
+            self.is_available = False
+            logger.error(f"[ACCOUNT] [{self.config.account_id}] JWT获取连续失败{self.error_count}次，账户已永久禁用")
+        else:
+            # 安全：只记录异常类型，不记录详细信息
+            logger.warning(f"[ACCOUNT] [{self.config.account_id}] JWT获取失败({self.error_count}/{self.account_failure_threshold}): {type(error).__name__}")
+
     def should_retry(self) -> bool:
         """检查账户是否可重试（429错误冷却期后自动恢复，普通错误永久禁用）"""
         if self.is_available:
@@ -186,90 +281,71 @@ class AccountManager:
 
 class MultiAccountManager:
     """多账户协调器"""
-    def __init__(self, session_cache_ttl_seconds: int):
+    def __init__(self, session_cache_ttl_seconds: int, session_cache_max_size: Optional[int] = None):
         self.accounts: Dict[str, AccountManager] = {}
-        self.account_list: List[str] = []  # 账户ID列表 (用于轮询)
-        self.current_index = 0
-        self._cache_lock = asyncio.Lock()  # 缓存操作专用锁
-        self._index_lock = asyncio.Lock()  # 索引更新专用锁
+        self.account_list: List[str] = []  # 账户ID列表
+        self.pool = AccountPool()  # 可用账户索引（按健康度分桶，用于智能选择）
         # 全局会话缓存：{conv_key: {"account_id": str, "session_id": str, "updated_at": float}}
-        self.global_session_cache: Dict[str, dict] = {}
-        self.cache_max_size = 1000  # 最大缓存条目数
-        self.cache_ttl = session_cache_ttl_seconds  # 缓存过期时间（秒）
-        # Session级别锁：防止同一对话的并发请求冲突
-        self._session_locks: Dict[str, asyncio.Lock] = {}
-        self._session_locks_lock = asyncio.Lock()  # 保护锁字典的锁
-        self._session_locks_max_size = 2000  # 最大锁数量
-
-    def _clean_expired_cache(self):
-        """清理过期的缓存条目"""
-        current_time = time.time()
-        expired_keys = [
-            key for key, value in self.global_session_cache.items()
-            if current_time - value["updated_at"] > self.cache_ttl
-        ]
-        for key in expired_keys:
-            del self.global_session_cache[key]
-        if expired_keys:
-            logger.info(f"[CACHE] 清理 {len(expired_keys)} 个过期会话缓存")
-
-    def _ensure_cache_size(self):
-        """确保缓存不超过最大大小（LRU策略）"""
-        if len(self.global_session_cache) > self.cache_max_size:
-            # 按更新时间排序，删除最旧的20%
-            sorted_items = sorted(
-                self.global_session_cache.items(),
-                key=lambda x: x[1]["updated_at"]
-            )
-            remove_count = len(sorted_items) - int(self.cache_max_size * 0.8)
-            for key, _ in sorted_items[:remove_count]:
-                del self.global_session_cache[key]
-            logger.info(f"[CACHE] LRU清理 {remove_count} 个最旧会话缓存")
+        # LRU + 时间轮 TTL，读写均为 O(1)
+        if session_cache_max_size is None:
+            session_cache_max_size = config.performance.session_cache_max_size
+        self.global_session_cache = SessionCache(session_cache_ttl_seconds, session_cache_max_size)
+        # Session级别锁：防止同一对话的并发请求冲突（引用计数，最后一个持有者退出时释放）
+        self.session_locks = SessionLockRegistry()
+        self.state_sync: Optional["AccountStateSync"] = None  # 多 worker 账户状态同步
+
+    @property
+    def cache_ttl(self) -> int:
+        """缓存过期时间（秒）"""
+        return self.global_session_cache.ttl
+
+    @cache_ttl.setter
+    def cache_ttl(self, value: int) -> None:
+        self.global_session_cache.ttl = value
 
     async def start_background_cleanup(self):
-        """启动后台缓存清理任务（每5分钟执行一次）"""
+        """启动后台缓存清理任务（每分钟推进一次时间轮）"""
         try:
             while True:
-                await asyncio.sleep(300)  # 5分钟
-                async with self._cache_lock:
-                    self._clean_expired_cache()
-                    self._ensure_cache_size()
+                await asyncio.sleep(60)
+                self.global_session_cache.expire()
         except asyncio.CancelledError:
             logger.info("[CACHE] 后台清理任务已停止")
         except Exception as e:
             logger.error(f"[CACHE] 后台清理任务异常: {e}")
 
     async def set_session_cache(self, conv_key: str, account_id: str, session_id: str):
-        """线程安全地设置会话缓存"""
-        async with self._cache_lock:
-            self.global_session_cache[conv_key] = {
-                "account_id": account_id,
-                "session_id": session_id,
-                "updated_at": time.time()
-            }
-            # 检查缓存大小
-            self._ensure_cache_size()
+        """设置会话缓存（超出容量时淘汰最久未使用的条目）"""
+        self.global_session_cache.set(conv_key, account_id, session_id)
+
+    async def get_session_cache(self, conv_key: str) -> Optional[dict]:
+        """查询对话绑定：先查内存缓存，未命中时回源持久化后端"""
+        cached = self.global_session_cache.get(conv_key)
+        if cached is not None:
+            return cached
+        store = self.global_session_cache.store
+        if store is None or not store.persistent:
+            return None
+        entry = await store.lookup(conv_key)
+        if entry is None or entry["account_id"] not in self.accounts:
+            return None
+        return self.global_session_cache.restore(conv_key, entry["account_id"], entry["session_id"], entry["updated_at"])
 
     async def update_session_time(self, conv_key: str):
-        """线程安全地更新会话时间戳"""
-        async with self._cache_lock:
-            if conv_key in self.global_session_cache:
-                self.global_session_cache[conv_key]["updated_at"] = time.time()
-
-    async def acquire_session_lock(self, conv_key: str) -> asyncio.Lock:
-        """获取指定对话的锁（用于防止同一对话的并发请求冲突）"""
-        async with self._session_locks_lock:
-            # 清理过多的锁（LRU策略：删除不在缓存中的锁）
-            if len(self._session_locks) > self._session_locks_max_size:
-                # 只保留当前缓存中存在的锁
-                valid_keys = set(self.global_session_cache.keys())
-                keys_to_remove = [k for k in self._session_locks if k not in valid_keys]
-                for k in keys_to_remove[:len(keys_to_remove)//2]:  # 删除一半无效锁
-                    del self._session_locks[k]
-
-            if conv_key not in self._session_locks:
-                self._session_locks[conv_key] = asyncio.Lock()
-            return self._session_locks[conv_key]
+        """刷新会话的最近使用时间"""
+        self.global_session_cache.touch(conv_key)
+
+    def session_lock(self, conv_key: str) -> AsyncContextManager[None]:
+        """持有指定对话的锁（用于防止同一对话的并发请求冲突）"""
+        return self.session_locks.hold(conv_key)
+
+    def attach_state_sync(self, state_sync: Optional["AccountStateSync"]) -> None:
+        """挂接多 worker 状态同步器（账户重载后由新管理器继承）"""
+        self.state_sync = state_sync
+        for account_mgr in self.accounts.values():
+            account_mgr._state_sync = state_sync
+        if state_sync is not None:
+            state_sync.resync()
 
     def update_http_client(self, http_client):
         """更新所有账户使用的 http_client（用于代理变更后重建客户端）"""
@@ -284,12 +360,17 @@ class MultiAccountManager:
         # 从统计数据加载对话次数
         if "account_conversations" in global_stats:
             manager.conversation_count = global_stats["account_conversations"].get(config.account_id, 0)
+        manager._state_sync = self.state_sync
         self.accounts[config.account_id] = manager
         self.account_list.append(config.account_id)
+        self.pool.add(manager)
         logger.info(f"[MULTI] [ACCOUNT] 添加账户: {config.account_id}")
 
-    async def get_account(self, account_id: Optional[str] = None, request_id: str = "") -> AccountManager:
-        """获取账户 (智能选择或指定) - 优先选择健康账户，提升响应速度"""
+    async def get_account(self, account_id: Optional[str] = None, request_id: str = "", exclude: Collection[str] = ()) -> AccountManager:
+        """获取账户 (智能选择或指定) - 优先选择健康账户，提升响应速度
+
+        exclude: 智能选择时跳过的账户ID（如对冲请求需要选择与主请求不同的账户）
+        """
         req_tag = f"[req_{request_id}] " if request_id else ""
 
         # 如果指定了账户ID（无需锁）
@@ -299,42 +380,54 @@ class MultiAccountManager:
             account = self.accounts[account_id]
             if not account.should_retry():
                 raise HTTPException(503, f"Account {account_id} temporarily unavailable")
+            # 与智能选择一样预占名额：之后的 acquire 兑现的是本请求自己的预占
+            account.concurrency.reserve()
             return account
 
-        # 智能选择可用账户（优先健康账户，提升响应速度）
-        available_accounts = []
-        for acc_id in self.account_list:
-            account = self.accounts[acc_id]
-            # 检查账户是否可用（会自动恢复429冷却期后的账户）
-            if (account.should_retry() and
-                not account.config.is_expired() and
-                not account.config.disabled):
-                # 计算账户健康度（error_count越低越健康）
-                health_score = -account.error_count  # 负数，越大越健康
-                available_accounts.append((acc_id, health_score))
-
-        if not available_accounts:
+        # 智能选择可用账户：在健康度最高的前50%账户中轮询（索引增量维护，无需遍历）
+        account = self.pool.select(exclude)
+        if account is None:
             raise HTTPException(503, "No available accounts")
+        if not account.concurrency.has_capacity:
+            account = await self._wait_for_capacity(account, exclude, req_tag)
+        account.concurrency.reserve()
+        account_id = account.config.account_id
 
-        # 按健康度排序（优先选择error_count最低的账户）
-        available_accounts.sort(key=lambda x: x[1], reverse=True)
-
-        # 只在更新索引时加锁（最小化锁持有时间）
-        async with self._index_lock:
-            if not hasattr(self, '_available_index'):
-                self._available_index = 0
-
-            # 在健康账户中轮询（只在前50%健康账户中选择）
-            healthy_count = max(1, len(available_accounts) // 2)
-            healthy_accounts = [acc_id for acc_id, _ in available_accounts[:healthy_count]]
-
-            account_id = healthy_accounts[self._available_index % len(healthy_accounts)]
-            self._available_index = (self._available_index + 1) % len(healthy_accounts)
-
-        account = self.accounts[account_id]
         logger.info(f"[MULTI] [ACCOUNT] {req_tag}选择账户: {account_id} (健康度: {account.error_count}错误)")
         return account
 
+    async def _wait_for_capacity(self, account: AccountManager, exclude: Collection[str], req_tag: str) -> AccountManager:
+        """所有可用账户都已满载：排队等待任意账户空出名额
+
+        超时后返回 503，而不是在已满载的账户上超额发送（触发 429 会让账户进入冷却，进一步减少可用容量）
+        """
+        policy = account.concurrency.policy
+        policy.queued += 1
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + policy.queue_timeout_seconds()
+        logger.info(f"[MULTI] [ACCOUNT] {req_tag}所有账户并发已满，排队等待")
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                policy.queue_timeouts += 1
+                raise HTTPException(503, "All accounts are at their concurrency limit")
+            freed_id = await policy.wait_for_release(remaining)
+            # 优先使用刚释放名额的账户（select 只检查有限个账户，可能看不到它）
+            freed = self.accounts.get(freed_id) if freed_id else None
+            if (
+                freed is not None
+                and freed_id not in exclude
+                and freed.concurrency.has_capacity
+                and self.pool.is_selectable(freed_id)
+            ):
+                return freed
+            candidate = self.pool.select(exclude)
+            if candidate is None:
+                raise HTTPException(503, "No available accounts")
+            account = candidate
+            if account.concurrency.has_capacity:
+                return account
+
 
 # ---------- 配置文件管理 ----------
 
@@ -471,6 +564,11 @@ def load_multi_account_config(
     return manager
 
 
+def session_identity(config: AccountConfig) -> tuple:
+    """决定 Google Session 是否仍然有效的账户字段"""
+    return (config.secure_c_ses, config.host_c_oses, config.csesidx, config.config_id)
+
+
 def reload_accounts(
     multi_account_mgr: MultiAccountManager,
     http_client,
@@ -489,11 +587,13 @@ def reload_accounts(
             "last_error_time": account_mgr.last_error_time,
             "last_429_time": account_mgr.last_429_time,
             "error_count": account_mgr.error_count,
-            "conversation_count": account_mgr.conversation_count
+            "conversation_count": account_mgr.conversation_count,
+            "state_updated_at": account_mgr.state_updated_at,
+            "jwt_manager": account_mgr.jwt_manager,
+            "concurrency": account_mgr.concurrency
         }
 
-    # 清空会话缓存并重新加载配置
-    multi_account_mgr.global_session_cache.clear()
+    # 重新加载配置
     new_mgr = load_multi_account_config(
         http_client,
         user_agent,
@@ -502,6 +602,21 @@ def reload_accounts(
         session_cache_ttl_seconds,
         global_stats
     )
+    # 沿用旧的对话锁注册表，重载前已在处理中的对话仍与新请求互斥
+    new_mgr.session_locks = multi_account_mgr.session_locks
+
+    # 沿用会话缓存，只失效被删除或凭据变化的账户的绑定
+    changed_accounts = [
+        account_id for account_id, account_mgr in multi_account_mgr.accounts.items()
+        if account_id not in new_mgr.accounts
+        or session_identity(new_mgr.accounts[account_id].config) != session_identity(account_mgr.config)
+    ]
+    session_cache = multi_account_mgr.global_session_cache
+    session_cache.ttl = session_cache_ttl_seconds
+    new_mgr.global_session_cache = session_cache
+    if changed_accounts:
+        removed = session_cache.remove_accounts(changed_accounts)
+        logger.info(f"[CACHE] {len(changed_accounts)} 个账户已删除或凭据变化，清理 {removed} 个会话缓存")
 
     # 恢复现有账户的运行时状态
     for account_id, state in old_states.items():
@@ -512,8 +627,20 @@ def reload_accounts(
             account_mgr.last_429_time = state["last_429_time"]
             account_mgr.error_count = state["error_count"]
             account_mgr.conversation_count = state["conversation_count"]
+            account_mgr.state_updated_at = state["state_updated_at"]
+            # 凭据未变化时沿用已签发的 JWT，避免重载后所有账户都要重新获取
+            jwt_manager = state["jwt_manager"]
+            if jwt_manager is not None and account_id not in changed_accounts:
+                jwt_manager.config = account_mgr.config
+                jwt_manager.http_client = account_mgr.http_client
+                account_mgr.jwt_manager = jwt_manager
+            # 在途请求仍在旧对象上计数，沿用以保证释放后计数正确
+            account_mgr.concurrency = state["concurrency"]
             logger.debug(f"[CONFIG] 账户 {account_id} 运行时状态已恢复")
 
+    # 状态恢复完成后再挂接同步器，避免把恢复操作当作本地变更推送
+    new_mgr.attach_state_sync(multi_account_mgr.state_sync)
+
     logger.info(f"[CONFIG] 配置已重载，当前账户数: {len(new_mgr.accounts)}")
     return new_mgr
 
@@ -593,6 +720,7 @@ def update_account_disabled_status(
 
     account_mgr = multi_account_mgr.accounts[account_id]
     account_mgr.config.disabled = disabled
+    multi_account_mgr.pool.refresh_config(account_mgr)
 
     # 保存到文件
     accounts_data = load_accounts_from_source()
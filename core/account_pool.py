@@ -0,0 +1,234 @@
+"""可用账户索引
+
+MultiAccountManager.get_account 过去每次都遍历全部账户、逐个解析过期时间并按健康度排序。
+AccountPool 把"当前可被选中"的账户按 error_count 分桶维护，账户状态变化时增量更新：
+
+- 选择：在健康度最高的前 50% 账户中轮询，复杂度 O(桶数)，桶数不超过失败阈值；
+  开启并发控制时比较轮询位置起的少量账户，选择负载最低的，都已满载时只轮流检查有限个其他账户
+  （见 core/concurrency.py）
+- 429 冷却与账户过期：放入按到期时间排序的小根堆，选择时惰性处理已到期的条目
+- 更新：AccountManager 的状态字段变化时通知索引，O(1) 移动所在桶
+"""
+import heapq
+import time
+from bisect import insort
+from typing import TYPE_CHECKING, Collection, Dict, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from core.account import AccountManager
+
+
+class AccountPool:
+    """按健康度分桶的可用账户索引（仅在事件循环线程内使用，无需加锁）"""
+
+    LOAD_SCAN_SIZE = 8  # 负载感知选择时从轮询位置开始比较的健康账户数
+    OVERFLOW_SCAN_SIZE = 32  # 这些账户都已满载时，继续向后查找空位的最大账户数
+
+    def __init__(self) -> None:
+        self._accounts: Dict[str, "AccountManager"] = {}
+        # error_count -> 账户ID列表；_positions 记录账户所在的桶与下标，便于 O(1) 交换删除
+        self._buckets: Dict[int, List[str]] = {}
+        self._bucket_keys: List[int] = []  # 非空桶的 error_count（升序）
+        self._positions: Dict[str, Tuple[int, int]] = {}
+        # 到期时间堆：(到期时间戳, 账户ID)，条目可能已失效，出堆时再校验
+        self._cooldowns: List[Tuple[float, str]] = []
+        self._expiries: List[Tuple[float, str]] = []
+        self._expire_at: Dict[str, Optional[float]] = {}
+        self._cursor = 0
+        self._overflow_cursor = 0
+
+    def __len__(self) -> int:
+        """当前可选账户数"""
+        return len(self._positions)
+
+    # ---------- 桶操作 ----------
+
+    def _insert(self, account_id: str, error_count: int) -> None:
+        bucket = self._buckets.get(error_count)
+        if bucket is None:
+            bucket = self._buckets[error_count] = []
+            insort(self._bucket_keys, error_count)
+        self._positions[account_id] = (error_count, len(bucket))
+        bucket.append(account_id)
+
+    def _discard(self, account_id: str) -> None:
+        position = self._positions.pop(account_id, None)
+        if position is None:
+            return
+        error_count, index = position
+        bucket = self._buckets[error_count]
+        last = bucket.pop()
+        if last != account_id:
+            bucket[index] = last
+            self._positions[last] = (error_count, index)
+        if not bucket:
+            del self._buckets[error_count]
+            self._bucket_keys.remove(error_count)
+
+    # ---------- 账户登记 ----------
+
+    def add(self, account: "AccountManager") -> None:
+        """登记账户（替换同ID的旧账户）"""
+        account_id = account.config.account_id
+        self.remove(account_id)
+        self._accounts[account_id] = account
+        account._pool = self
+        self.refresh_config(account)
+
+    def remove(self, account_id: str) -> None:
+        account = self._accounts.pop(account_id, None)
+        if account is not None and account._pool is self:
+            account._pool = None
+        self._expire_at.pop(account_id, None)
+        self._discard(account_id)
+
+    def refresh_config(self, account: "AccountManager") -> None:
+        """账户配置（过期时间、手动禁用）变化后调用"""
+        account_id = account.config.account_id
+        expire_at = account.config.expires_ts
+        self._expire_at[account_id] = expire_at
+        if expire_at is not None:
+            heapq.heappush(self._expiries, (expire_at, account_id))
+        self.update(account)
+
+    def rebuild(self) -> None:
+        """重新计算全部账户（例如冷却时间配置变化后）"""
+        self._cooldowns = []
+        self._expiries = []
+        for account in list(self._accounts.values()):
+            self.refresh_config(account)
+
+    # ---------- 状态变化 ----------
+
+    def _is_selectable(self, account: "AccountManager", now: float) -> bool:
+        if account.config.disabled:
+            return False
+        expire_at = self._expire_at.get(account.config.account_id)
+        if expire_at is not None and expire_at <= now:
+            return False
+        return account.is_available
+
+    def update(self, account: "AccountManager") -> None:
+        """账户健康状态（is_available / error_count / 429 冷却）变化后调用"""
+        account_id = account.config.account_id
+        if self._accounts.get(account_id) is not account:
+            return
+        if self._is_selectable(account, time.time()):
+            position = self._positions.get(account_id)
+            if position is not None and position[0] == account.error_count:
+                return
+            self._discard(account_id)
+            self._insert(account_id, account.error_count)
+        else:
+            self._discard(account_id)
+            if not account.is_available and account.last_429_time > 0:
+                due = account.last_429_time + account.rate_limit_cooldown_seconds
+                heapq.heappush(self._cooldowns, (due, account_id))
+
+    def _process_due(self, now: float) -> None:
+        """处理已到期的冷却恢复与账户过期"""
+        while self._cooldowns and self._cooldowns[0][0] <= now:
+            _, account_id = heapq.heappop(self._cooldowns)
+            account = self._accounts.get(account_id)
+            if account is not None and account_id not in self._positions:
+                # should_retry 会在冷却期结束时恢复账户，并通过 update 重新入桶；
+                # 冷却时间被调大时会重新入堆
+                if not account.should_retry():
+                    self.update(account)
+        while self._expiries and self._expiries[0][0] <= now:
+            expire_at, account_id = heapq.heappop(self._expiries)
+            if self._expire_at.get(account_id) == expire_at:
+                self._discard(account_id)
+
+    # ---------- 查询 ----------
+
+    def is_selectable(self, account_id: str) -> bool:
+        self._process_due(time.time())
+        return account_id in self._positions
+
+    def available_count(self) -> int:
+        self._process_due(time.time())
+        return len(self._positions)
+
+    def select(self, exclude: Collection[str] = ()) -> Optional["AccountManager"]:
+        """
+        在健康度最高的前 50% 可用账户中轮询选择一个。
+
+        健康度按 error_count 升序；没有可用账户时返回 None。开启并发控制时优先选择负载最低的账户。
+        指定 exclude 时，返回不在其中的健康度最高的账户（同一健康度内轮询，优先有并发空位的）。
+        """
+        self._process_due(time.time())
+        total = len(self._positions)
+        if not total:
+            return None
+        if exclude:
+            return self._select_excluding(exclude)
+        healthy_count = max(1, total // 2)
+        index = self._cursor % healthy_count
+        self._cursor = (self._cursor + 1) % healthy_count
+        account = self._accounts[self._at_rank(index)]
+        if not account.concurrency.enabled:
+            return account
+        return self._least_loaded(index, healthy_count)
+
+    def _at_rank(self, rank: int) -> str:
+        """按健康度排序后第 rank 个账户的ID，复杂度 O(桶数)"""
+        for error_count in self._bucket_keys:
+            bucket = self._buckets[error_count]
+            if rank < len(bucket):
+                return bucket[rank]
+            rank -= len(bucket)
+        raise IndexError(rank)
+
+    def _least_loaded(self, start: int, healthy_count: int) -> "AccountManager":
+        """从轮询位置开始检查少量健康账户，选择负载最低的；都已满载时溢出到其他可用账户
+
+        溢出查找每次至多检查 OVERFLOW_SCAN_SIZE 个账户，全部满载时的选择开销与账户总数无关；
+        溢出位置每次向后移动，多次选择（如排队等待后重新选择）会依次覆盖所有账户。
+        """
+        best = None
+        scanned = min(self.LOAD_SCAN_SIZE, healthy_count)
+        for offset in range(scanned):
+            account = self._accounts[self._at_rank((start + offset) % healthy_count)]
+            if best is None or account.concurrency.load < best.concurrency.load:
+                best = account
+            if account.concurrency.load == 0:
+                break
+        if best.concurrency.has_capacity:
+            return best
+        total = len(self._positions)
+        count = min(self.OVERFLOW_SCAN_SIZE, total)
+        first = self._overflow_cursor % total
+        self._overflow_cursor = (first + count) % total
+        for offset in range(count):
+            account = self._accounts[self._at_rank((first + offset) % total)]
+            if account.concurrency.has_capacity:
+                return account
+            if account.concurrency.load < best.concurrency.load:
+                best = account
+        # 检查过的账户都已满载：返回负载最低的，由并发控制排队
+        return best
+
+    def _select_excluding(self, exclude: Collection[str]) -> Optional["AccountManager"]:
+        # 优先选择仍有并发空位的账户；都已满载时至多检查 OVERFLOW_SCAN_SIZE 个账户
+        fallback = None
+        checked = 0
+        for error_count in self._bucket_keys:
+            bucket = self._buckets[error_count]
+            start = self._cursor % len(bucket)
+            for offset in range(len(bucket)):
+                account_id = bucket[(start + offset) % len(bucket)]
+                if account_id in exclude:
+                    continue
+                account = self._accounts[account_id]
+                if account.concurrency.has_capacity:
+                    self._cursor += 1
+                    return account
+                if fallback is None:
+                    fallback = account
+                checked += 1
+                if checked >= self.OVERFLOW_SCAN_SIZE:
+                    # 下一次从后面的账户开始检查
+                    self._cursor += checked
+                    return fallback
+        return fallback
@@ -0,0 +1,250 @@
+"""用户附件（图片、PDF、文档等）的流式处理
+
+过去 URL 附件会整个下载到内存、编码成 base64 字符串，上传时再序列化进 JSON 请求体，
+一个 20MB 的 PDF 会同时以 bytes、base64 str、JSON body 三份存在（每次重试都会再序列化一次）。
+这里改为：
+
+- 下载时边收边写入缓冲区，超过阈值后转存到临时文件，并按单文件/单请求大小上限提前中止
+- 上传时按块编码 base64，用异步生成器流式发送 widgetAddContextFile 的 JSON 请求体
+  （预先计算 Content-Length，不使用分块传输编码）
+- 同一附件可以被多次上传（重试、切换账户、对冲），每次独立按偏移读取
+- 下载时顺带计算原始内容的 sha256，用于上传缓存（core/upload_cache.py）去重
+
+Data URI 附件本身已经是请求 JSON 中的 base64 字符串，直接按切片发送，不再解码。
+"""
+import asyncio
+import base64
+import binascii
+import hashlib
+import json
+import logging
+import re
+import tempfile
+import threading
+from typing import IO, AsyncIterator, Iterable, List, Optional
+
+import httpx
+from fastapi import HTTPException
+
+from core.config import config
+
+logger = logging.getLogger(__name__)
+
+RAW_CHUNK_SIZE = 48 * 1024  # 3 的倍数，每块编码为 64KB base64
+B64_CHUNK_SIZE = RAW_CHUNK_SIZE // 3 * 4
+MB = 1024 * 1024
+_BASE64 = re.compile(r"[A-Za-z0-9+/]*={0,2}")
+_WHITESPACE = re.compile(r"\s+")
+
+
+class AttachmentBudget:
+    """单个请求的附件大小限制（单文件上限 + 所有附件合计上限）"""
+
+    def __init__(self, max_bytes: int, total_max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self.remaining = total_max_bytes
+        self.total_max_bytes = total_max_bytes
+
+    @classmethod
+    def from_config(cls) -> "AttachmentBudget":
+        return cls(
+            config.performance.attachment_max_mb * MB,
+            config.performance.attachment_total_max_mb * MB,
+        )
+
+    def check(self, size: int, consumed: int = 0) -> None:
+        """检查附件累计 size 字节是否超限（consumed 为该附件此前已计入的字节数）"""
+        if size > self.max_bytes:
+            raise HTTPException(413, f"附件超过大小限制（单个文件最大 {self.max_bytes // MB}MB）")
+        self.remaining -= size - consumed
+        if self.remaining < 0:
+            raise HTTPException(413, f"附件总大小超过限制（单次请求最多 {self.total_max_bytes // MB}MB）")
+
+
+class Attachment:
+    """一个待上传的附件（内存、临时文件或 base64 字符串）"""
+
+    __slots__ = ("mime", "size", "_data", "_file", "_b64", "_lock", "_sha256")
+
+    def __init__(
+        self,
+        mime: str,
+        size: int,
+        data: Optional[bytes] = None,
+        file: Optional[IO[bytes]] = None,
+        b64: Optional[str] = None,
+        sha256: Optional[str] = None,
+    ) -> None:
+        self.mime = mime
+        self.size = size  # 原始字节数
+        self._data = data
+        self._file = file
+        self._b64 = b64
+        self._lock = threading.Lock()
+        self._sha256 = sha256
+
+    @classmethod
+    def from_base64(cls, mime: str, b64: str) -> "Attachment":
+        # base64 原样写入 JSON 字符串：只接受 base64 字符（去掉换行等空白），不会出现需要转义的字符
+        if not _BASE64.fullmatch(b64):
+            b64 = _WHITESPACE.sub("", b64)
+            if not _BASE64.fullmatch(b64):
+                raise HTTPException(400, "无效的 base64 文件数据")
+        return cls(mime, len(b64) * 3 // 4, b64=b64)
+
+    @property
+    def spilled(self) -> bool:
+        return self._file is not None
+
+    @property
+    def base64_length(self) -> int:
+        if self._b64 is not None:
+            return len(self._b64)
+        return (self.size + 2) // 3 * 4
+
+    def _digest_base64(self) -> str:
+        # 按块解码后计算，与 URL 下载的同一文件得到相同的哈希
+        digest = hashlib.sha256()
+        try:
+            for start in range(0, len(self._b64), B64_CHUNK_SIZE):
+                digest.update(base64.b64decode(self._b64[start:start + B64_CHUNK_SIZE]))
+        except (binascii.Error, ValueError):
+            return "b64:" + hashlib.sha256(self._b64.encode("ascii")).hexdigest()
+        return digest.hexdigest()
+
+    async def sha256(self) -> str:
+        """原始内容的 sha256（十六进制）"""
+        if self._sha256 is None:
+            if self._b64 is not None:
+                if len(self._b64) > B64_CHUNK_SIZE:
+                    self._sha256 = await asyncio.to_thread(self._digest_base64)
+                else:
+                    self._sha256 = self._digest_base64()
+            else:
+                self._sha256 = hashlib.sha256(self._data or b"").hexdigest()
+        return self._sha256
+
+    def _read_at(self, offset: int, size: int) -> bytes:
+        # 同一附件可能被并发上传（对冲），seek + read 需要加锁
+        with self._lock:
+            self._file.seek(offset)
+            return self._file.read(size)
+
+    async def iter_base64(self) -> AsyncIterator[bytes]:
+        """按块产出 base64 编码（ASCII bytes）"""
+        if self._b64 is not None:
+            for start in range(0, len(self._b64), B64_CHUNK_SIZE):
+                yield self._b64[start:start + B64_CHUNK_SIZE].encode("ascii")
+            return
+        if self._file is None:
+            view = memoryview(self._data or b"")
+            for start in range(0, self.size, RAW_CHUNK_SIZE):
+                yield base64.b64encode(view[start:start + RAW_CHUNK_SIZE])
+            return
+        for start in range(0, self.size, RAW_CHUNK_SIZE):
+            chunk = await asyncio.to_thread(self._read_at, start, RAW_CHUNK_SIZE)
+            yield base64.b64encode(chunk)
+
+    def close(self) -> None:
+        self._data = None
+        self._b64 = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+async def download_attachment(
+    http_client: httpx.AsyncClient,
+    url: str,
+    budget: AttachmentBudget,
+    request_id: str = "",
+) -> Optional[Attachment]:
+    """流式下载 URL 附件；超过内存阈值的部分写入临时文件
+
+    Returns:
+        Attachment；URL 已失效（404）时返回 None
+
+    Raises:
+        HTTPException(413): 超过大小限制
+        httpx.HTTPError: 下载失败
+    """
+    spool_bytes = config.performance.attachment_spool_threshold_kb * 1024
+    async with http_client.stream("GET", url) as resp:
+        if resp.status_code == 404:
+            logger.warning(f"[FILE] [req_{request_id}] URL文件已失效(404)，已跳过: {url[:50]}...")
+            return None
+        resp.raise_for_status()
+        content_type = resp.headers.get("content-type", "application/octet-stream").split(";")[0]
+        declared = resp.headers.get("content-length")
+        if declared and declared.isdigit() and int(declared) > budget.max_bytes:
+            # 响应头已声明超限，不再下载
+            budget.check(int(declared))
+
+        buffer = bytearray()
+        file: Optional[IO[bytes]] = None
+        size = 0
+        digest = hashlib.sha256()
+        try:
+            async for chunk in resp.aiter_bytes():
+                budget.check(size + len(chunk), size)
+                size += len(chunk)
+                digest.update(chunk)
+                if file is not None:
+                    await asyncio.to_thread(file.write, chunk)
+                    continue
+                buffer += chunk
+                if len(buffer) > spool_bytes:
+                    file = await asyncio.to_thread(tempfile.TemporaryFile, prefix="attachment_")
+                    await asyncio.to_thread(file.write, buffer)
+                    buffer = bytearray()
+        except BaseException:
+            if file is not None:
+                file.close()
+            raise
+
+    location = "临时文件" if file is not None else "内存"
+    logger.info(f"[FILE] [req_{request_id}] URL文件下载成功: {url[:50]}... ({size} bytes, {content_type}, {location})")
+    if file is not None:
+        return Attachment(content_type, size, file=file, sha256=digest.hexdigest())
+    return Attachment(content_type, size, data=bytes(buffer), sha256=digest.hexdigest())
+
+
+async def stream_context_file_body(prefix: bytes, attachment: Attachment, suffix: bytes) -> AsyncIterator[bytes]:
+    """JSON 请求体：prefix + base64 文件内容 + suffix"""
+    yield prefix
+    async for chunk in attachment.iter_base64():
+        yield chunk
+    yield suffix
+
+
+def context_file_body(body: dict, attachment: Attachment) -> tuple:
+    """构造 widgetAddContextFile 的流式请求体
+
+    body 中 addContextFileRequest.fileContents 之外的字段照常序列化，
+    fileContents 放在 JSON 末尾，由生成器按块写入（base64 字符不需要 JSON 转义）。
+
+    Returns:
+        (请求体生成器, Content-Length)
+    """
+    encoded = json.dumps(body, ensure_ascii=False)
+    # body 以 ...}} 结尾（addContextFileRequest 是最后一个键）：在末尾两个 } 之前插入 fileContents
+    prefix = (encoded[:-2] + ', "fileContents": "').encode("utf-8")
+    suffix = b'"}}'
+    length = len(prefix) + attachment.base64_length + len(suffix)
+    return stream_context_file_body(prefix, attachment, suffix), length
+
+
+def close_attachments(attachments: Iterable[Attachment]) -> None:
+    for attachment in attachments:
+        attachment.close()
+
+
+async def close_after(events: AsyncIterator, attachments: List[Attachment]) -> AsyncIterator:
+    """转发事件流，结束（或客户端断开）后释放附件占用的内存和临时文件"""
+    try:
+        async for event in events:
+            yield event
+    finally:
+        # 先结束事件流（取消仍在进行的上传），再关闭附件
+        await events.aclose()
+        close_attachments(attachments)
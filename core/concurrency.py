@@ -0,0 +1,268 @@
+"""按账户的自适应并发控制
+
+触发 429 冷却的通常是同一账户上的突发并发。每个账户维护在途请求数与一个自适应并发上限（AIMD）：
+
+- 上限成为瓶颈时，每次成功把上限加 1/limit（约每一轮满载加 1）
+- 遇到 429 时下调到触发时的在途数 - 1（至少减 1，至多减半），之后一段时间内不再上调，
+  避免反复试探触发冷却；首字延迟在并发时明显高于该账户的基线时小幅下调
+- 上限已满的账户不再被选中；所有账户都满载时新请求排队等待任意账户空出名额，
+  超过排队时间返回 503（不在满载账户上超额发送，避免触发 429 冷却）
+- 指定账户的请求（会话绑定）在该账户上排队，超过排队时间后超额发送
+
+账户选择（AccountPool.select）在健康度最高的账户中优先选择负载（在途数 / 上限）最低的账户，
+健康账户都已满载时溢出到其他可用账户。
+"""
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, AsyncIterator, Callable, Deque, Iterable, Optional
+
+if TYPE_CHECKING:
+    from core.account import AccountManager
+
+
+class ConcurrencyPolicy:
+    """所有账户共享的并发控制配置（返回值支持热更新）"""
+
+    MIN_LIMIT = 1.0
+    MAX_DECREASE_ON_429 = 0.5  # 429 时上限至多减半
+    DECREASE_ON_LATENCY = 0.9
+    INCREASE_HOLD_SECONDS = 300.0  # 429 后多久内不再上调上限
+    RESERVATION_TTL_SECONDS = 30.0  # 选中账户到实际发出请求之间的预占有效期
+    LATENCY_TOLERANCE = 2.0  # 首字延迟超过基线的倍数视为过载
+    BASELINE_ALPHA = 0.05
+    BASELINE_MIN_SAMPLES = 10
+
+    def __init__(
+        self,
+        enabled: Callable[[], bool],
+        initial_limit: Callable[[], int],
+        max_limit: Callable[[], int],
+        queue_timeout_seconds: Callable[[], int],
+    ) -> None:
+        self.enabled = enabled
+        self.initial_limit = initial_limit
+        self.max_limit = max_limit
+        self.queue_timeout_seconds = queue_timeout_seconds
+        # 等待任意账户空出名额的请求
+        self._waiters: Deque[asyncio.Future] = deque()
+        self.queued = 0
+        self.queue_timeouts = 0
+
+    async def wait_for_release(self, timeout: float) -> Optional[str]:
+        """等待任意账户释放一个名额，返回释放名额的账户ID（超时返回 None）"""
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            return await asyncio.wait_for(waiter, timeout)
+        except asyncio.TimeoutError:
+            return None
+        except asyncio.CancelledError:
+            # 已被唤醒却被取消：把空出的名额转交给下一个等待者
+            if waiter.done() and not waiter.cancelled():
+                self.notify_release(waiter.result())
+            raise
+        finally:
+            if not waiter.done():
+                waiter.cancel()
+
+    def notify_release(self, account_id: Optional[str] = None) -> None:
+        _wake_one(self._waiters, account_id)
+
+
+def _wake_one(waiters: Deque[asyncio.Future], result: Optional[str] = None) -> None:
+    while waiters:
+        waiter = waiters.popleft()
+        if not waiter.done():
+            waiter.set_result(result)
+            return
+
+
+class AccountConcurrency:
+    """单个账户的在途请求数与自适应并发上限"""
+
+    def __init__(self, policy: ConcurrencyPolicy, account_id: str = "") -> None:
+        self.policy = policy
+        self.account_id = account_id  # 释放名额时告知等待选择账户的请求
+        self.inflight = 0
+        self.limit = float(policy.initial_limit())
+        self._waiters: Deque[asyncio.Future] = deque()
+        # 已被选中、尚未发出请求的预占（创建 Session、上传文件期间），按时间先后排列
+        self._reservations: Deque[float] = deque()
+        self.latency_baseline_ms: Optional[float] = None
+        self._latency_samples = 0
+        self._hold_increase_until = 0.0
+        # 指标
+        self.peak_inflight = 0
+        self.queued = 0
+        self.spilled = 0
+        self.increases = 0
+        self.decreases = 0
+        self.rate_limited = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.policy.enabled()
+
+    @property
+    def capacity(self) -> int:
+        return max(1, min(int(self.limit), self.policy.max_limit()))
+
+    @property
+    def reserved(self) -> int:
+        reservations = self._reservations
+        if reservations:
+            expire_before = time.monotonic() - self.policy.RESERVATION_TTL_SECONDS
+            while reservations and reservations[0] < expire_before:
+                reservations.popleft()
+        return len(reservations)
+
+    @property
+    def has_capacity(self) -> bool:
+        return not self.enabled or self.inflight + self.reserved < self.capacity
+
+    @property
+    def load(self) -> float:
+        """负载：（在途请求数 + 预占数）/ 并发上限"""
+        return (self.inflight + self.reserved) / self.capacity
+
+    def reserve(self) -> None:
+        """账户被选中（get_account，含指定账户）时预占一个名额，避免同一时刻的突发请求都选中同一个账户
+
+        每次 acquire 兑现一个预占；没有发出请求的预占在 RESERVATION_TTL_SECONDS 后过期。
+        """
+        if self.enabled:
+            self._reservations.append(time.monotonic())
+
+    def cancel_reservation(self) -> None:
+        """撤销一个尚未兑现的预占（选中账户的请求在 acquire 之前就结束了，如被取消的对冲请求）"""
+        if self._reservations:
+            self._reservations.pop()
+
+    # ---------- 占用 / 释放 ----------
+
+    async def acquire(self) -> None:
+        if self._reservations:
+            # 兑现本请求在 get_account 时的预占（预占按先后顺序兑现，只用于选择账户，这里按在途数判断）
+            self._reservations.popleft()
+        if self.enabled and self.inflight >= self.capacity:
+            self.queued += 1
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + self.policy.queue_timeout_seconds()
+            while self.inflight >= self.capacity:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    # 排队超时：超额发送
+                    self.spilled += 1
+                    break
+                waiter = loop.create_future()
+                self._waiters.append(waiter)
+                try:
+                    await asyncio.wait_for(waiter, remaining)
+                except asyncio.TimeoutError:
+                    pass
+                finally:
+                    if not waiter.done():
+                        waiter.cancel()
+        self.inflight += 1
+        self.peak_inflight = max(self.peak_inflight, self.inflight)
+
+    def release(self) -> None:
+        self.inflight -= 1
+        # 唤醒一个仍在等待的请求（被唤醒后重新检查是否有空位）；
+        # 本账户没有等待者时唤醒一个等待选择账户的请求
+        if any(not waiter.done() for waiter in self._waiters):
+            _wake_one(self._waiters)
+        else:
+            self._waiters.clear()
+            self.policy.notify_release(self.account_id)
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """占用一个并发名额（上限已满时排队）"""
+        await self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    # ---------- AIMD 信号 ----------
+
+    def on_success(self, latency_ms: Optional[float]) -> None:
+        """请求成功；latency_ms 为首字延迟"""
+        policy = self.policy
+        if latency_ms is not None:
+            baseline = self.latency_baseline_ms
+            self._latency_samples += 1
+            # 只在有并发时把延迟升高视为过载信号（单个请求的首字延迟主要取决于上下文长度）
+            if (
+                baseline is not None
+                and self.inflight > 1
+                and self._latency_samples >= policy.BASELINE_MIN_SAMPLES
+                and latency_ms > baseline * policy.LATENCY_TOLERANCE
+            ):
+                self._decrease(policy.DECREASE_ON_LATENCY)
+                return
+            self.latency_baseline_ms = latency_ms if baseline is None else (
+                baseline + policy.BASELINE_ALPHA * (latency_ms - baseline)
+            )
+        # 只有上限成为瓶颈时才增加（本次请求完成前在途数已达上限）
+        if (
+            self.inflight >= self.capacity
+            and self.limit < policy.max_limit()
+            and time.monotonic() >= self._hold_increase_until
+        ):
+            self.limit = min(float(policy.max_limit()), self.limit + 1.0 / self.limit)
+            self.increases += 1
+
+    def on_rate_limited(self) -> None:
+        """遇到 429（在释放名额之前调用）"""
+        self.rate_limited += 1
+        policy = self.policy
+        # 上限可能高于配置的最大值（配置被调小），先收敛到当前生效的上限
+        limit = min(self.limit, float(self.capacity))
+        target = max(limit * policy.MAX_DECREASE_ON_429, float(self.inflight - 1))
+        self.limit = max(policy.MIN_LIMIT, min(limit - 1, target))
+        self.decreases += 1
+        self._hold_increase_until = time.monotonic() + policy.INCREASE_HOLD_SECONDS
+
+    def _decrease(self, factor: float) -> None:
+        self.limit = max(self.policy.MIN_LIMIT, min(self.limit, float(self.capacity)) * factor)
+        self.decreases += 1
+
+    def get_metrics(self) -> dict:
+        return {
+            "inflight": self.inflight,
+            "reserved": self.reserved,
+            "limit": round(self.limit, 2),
+            "waiting": sum(1 for waiter in self._waiters if not waiter.done()),
+            "peak_inflight": self.peak_inflight,
+            "queued": self.queued,
+            "spilled": self.spilled,
+            "increases": self.increases,
+            "decreases": self.decreases,
+            "rate_limited": self.rate_limited,
+            "latency_baseline_ms": round(self.latency_baseline_ms, 1) if self.latency_baseline_ms is not None else None,
+        }
+
+
+def concurrency_metrics(policy: ConcurrencyPolicy, accounts: Iterable["AccountManager"]) -> dict:
+    """汇总所有账户的并发控制指标"""
+    per_account = []
+    capacity = 0
+    for account in accounts:
+        capacity += account.concurrency.capacity
+        per_account.append({"account_id": account.config.account_id, **account.concurrency.get_metrics()})
+    return {
+        "enabled": policy.enabled(),
+        "inflight": sum(a["inflight"] for a in per_account),
+        "capacity": capacity,
+        "waiting_for_account": sum(1 for waiter in policy._waiters if not waiter.done()),
+        "queued_for_account": policy.queued,
+        "queue_timeouts": policy.queue_timeouts,
+        "queued": sum(a["queued"] for a in per_account),
+        "spilled": sum(a["spilled"] for a in per_account),
+        "rate_limited": sum(a["rate_limited"] for a in per_account),
+        "accounts": per_account,
+    }
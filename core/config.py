@@ -95,6 +95,38 @@ class SessionConfig(BaseModel):
     expire_hours: int = Field(default=24, ge=1, le=168, description="Session过期时间（小时）")
 
 
+class PerformanceConfig(BaseModel):
+    """性能相关配置"""
+    stats_flush_interval_seconds: int = Field(default=5, ge=1, le=300, description="统计数据写回间隔（秒）")
+    stats_flush_max_pending: int = Field(default=200, ge=1, le=100000, description="累计多少次变更后立即写回统计数据")
+    public_cache_ttl_seconds: int = Field(default=2, ge=0, le=5, description="公开端点响应缓存时间（秒，0禁用）")
+    session_cache_max_size: int = Field(default=100000, ge=100, le=10000000, description="会话缓存最大条目数")
+    session_affinity_backend: str = Field(default="memory", description="会话绑定持久化后端：memory、sqlite 或 postgres（重启后生效）")
+    jwt_refresh_enabled: bool = Field(default=True, description="后台提前刷新活跃账户的JWT")
+    jwt_refresh_lead_seconds: int = Field(default=60, ge=10, le=200, description="JWT过期前多少秒开始刷新")
+    jwt_refresh_jitter_seconds: int = Field(default=30, ge=0, le=60, description="JWT刷新时间的随机抖动（秒）")
+    session_pool_enabled: bool = Field(default=False, description="为活跃账户预先创建 Session")
+    session_pool_max_per_account: int = Field(default=2, ge=1, le=20, description="每个账户最多预热的 Session 数")
+    session_pool_max_age_seconds: int = Field(default=300, ge=30, le=3600, description="预热 Session 的最长保留时间（秒）")
+    hedge_enabled: bool = Field(default=False, description="首字超时后在其他账户上发起对冲请求")
+    hedge_percentile: int = Field(default=95, ge=50, le=99, description="对冲截止时间取首字延迟的百分位")
+    hedge_min_delay_ms: int = Field(default=3000, ge=500, le=60000, description="对冲截止时间下限（毫秒）")
+    hedge_budget_percent: int = Field(default=5, ge=1, le=50, description="对冲请求占总请求的比例上限（%）")
+    account_concurrency_enabled: bool = Field(default=True, description="按账户自适应限制并发，并优先选择负载最低的账户")
+    account_concurrency_initial: int = Field(default=8, ge=1, le=256, description="每个账户的初始并发上限")
+    account_concurrency_max: int = Field(default=32, ge=1, le=256, description="每个账户的并发上限最大值")
+    account_queue_timeout_seconds: int = Field(default=5, ge=0, le=60, description="所有账户满载时的最长排队时间（秒）")
+    upstream_http2: bool = Field(default=False, description="Google 上游使用 HTTP/2 多路复用（需安装 h2）")
+    attachment_max_mb: int = Field(default=50, ge=1, le=500, description="单个附件的大小上限（MB）")
+    attachment_total_max_mb: int = Field(default=100, ge=1, le=2000, description="单次请求所有附件的大小上限（MB）")
+    attachment_spool_threshold_kb: int = Field(default=1024, ge=64, le=65536, description="URL 附件超过该大小后转存到临时文件（KB）")
+    upload_cache_ttl_seconds: int = Field(default=3600, ge=0, le=86400, description="已上传附件的 fileId 复用时间（秒，0禁用）")
+    upload_cache_max_entries: int = Field(default=10000, ge=100, le=1000000, description="附件上传缓存最大条目数")
+    upload_concurrency_per_request: int = Field(default=4, ge=1, le=32, description="单个请求同时上传的附件数")
+    upload_concurrency_global: int = Field(default=32, ge=1, le=256, description="所有请求同时上传的附件总数")
+    conversation_key_hash: str = Field(default="md5", description="对话指纹哈希算法：md5 或 xxh3（需安装 xxhash；切换后已有会话绑定失效）")
+
+
 class SecurityConfig(BaseModel):
     """安全配置（仅从环境变量读取，不可热更新）"""
     admin_key: str = Field(default="", description="管理员密钥（必需）")
@@ -112,6 +144,7 @@ class AppConfig(BaseModel):
     retry: RetryConfig
     public_display: PublicDisplayConfig
     session: SessionConfig
+    performance: PerformanceConfig
 
 
 # ==================== 配置管理器 ====================
@@ -189,6 +222,10 @@ class ConfigManager:
             **yaml_data.get("session", {})
         )
 
+        performance_config = PerformanceConfig(
+            **yaml_data.get("performance", {})
+        )
+
         # 5. 构建完整配置
         self._config = AppConfig(
             security=security_config,
@@ -196,7 +233,8 @@ class ConfigManager:
             image_generation=image_generation_config,
             retry=retry_config,
             public_display=public_display_config,
-            session=session_config
+            session=session_config,
+            performance=performance_config
         )
 
     def _load_yaml(self) -> dict:
@@ -334,6 +372,146 @@ class ConfigManager:
         """自动刷新账号间隔（秒，0禁用）"""
         return self._config.retry.auto_refresh_accounts_seconds
 
+    @property
+    def stats_flush_interval_seconds(self) -> int:
+        """统计数据写回间隔（秒）"""
+        return self._config.performance.stats_flush_interval_seconds
+
+    @property
+    def stats_flush_max_pending(self) -> int:
+        """累计多少次变更后立即写回统计数据"""
+        return self._config.performance.stats_flush_max_pending
+
+    @property
+    def public_cache_ttl_seconds(self) -> int:
+        """公开端点响应缓存时间（秒，0禁用）"""
+        return self._config.performance.public_cache_ttl_seconds
+
+    @property
+    def session_cache_max_size(self) -> int:
+        """会话缓存最大条目数"""
+        return self._config.performance.session_cache_max_size
+
+    @property
+    def session_affinity_backend(self) -> str:
+        """会话绑定持久化后端"""
+        return self._config.performance.session_affinity_backend
+
+    @property
+    def jwt_refresh_enabled(self) -> bool:
+        """后台提前刷新活跃账户的JWT"""
+        return self._config.performance.jwt_refresh_enabled
+
+    @property
+    def jwt_refresh_lead_seconds(self) -> int:
+        """JWT过期前多少秒开始刷新"""
+        return self._config.performance.jwt_refresh_lead_seconds
+
+    @property
+    def jwt_refresh_jitter_seconds(self) -> int:
+        """JWT刷新时间的随机抖动（秒）"""
+        return self._config.performance.jwt_refresh_jitter_seconds
+
+    @property
+    def session_pool_enabled(self) -> bool:
+        """为活跃账户预先创建 Session"""
+        return self._config.performance.session_pool_enabled
+
+    @property
+    def session_pool_max_per_account(self) -> int:
+        """每个账户最多预热的 Session 数"""
+        return self._config.performance.session_pool_max_per_account
+
+    @property
+    def session_pool_max_age_seconds(self) -> int:
+        """预热 Session 的最长保留时间（秒）"""
+        return self._config.performance.session_pool_max_age_seconds
+
+    @property
+    def hedge_enabled(self) -> bool:
+        """首字超时后在其他账户上发起对冲请求"""
+        return self._config.performance.hedge_enabled
+
+    @property
+    def hedge_percentile(self) -> int:
+        """对冲截止时间取首字延迟的百分位"""
+        return self._config.performance.hedge_percentile
+
+    @property
+    def hedge_min_delay_ms(self) -> int:
+        """对冲截止时间下限（毫秒）"""
+        return self._config.performance.hedge_min_delay_ms
+
+    @property
+    def hedge_budget_percent(self) -> int:
+        """对冲请求占总请求的比例上限（%）"""
+        return self._config.performance.hedge_budget_percent
+
+    @property
+    def account_concurrency_enabled(self) -> bool:
+        """按账户自适应限制并发，并优先选择负载最低的账户"""
+        return self._config.performance.account_concurrency_enabled
+
+    @property
+    def account_concurrency_initial(self) -> int:
+        """每个账户的初始并发上限"""
+        return self._config.performance.account_concurrency_initial
+
+    @property
+    def account_concurrency_max(self) -> int:
+        """每个账户的并发上限最大值"""
+        return self._config.performance.account_concurrency_max
+
+    @property
+    def account_queue_timeout_seconds(self) -> int:
+        """所有账户满载时的最长排队时间（秒）"""
+        return self._config.performance.account_queue_timeout_seconds
+
+    @property
+    def upstream_http2(self) -> bool:
+        """Google 上游使用 HTTP/2 多路复用（需安装 h2）"""
+        return self._config.performance.upstream_http2
+
+    @property
+    def attachment_max_mb(self) -> int:
+        """单个附件的大小上限（MB）"""
+        return self._config.performance.attachment_max_mb
+
+    @property
+    def attachment_total_max_mb(self) -> int:
+        """单次请求所有附件的大小上限（MB）"""
+        return self._config.performance.attachment_total_max_mb
+
+    @property
+    def attachment_spool_threshold_kb(self) -> int:
+        """URL 附件超过该大小后转存到临时文件（KB）"""
+        return self._config.performance.attachment_spool_threshold_kb
+
+    @property
+    def upload_cache_ttl_seconds(self) -> int:
+        """已上传附件的 fileId 复用时间（秒，0禁用）"""
+        return self._config.performance.upload_cache_ttl_seconds
+
+    @property
+    def upload_cache_max_entries(self) -> int:
+        """附件上传缓存最大条目数"""
+        return self._config.performance.upload_cache_max_entries
+
+    @property
+    def upload_concurrency_per_request(self) -> int:
+        """单个请求同时上传的附件数"""
+        return self._config.performance.upload_concurrency_per_request
+
+    @property
+    def upload_concurrency_global(self) -> int:
+        """所有请求同时上传的附件总数"""
+        return self._config.performance.upload_concurrency_global
+
+    @property
+    def conversation_key_hash(self) -> str:
+        """对话指纹哈希算法：md5 或 xxh3（需安装 xxhash；切换后已有会话绑定失效）"""
+        return self._config.performance.conversation_key_hash
+
 
 # ==================== 全局配置管理器 ====================
 
@@ -372,4 +550,8 @@ class _ConfigProxy:
     def session(self):
         return config_manager.config.session
 
+    @property
+    def performance(self):
+        return config_manager.config.performance
+
 config = _ConfigProxy()
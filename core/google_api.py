@@ -13,7 +13,10 @@ from typing import TYPE_CHECKING, List
 import httpx
 from fastapi import HTTPException
 
+from core.attachments import context_file_body
+
 if TYPE_CHECKING:
+    from core.attachments import Attachment
     from main import AccountManager
 
 logger = logging.getLogger(__name__)
@@ -130,15 +133,15 @@ async def create_google_session(
 
 async def upload_context_file(
     session_name: str,
-    mime_type: str,
-    base64_content: str,
+    attachment: "Attachment",
     account_manager: "AccountManager",
     http_client: httpx.AsyncClient,
     user_agent: str,
     request_id: str = ""
 ) -> str:
-    """上传文件到指定 Session，返回 fileId"""
+    """上传文件到指定 Session，返回 fileId（请求体按块流式发送）"""
     jwt = await account_manager.get_jwt(request_id)
+    mime_type = attachment.mime
     headers = get_common_headers(jwt, user_agent)
 
     # 生成随机文件名
@@ -152,14 +155,15 @@ async def upload_context_file(
             "name": session_name,
             "fileName": file_name,
             "mimeType": mime_type,
-            "fileContents": base64_content
         }
     }
+    content, content_length = context_file_body(body, attachment)
+    headers["content-length"] = str(content_length)
 
     r = await http_client.post(
         f"{GEMINI_API_BASE}/locations/global/widgetAddContextFile",
         headers=headers,
-        json=body,
+        content=content,
     )
 
     req_tag = f"[req_{request_id}] " if request_id else ""
@@ -0,0 +1,270 @@
+"""对冲请求（降低首字延迟长尾）
+
+某个账户响应变慢时，response_wrapper 只有在出错或等到 TIMEOUT_SECONDS 后才会切换账户。
+开启对冲后，如果 widgetStreamAssist 在截止时间内还没有返回首个 token，就在另一个健康账户上
+发起第二次尝试，先产出内容的一方胜出，另一方被取消：
+
+- 截止时间取最近首字延迟的分位数（如 P95），并设置下限，样本不足时不对冲
+- 对冲预算按流量比例限制（令牌桶：每个请求积累 budget_percent% 个令牌，每次对冲消耗 1 个），
+  避免上游整体变慢时对冲反过来放大负载
+"""
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+from typing import AsyncIterator, Awaitable, Callable, Deque, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_EVENT, _ERROR, _END = 0, 1, 2
+
+
+class _Attempt:
+    __slots__ = ("index", "started_at", "elapsed_ms", "task", "alive", "error")
+
+    def __init__(self, index: int, events: AsyncIterator, queue: asyncio.Queue) -> None:
+        self.index = index
+        self.started_at = time.monotonic()
+        self.elapsed_ms = 0.0
+        self.alive = True
+        self.error: Optional[BaseException] = None
+        self.task = asyncio.create_task(_pump(index, events, queue))
+
+
+async def _pump(index: int, events: AsyncIterator, queue: asyncio.Queue) -> None:
+    """在独立任务中驱动一次尝试，事件按 (尝试序号, 类型, 内容) 放入共享队列"""
+    try:
+        async for event in events:
+            await queue.put((index, _EVENT, event))
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        await queue.put((index, _ERROR, e))
+        return
+    finally:
+        aclose = getattr(events, "aclose", None)
+        if aclose is not None:
+            await aclose()
+    await queue.put((index, _END, None))
+
+
+class UpstreamHedger:
+    """首字延迟跟踪 + 对冲预算 + 竞速执行
+
+    Args:
+        enabled / percentile / min_delay_ms / budget_percent: 返回配置值，支持热更新
+    """
+
+    WINDOW_SIZE = 512  # 参与分位数计算的最近首字延迟样本数
+    MIN_SAMPLES = 20  # 样本不足时不对冲
+    RECOMPUTE_EVERY = 16  # 每新增 N 个样本重新计算一次分位数
+    BUDGET_BURST = 10.0  # 令牌桶容量（允许的突发对冲次数）
+    QUEUE_SIZE = 64
+
+    def __init__(
+        self,
+        enabled: Callable[[], bool],
+        percentile: Callable[[], int],
+        min_delay_ms: Callable[[], int],
+        budget_percent: Callable[[], int],
+    ) -> None:
+        self._enabled = enabled
+        self._percentile = percentile
+        self._min_delay_ms = min_delay_ms
+        self._budget_percent = budget_percent
+        self._samples: Deque[float] = deque(maxlen=self.WINDOW_SIZE)
+        self._pending_samples = 0
+        self._cached_percentile: Optional[int] = None
+        self._cached_value: Optional[float] = None
+        self._budget = 0.0
+        # 指标
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.primary_wins = 0
+        self.budget_denied = 0
+        self.cancelled = 0
+        self.attempt_failures = 0
+
+    # ---------- 首字延迟与截止时间 ----------
+
+    def _record_sample(self, seconds: float) -> None:
+        self._samples.append(seconds)
+        self._pending_samples += 1
+
+    def _latency_percentile(self) -> Optional[float]:
+        if len(self._samples) < self.MIN_SAMPLES:
+            return None
+        percentile = self._percentile()
+        if (
+            self._cached_value is None
+            or self._cached_percentile != percentile
+            or self._pending_samples >= self.RECOMPUTE_EVERY
+        ):
+            ordered = sorted(self._samples)
+            rank = max(0, math.ceil(len(ordered) * percentile / 100) - 1)
+            self._cached_value = ordered[rank]
+            self._cached_percentile = percentile
+            self._pending_samples = 0
+        return self._cached_value
+
+    def deadline(self) -> Optional[float]:
+        """当前的首字截止时间（秒）；样本不足时返回 None"""
+        value = self._latency_percentile()
+        if value is None:
+            return None
+        return max(value, self._min_delay_ms() / 1000)
+
+    def _take_budget(self) -> bool:
+        if self._budget >= 1.0:
+            self._budget -= 1.0
+            return True
+        self.budget_denied += 1
+        return False
+
+    # ---------- 竞速 ----------
+
+    async def stream(
+        self,
+        primary: AsyncIterator,
+        start_hedge: Callable[[], AsyncIterator],
+        is_first_token: Callable[[object], bool],
+        on_winner: Callable[[int], Awaitable[None]],
+        on_loser: Callable[[int, Optional[BaseException], float], None],
+        log_tag: str = "",
+    ) -> AsyncIterator:
+        """转发主请求的事件；首字超时则发起对冲，先产出首个 token 的一方胜出
+
+        Args:
+            primary: 主请求的事件流
+            start_hedge: 创建对冲请求的事件流（选择账户、创建 Session 等放在流内部执行）
+            is_first_token: 判断事件是否为首个内容事件
+            on_winner: 胜出方确定后、转发其首个 token 之前调用（参数为尝试序号，0 为主请求）
+            on_loser: 落败或失败的尝试结束时调用（尝试序号, 异常或 None, 已耗时毫秒）
+
+        对冲请求在首个 token 之前的事件（如 role）不转发。主请求在首个 token 之前失败时：
+        尚未发起对冲则直接抛出（由调用方按原流程重试）；对冲请求仍在进行则等待其结果，
+        对冲也失败时抛出主请求的异常。
+        """
+        self.requests += 1
+        self._budget = min(self.BUDGET_BURST, self._budget + self._budget_percent() / 100)
+
+        if not self._enabled():
+            # 未开启对冲：直接转发，只记录首字延迟样本
+            started_at = time.monotonic()
+            seen = False
+            async for event in primary:
+                if not seen and is_first_token(event):
+                    seen = True
+                    self._record_sample(time.monotonic() - started_at)
+                yield event
+            return
+
+        queue: asyncio.Queue = asyncio.Queue(self.QUEUE_SIZE)
+        attempts: List[_Attempt] = [_Attempt(0, primary, queue)]
+        deadline = self.deadline()
+        hedge_at = None if deadline is None else attempts[0].started_at + deadline
+        winner: Optional[_Attempt] = None
+        try:
+            # 1. 等待首个 token
+            while winner is None:
+                timeout = None if hedge_at is None else max(0.0, hedge_at - time.monotonic())
+                try:
+                    index, kind, payload = await asyncio.wait_for(queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    hedge_at = None
+                    if self._take_budget():
+                        self.hedges += 1
+                        logger.info(f"[HEDGE] {log_tag} 首字超过 {deadline * 1000:.0f}ms，发起对冲请求")
+                        attempts.append(_Attempt(1, start_hedge(), queue))
+                    continue
+
+                attempt = attempts[index]
+                if kind == _EVENT:
+                    if is_first_token(payload):
+                        winner = attempt
+                        if index == 0:
+                            self._record_sample(time.monotonic() - attempt.started_at)
+                            if len(attempts) > 1:
+                                self.primary_wins += 1
+                        else:
+                            self.hedge_wins += 1
+                            logger.info(f"[HEDGE] {log_tag} 对冲请求胜出")
+                        await self._cancel_losers(attempts, winner, on_loser)
+                        await on_winner(index)
+                        yield payload
+                    elif index == 0:
+                        yield payload
+                    continue
+
+                attempt.alive = False
+                attempt.elapsed_ms = (time.monotonic() - attempt.started_at) * 1000
+                if kind == _ERROR:
+                    attempt.error = payload
+                    if index != 0:
+                        # 主请求的错误留给调用方的重试逻辑处理（或在对冲胜出后上报）
+                        self.attempt_failures += 1
+                        on_loser(index, payload, attempt.elapsed_ms)
+                if any(a.alive for a in attempts):
+                    continue
+                if attempts[0].error is not None:
+                    raise attempts[0].error
+                return
+
+            # 2. 转发胜出方的后续事件
+            while True:
+                index, kind, payload = await queue.get()
+                if index != winner.index:
+                    continue
+                if kind == _EVENT:
+                    yield payload
+                elif kind == _ERROR:
+                    raise payload
+                else:
+                    return
+        finally:
+            tasks = [a.task for a in attempts if not a.task.done()]
+            for task in tasks:
+                task.cancel()
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _cancel_losers(self, attempts: List[_Attempt], winner: _Attempt, on_loser) -> None:
+        for attempt in attempts:
+            if attempt is winner:
+                continue
+            if not attempt.alive:
+                if attempt.index == 0 and attempt.error is not None:
+                    # 主请求先失败、对冲请求胜出
+                    self.attempt_failures += 1
+                    on_loser(0, attempt.error, attempt.elapsed_ms)
+                continue
+            attempt.alive = False
+            attempt.task.cancel()
+            await asyncio.gather(attempt.task, return_exceptions=True)
+            self.cancelled += 1
+            elapsed_ms = (time.monotonic() - attempt.started_at) * 1000
+            if attempt.index == 0:
+                # 主请求落败：至少这么久还没有首字，作为样本的下限
+                self._record_sample(elapsed_ms / 1000)
+            on_loser(attempt.index, None, elapsed_ms)
+
+    def get_metrics(self) -> dict:
+        deadline = self.deadline()
+        return {
+            "enabled": self._enabled(),
+            "percentile": self._percentile(),
+            "samples": len(self._samples),
+            "deadline_ms": round(deadline * 1000, 1) if deadline is not None else None,
+            "budget_percent": self._budget_percent(),
+            "budget_tokens": round(self._budget, 2),
+            "requests": self.requests,
+            "hedges": self.hedges,
+            "hedge_rate": round(self.hedges / self.requests, 4) if self.requests else 0.0,
+            "hedge_wins": self.hedge_wins,
+            "primary_wins": self.primary_wins,
+            "budget_denied": self.budget_denied,
+            "cancelled": self.cancelled,
+            "attempt_failures": self.attempt_failures,
+        }
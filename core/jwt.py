@@ -9,7 +9,7 @@ import hmac
 import json
 import logging
 import time
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Awaitable, Optional
 
 import httpx
 from fastapi import HTTPException
@@ -63,17 +63,60 @@ class JWTManager:
         self.user_agent = user_agent
         self.jwt: str = ""
         self.expires: float = 0
-        self._lock = asyncio.Lock()
+        # 进行中的刷新：并发请求共享同一个 Future，只发起一次 getoxsrf
+        self._inflight: Optional[asyncio.Future] = None
+        # 刷新指标（供后台刷新器调度与 /admin/metrics 展示）
+        self.issued_at: float = 0
+        self.last_used_at: float = 0
+        self.refresh_count = 0
+        self.last_refresh_ms: float = 0
+        self.consecutive_failures = 0
 
     async def get(self, request_id: str = "") -> str:
-        """获取JWT token（自动刷新）"""
-        async with self._lock:
-            if time.time() > self.expires:
-                await self._refresh(request_id)
+        """获取JWT token（自动刷新）
+
+        token 有效时直接返回（不加锁、不 await）；过期时等待共享的刷新任务。
+        """
+        now = time.time()
+        self.last_used_at = now
+        if now <= self.expires:
             return self.jwt
+        await self._shared_refresh(request_id)
+        return self.jwt
+
+    async def refresh(self, request_id: str = "") -> None:
+        """主动刷新JWT token（后台刷新器调用）"""
+        await self._shared_refresh(request_id)
+
+    def _shared_refresh(self, request_id: str = "") -> Awaitable[None]:
+        """启动或加入进行中的刷新"""
+        if self._inflight is None:
+            self._inflight = asyncio.ensure_future(self._refresh(request_id))
+            self._inflight.add_done_callback(self._on_refresh_done)
+        # shield：某个等待者被取消（客户端断开）时不影响其他等待者共享的刷新
+        return asyncio.shield(self._inflight)
+
+    def _on_refresh_done(self, future: asyncio.Future) -> None:
+        if self._inflight is future:
+            self._inflight = None
+        if not future.cancelled():
+            # 所有等待者都已取消时，避免 "exception was never retrieved" 警告
+            future.exception()
 
     async def _refresh(self, request_id: str = "") -> None:
         """刷新JWT token"""
+        start = time.perf_counter()
+        try:
+            await self._fetch(request_id)
+        except Exception:
+            self.consecutive_failures += 1
+            raise
+        self.consecutive_failures = 0
+        self.refresh_count += 1
+        self.last_refresh_ms = round((time.perf_counter() - start) * 1000, 2)
+
+    async def _fetch(self, request_id: str = "") -> None:
+        """调用 getoxsrf 获取签名密钥并生成JWT"""
         cookie = f"__Secure-C_SES={self.config.secure_c_ses}"
         if self.config.host_c_oses:
             cookie += f"; __Host-C_OSES={self.config.host_c_oses}"
@@ -97,5 +140,6 @@ class JWTManager:
 
         key_bytes = base64.urlsafe_b64decode(data["xsrfToken"] + "==")
         self.jwt      = create_jwt(key_bytes, data["keyId"], self.config.csesidx)
-        self.expires = time.time() + 270
+        self.issued_at = time.time()
+        self.expires = self.issued_at + 270
         logger.info(f"[AUTH] [{self.config.account_id}] {req_tag}JWT 刷新成功")
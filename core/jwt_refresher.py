@@ -0,0 +1,155 @@
+"""JWT 后台刷新
+
+JWTManager.get 在 token 过期后才同步刷新，过期后的第一个请求要在关键路径上等待一次
+getoxsrf，同一账户的并发请求也都会阻塞在锁上。JWTRefresher 在后台为最近活跃的账户
+提前续签：
+
+- 在过期前 lead 秒左右刷新，并叠加随机抖动，避免大量账户在同一时刻集中刷新
+- 刷新失败按指数退避重试，连续失败计入账户错误计数（达到失败阈值后账户被禁用）
+- 长时间未使用的账户不主动刷新，仍由请求路径按需获取
+"""
+import asyncio
+import logging
+import random
+import time
+from typing import TYPE_CHECKING, Callable, Dict, Optional, Tuple
+
+if TYPE_CHECKING:
+    from core.account import AccountManager, MultiAccountManager
+
+logger = logging.getLogger(__name__)
+
+
+class JWTRefresher:
+    """按账户调度的 JWT 预刷新服务
+
+    Args:
+        get_manager: 返回当前的 MultiAccountManager（账户重载后会替换）
+        enabled / lead_seconds / jitter_seconds: 返回配置值，支持热更新
+    """
+
+    TICK_SECONDS = 2.0
+    ACTIVE_WINDOW_SECONDS = 900  # 最近 15 分钟内使用过的账户视为活跃
+    MAX_CONCURRENT_REFRESHES = 4
+    BACKOFF_BASE_SECONDS = 5.0
+    BACKOFF_MAX_SECONDS = 120.0
+
+    def __init__(
+        self,
+        get_manager: Callable[[], "MultiAccountManager"],
+        enabled: Callable[[], bool],
+        lead_seconds: Callable[[], int],
+        jitter_seconds: Callable[[], int],
+    ) -> None:
+        self._get_manager = get_manager
+        self._enabled = enabled
+        self._lead_seconds = lead_seconds
+        self._jitter_seconds = jitter_seconds
+        # account_id -> (已调度的 token 签发时间, 下次刷新时间)
+        self._schedule: Dict[str, Tuple[float, float]] = {}
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._task: Optional[asyncio.Task] = None
+        # 指标
+        self.refreshes = 0
+        self.failures = 0
+
+    def start(self) -> None:
+        if self._task is not None and not self._task.done():
+            return
+        self._semaphore = asyncio.Semaphore(self.MAX_CONCURRENT_REFRESHES)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        tasks = [t for t in (self._task, *self._inflight.values()) if t is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = None
+        self._inflight.clear()
+
+    async def _run(self) -> None:
+        try:
+            while True:
+                await asyncio.sleep(self.TICK_SECONDS)
+                if self._enabled():
+                    self._tick(time.time())
+        except asyncio.CancelledError:
+            logger.info("[AUTH] JWT 后台刷新任务已停止")
+
+    def _next_due(self, expires: float) -> float:
+        return expires - self._lead_seconds() - random.uniform(0, self._jitter_seconds())
+
+    def _backoff(self, failures: int) -> float:
+        delay = min(self.BACKOFF_MAX_SECONDS, self.BACKOFF_BASE_SECONDS * (2 ** max(0, failures - 1)))
+        return delay * random.uniform(0.8, 1.2)
+
+    def _tick(self, now: float) -> None:
+        manager = self._get_manager()
+        for account_id in list(self._schedule):
+            if account_id not in manager.accounts:
+                del self._schedule[account_id]
+        for account_id, account in manager.accounts.items():
+            jwt_manager = account.jwt_manager
+            if jwt_manager is None or account_id in self._inflight:
+                continue
+            if now - jwt_manager.last_used_at > self.ACTIVE_WINDOW_SECONDS:
+                continue
+            if account.config.disabled or not account.is_available:
+                continue
+            scheduled = self._schedule.get(account_id)
+            if scheduled is None or scheduled[0] != jwt_manager.issued_at:
+                # 新签发的 token：按过期时间重新计算下次刷新时间
+                scheduled = (jwt_manager.issued_at, self._next_due(jwt_manager.expires))
+                self._schedule[account_id] = scheduled
+            if now >= scheduled[1]:
+                self._inflight[account_id] = asyncio.create_task(self._refresh(account_id, account))
+
+    async def _refresh(self, account_id: str, account: "AccountManager") -> None:
+        try:
+            async with self._semaphore:
+                jwt_manager = account.get_jwt_manager()
+                try:
+                    await jwt_manager.refresh()
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    self.failures += 1
+                    account.record_jwt_failure(e)
+                    retry_in = self._backoff(jwt_manager.consecutive_failures)
+                    self._schedule[account_id] = (jwt_manager.issued_at, time.time() + retry_in)
+                    logger.warning(f"[AUTH] [{account_id}] JWT 预刷新失败，{retry_in:.0f}秒后重试")
+                    return
+                self.refreshes += 1
+                self._schedule[account_id] = (jwt_manager.issued_at, self._next_due(jwt_manager.expires))
+                account.record_jwt_success()
+                logger.debug(f"[AUTH] [{account_id}] JWT 预刷新完成（{jwt_manager.last_refresh_ms}ms）")
+        finally:
+            self._inflight.pop(account_id, None)
+
+    def get_metrics(self) -> dict:
+        now = time.time()
+        accounts = []
+        for account_id, account in self._get_manager().accounts.items():
+            jwt_manager = account.jwt_manager
+            if jwt_manager is None or not jwt_manager.issued_at:
+                continue
+            scheduled = self._schedule.get(account_id)
+            accounts.append({
+                "account_id": account_id,
+                "token_age_seconds": round(now - jwt_manager.issued_at, 1),
+                "expires_in_seconds": round(jwt_manager.expires - now, 1),
+                "next_refresh_in_seconds": round(scheduled[1] - now, 1) if scheduled else None,
+                "last_refresh_ms": jwt_manager.last_refresh_ms,
+                "refresh_count": jwt_manager.refresh_count,
+                "consecutive_failures": jwt_manager.consecutive_failures,
+            })
+        return {
+            "enabled": self._enabled(),
+            "lead_seconds": self._lead_seconds(),
+            "jitter_seconds": self._jitter_seconds(),
+            "refreshes": self.refreshes,
+            "failures": self.failures,
+            "inflight": len(self._inflight),
+            "accounts": accounts,
+        }
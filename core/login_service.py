@@ -4,10 +4,9 @@ import os
 import time
 import uuid
 from dataclasses import dataclass, field
-from datetime import datetime, timedelta, timezone
 from typing import Any, Callable, Dict, List, Optional
 
-from core.account import load_accounts_from_source
+from core.account import load_accounts_from_source, parse_expires_at
 from core.base_task_service import BaseTask, BaseTaskService, TaskStatus
 from core.config import config
 from core.duckmail_client import DuckMailClient
@@ -211,8 +210,9 @@ class LoginService(BaseTaskService[LoginTask]):
     def _get_expiring_accounts(self) -> List[str]:
         accounts = load_accounts_from_source()
         expiring = []
-        beijing_tz = timezone(timedelta(hours=8))
-        now = datetime.now(beijing_tz)
+        now = time.time()
+        # 复用内存中账户配置已解析的过期时间，只有新增或变更的账户才需要重新解析
+        loaded = self.multi_account_mgr.accounts if self.multi_account_mgr else {}
 
         for account in accounts:
             if account.get("disabled"):
@@ -235,12 +235,14 @@ class LoginService(BaseTaskService[LoginTask]):
             if not expires_at:
                 continue
 
-            try:
-                expire_time = datetime.strptime(expires_at, "%Y-%m-%d %H:%M:%S")
-                expire_time = expire_time.replace(tzinfo=beijing_tz)
-                remaining = (expire_time - now).total_seconds() / 3600
-            except Exception:
+            account_mgr = loaded.get(account.get("id"))
+            if account_mgr is not None and account_mgr.config.expires_at == expires_at:
+                expires_ts = account_mgr.config.expires_ts
+            else:
+                expires_ts = parse_expires_at(expires_at)
+            if expires_ts is None:
                 continue
+            remaining = (expires_ts - now) / 3600
 
             if remaining <= config.basic.refresh_window_hours:
                 expiring.append(account.get("id"))
@@ -3,21 +3,43 @@
 负责消息的解析、文本提取和会话指纹生成
 """
 import asyncio
-import base64
 import hashlib
 import logging
 import re
-from typing import List, TYPE_CHECKING
+from typing import List, Sequence, TYPE_CHECKING, Union
 
 import httpx
+from fastapi import HTTPException
+
+from core.attachments import Attachment, AttachmentBudget, close_attachments, download_attachment
 
 if TYPE_CHECKING:
     from main import Message
 
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
 logger = logging.getLogger(__name__)
 
 
-def get_conversation_key(messages: List[dict], client_identifier: str = "") -> str:
+# 对话指纹的哈希算法：md5（默认，与已持久化的会话绑定兼容）或 xxh3（更快，需安装 xxhash）
+CONVERSATION_KEY_HASHES = ("md5", "xxh3")
+FINGERPRINT_MESSAGES = 3
+
+
+def _new_hasher(algorithm: str):
+    if algorithm == "xxh3" and xxhash is not None:
+        return xxhash.xxh3_128()
+    return hashlib.md5()
+
+
+def get_conversation_key(
+    messages: Sequence[Union['Message', dict]],
+    client_identifier: str = "",
+    algorithm: str = "md5",
+) -> str:
     """
     生成对话指纹（使用前3条消息+客户端标识，确保唯一性）
 
@@ -26,38 +48,40 @@ def get_conversation_key(messages: List[dict], client_identifier: str = "") -> s
     2. 加入客户端标识（IP或request_id）避免不同用户冲突
     3. 保持Session复用能力（同一用户的后续消息仍能找到同一Session）
 
+    直接读取 Message 对象（也兼容 dict），只处理前3条消息的文本部分并逐条写入哈希，
+    不复制整个对话，图片等非文本部分直接跳过。md5 结果与旧实现
+    （拼接 "客户端标识|role:text|..." 后整体计算）完全一致。
+
     Args:
-        messages: 消息列表
+        messages: 消息列表（Message 对象或 dict）
         client_identifier: 客户端标识（如IP地址或request_id），用于区分不同用户
+        algorithm: 哈希算法，见 CONVERSATION_KEY_HASHES；未安装 xxhash 时回退到 md5
     """
     if not messages:
         return f"{client_identifier}:empty" if client_identifier else "empty"
 
-    # 提取前3条消息的关键信息（角色+内容）
-    message_fingerprints = []
-    for msg in messages[:3]:  # 只取前3条
-        role = msg.get("role", "")
-        content = msg.get("content", "")
+    hasher = _new_hasher(algorithm)
+    if client_identifier:
+        hasher.update(f"{client_identifier}|".encode())
 
-        # 统一处理内容格式（字符串或数组）
-        if isinstance(content, list):
-            # 多模态消息：只提取文本部分
-            text = extract_text_from_content(content)
+    for index, msg in enumerate(messages[:FINGERPRINT_MESSAGES]):
+        if isinstance(msg, dict):
+            role = msg.get("role", "")
+            content = msg.get("content", "")
         else:
-            text = str(content)
+            role = msg.role
+            content = msg.content
+
+        # 统一处理内容格式（字符串或数组），多模态消息只提取文本部分
+        text = extract_text_from_content(content)
 
         # 标准化：去除首尾空白，转小写
         text = text.strip().lower()
 
-        # 组合角色和内容
-        message_fingerprints.append(f"{role}:{text}")
-
-    # 使用前3条消息+客户端标识生成指纹
-    conversation_prefix = "|".join(message_fingerprints)
-    if client_identifier:
-        conversation_prefix = f"{client_identifier}|{conversation_prefix}"
+        separator = "|" if index else ""
+        hasher.update(f"{separator}{role}:{text}".encode())
 
-    return hashlib.md5(conversation_prefix.encode()).hexdigest()
+    return hasher.hexdigest()
 
 
 def extract_text_from_content(content) -> str:
@@ -75,7 +99,14 @@ def extract_text_from_content(content) -> str:
 
 
 async def parse_last_message(messages: List['Message'], http_client: httpx.AsyncClient, request_id: str = ""):
-    """解析最后一条消息，分离文本和文件（支持图片、PDF、文档等，base64 和 URL）"""
+    """解析最后一条消息，分离文本和文件（支持图片、PDF、文档等，base64 和 URL）
+
+    Returns:
+        (文本, List[Attachment])；调用方负责在请求结束后关闭附件
+
+    Raises:
+        HTTPException(413): 附件超过大小限制
+    """
     if not messages:
         return "", []
 
@@ -83,8 +114,9 @@ async def parse_last_message(messages: List['Message'], http_client: httpx.Async
     content = last_msg.content
 
     text_content = ""
-    images = [] # List of {"mime": str, "data": str_base64} - 兼容变量名，实际支持所有文件
+    images: List[Attachment] = []  # 兼容变量名，实际支持所有文件
     image_urls = []  # 需要下载的 URL - 兼容变量名，实际支持所有文件
+    budget = AttachmentBudget.from_config()
 
     if isinstance(content, str):
         text_content = content
@@ -97,7 +129,9 @@ async def parse_last_message(messages: List['Message'], http_client: httpx.Async
                 # 解析 Data URI: data:mime/type;base64,xxxxxx (支持所有 MIME 类型)
                 match = re.match(r"data:([^;]+);base64,(.+)", url)
                 if match:
-                    images.append({"mime": match.group(1), "data": match.group(2)})
+                    attachment = Attachment.from_base64(match.group(1), match.group(2))
+                    budget.check(attachment.size)
+                    images.append(attachment)
                 elif url.startswith(("http://", "https://")):
                     image_urls.append(url)
                 else:
@@ -107,16 +141,9 @@ async def parse_last_message(messages: List['Message'], http_client: httpx.Async
     if image_urls:
         async def download_url(url: str):
             try:
-                resp = await http_client.get(url, timeout=30, follow_redirects=True)
-                if resp.status_code == 404:
-                    logger.warning(f"[FILE] [req_{request_id}] URL文件已失效(404)，已跳过: {url[:50]}...")
-                    return None
-                resp.raise_for_status()
-                content_type = resp.headers.get("content-type", "application/octet-stream").split(";")[0]
-                # 移除图片类型限制，支持所有文件类型
-                b64 = base64.b64encode(resp.content).decode()
-                logger.info(f"[FILE] [req_{request_id}] URL文件下载成功: {url[:50]}... ({len(resp.content)} bytes, {content_type})")
-                return {"mime": content_type, "data": b64}
+                return await download_attachment(http_client, url, budget, request_id)
+            except HTTPException:
+                raise
             except httpx.HTTPStatusError as e:
                 status_code = e.response.status_code if e.response else "unknown"
                 logger.warning(f"[FILE] [req_{request_id}] URL文件下载失败({status_code}): {url[:50]}... - {e}")
@@ -126,13 +153,20 @@ async def parse_last_message(messages: List['Message'], http_client: httpx.Async
                 return None
 
         results = await asyncio.gather(*[download_url(u) for u in image_urls], return_exceptions=True)
-        safe_results = []
+        too_large = None
         for result in results:
+            if isinstance(result, HTTPException):
+                too_large = too_large or result
+                continue
             if isinstance(result, Exception):
                 logger.warning(f"[FILE] [req_{request_id}] URL文件下载异常: {type(result).__name__}: {str(result)[:120]}")
                 continue
-            safe_results.append(result)
-        images.extend([r for r in safe_results if r])
+            if result:
+                images.append(result)
+        if too_large is not None:
+            close_attachments(images)
+            logger.warning(f"[FILE] [req_{request_id}] {too_large.detail}")
+            raise too_large
 
     return text_content, images
 
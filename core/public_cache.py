@@ -0,0 +1,80 @@
+"""公开端点响应缓存
+
+状态页会被大量访客轮询。这里按 key 缓存预先序列化好的 JSON 字节，在短 TTL 内直接复用，
+并基于内容哈希生成 ETag，客户端带 If-None-Match 且内容未变化时返回 304。
+"""
+import hashlib
+import time
+from typing import Any, Callable, Dict, Hashable, NamedTuple
+
+from fastapi import Request, Response
+
+from util import json_codec
+
+
+class CachedResponse(NamedTuple):
+    body: bytes
+    etag: str
+    expires_at: float
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+class PublicResponseCache:
+    """短 TTL 的 JSON 响应缓存（仅在事件循环线程内使用，无需加锁）"""
+
+    def __init__(self, max_entries: int = 64) -> None:
+        self.max_entries = max_entries
+        self._entries: Dict[Hashable, CachedResponse] = {}
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def get(self, key: Hashable, ttl: float, builder: Callable[[], Any]) -> CachedResponse:
+        """返回缓存的响应；过期或不存在时调用 builder 重新生成"""
+        now = time.time()
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires_at > now:
+            self.hits += 1
+            return entry
+        self.misses += 1
+        body = json_codec.dumps(builder())
+        etag = '"' + hashlib.blake2b(body, digest_size=8).hexdigest() + '"'
+        entry = CachedResponse(body, etag, now + ttl)
+        if key not in self._entries and len(self._entries) >= self.max_entries:
+            self._entries.clear()
+        self._entries[key] = entry
+        return entry
+
+    def respond(self, request: Request, key: Hashable, ttl: float, builder: Callable[[], Any]) -> Response:
+        """生成带 ETag 的响应，内容未变化时返回 304"""
+        entry = self.get(key, ttl, builder)
+        headers = {"ETag": entry.etag, "Cache-Control": f"public, max-age={int(ttl)}"}
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and _etag_matches(if_none_match, entry.etag):
+            self.not_modified += 1
+            return Response(status_code=304, headers=headers)
+        return Response(content=entry.body, media_type="application/json", headers=headers)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def get_metrics(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "not_modified": self.not_modified,
+        }
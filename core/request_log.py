@@ -0,0 +1,120 @@
+"""请求事件索引
+
+对话请求在生命周期的关键节点（开始、选择账户、重试、切换账户、完成/失败）
+直接写入按 request_id 索引的结构化记录，公开日志与管理面板按需读取最近 N 条，
+不再从文本日志中用正则回溯提取。
+"""
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone, timedelta
+from typing import List, Optional
+
+BEIJING_TZ = timezone(timedelta(hours=8))
+
+
+def _format_time(ts: float) -> str:
+    return datetime.fromtimestamp(ts, tz=BEIJING_TZ).strftime("%Y-%m-%d %H:%M:%S")
+
+
+class RequestEventLog:
+    """按 request_id 索引的请求事件记录（按开始时间先后排列，超出容量淘汰最旧的）"""
+
+    def __init__(self, capacity: int = 1000) -> None:
+        self.capacity = capacity
+        self._records: "OrderedDict[str, dict]" = OrderedDict()
+
+    def start(self, request_id: str, model: Optional[str], message_count: Optional[int], ts: Optional[float] = None) -> None:
+        """记录请求开始"""
+        ts = time.time() if ts is None else ts
+        if model:
+            content = f"{model} | {message_count}条消息" if message_count else model
+        else:
+            content = "请求处理中"
+        start_time = _format_time(ts)
+        self._records[request_id] = {
+            "request_id": request_id,
+            "start_time": start_time,
+            "start_ts": ts,
+            "status": "in_progress",
+            "events": [{"time": start_time, "type": "start", "content": content}],
+            # 内部计数，输出时去掉
+            "_selects": 0,
+            "_retries": 0,
+        }
+        while len(self._records) > self.capacity:
+            self._records.popitem(last=False)
+
+    def _append(self, request_id: str, event: dict) -> Optional[dict]:
+        record = self._records.get(request_id)
+        if record is None:
+            return None
+        record["events"].append({"time": _format_time(time.time()), **event})
+        return record
+
+    def select(self, request_id: str) -> None:
+        """新会话选择账户（首次为"选择服务节点"，之后为"切换服务节点"）"""
+        record = self._records.get(request_id)
+        if record is None:
+            return
+        record["_selects"] += 1
+        if record["_selects"] == 1:
+            self._append(request_id, {"type": "select", "content": "选择服务节点"})
+        else:
+            self._append(request_id, {"type": "switch", "content": "切换服务节点"})
+
+    def retry(self, request_id: str) -> None:
+        """创建会话失败，准备重试"""
+        record = self._records.get(request_id)
+        if record is None:
+            return
+        record["_retries"] += 1
+        self._append(request_id, {"type": "retry", "content": f"服务异常，正在重试（{record['_retries']}）"})
+
+    def switch(self, request_id: str) -> None:
+        """请求失败后切换到其他账户"""
+        self._append(request_id, {"type": "switch", "content": "切换服务节点"})
+
+    def hedge(self, request_id: str) -> None:
+        """首字超时，在其他账户上发起对冲请求"""
+        self._append(request_id, {"type": "hedge", "content": "响应较慢，同时请求备用节点"})
+
+    def hedge_cancelled(self, request_id: str, primary: bool, elapsed_ms: float) -> None:
+        """对冲中落败的一方被取消（没有完成请求，不计入可用性统计）"""
+        role = "主节点" if primary else "备用节点"
+        self._append(request_id, {
+            "type": "hedge_cancelled",
+            "content": f"{role}响应较慢，已取消 | 等待{elapsed_ms / 1000:.2f}s",
+        })
+
+    def complete(self, request_id: str, status: str, duration_s: Optional[float] = None) -> None:
+        """记录最终结果（status: success / error / timeout）"""
+        if status == "success":
+            content = f"响应完成 | 耗时{duration_s:.2f}s" if duration_s is not None else "响应完成"
+        elif status == "timeout":
+            content = "请求超时"
+        else:
+            status = "error"
+            content = "请求失败"
+        record = self._append(request_id, {"type": "complete", "status": status, "content": content})
+        if record is not None:
+            record["status"] = status
+
+    def recent(self, limit: int = 100) -> List[dict]:
+        """最近 limit 条请求（新的在前，含 start_ts），复杂度 O(limit)"""
+        result = []
+        for record in reversed(self._records.values()):
+            if len(result) >= limit:
+                break
+            result.append({
+                "request_id": record["request_id"],
+                "start_time": record["start_time"],
+                "start_ts": record["start_ts"],
+                "status": record["status"],
+                "events": list(record["events"]),
+            })
+        return result
+
+    def clear(self) -> int:
+        count = len(self._records)
+        self._records.clear()
+        return count
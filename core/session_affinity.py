@@ -0,0 +1,298 @@
+"""会话亲和性持久化
+
+对话指纹 -> (账户, Google Session) 的绑定默认只保存在进程内存（SessionCache）中，重启或
+多 worker 部署时会丢失，继续对话只能新建 Session 并重发全部上下文。这里提供可插拔的持久化后端：
+
+- memory：不持久化（默认，与之前行为一致）
+- sqlite：本地 SQLite 文件，重启后可继续使用原 Session
+- postgres：复用 storage 模块的 PostgreSQL 连接池，多实例共享
+
+SessionCache 作为一级缓存，变更由 SessionAffinityStore 合并后在后台批量写入后端；
+一级缓存未命中时再回源查询后端。
+"""
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from core import storage
+
+logger = logging.getLogger(__name__)
+
+AFFINITY_BACKENDS = ("memory", "sqlite", "postgres")
+
+
+class AffinityBackend:
+    """后端接口（同步方法，由 SessionAffinityStore 在线程池中调用）；基类即 memory 后端"""
+
+    name = "memory"
+    persistent = False
+
+    def lookup(self, conv_key: str, min_updated_at: float) -> Optional[dict]:
+        return None
+
+    def apply(self, upserts: List[Tuple[str, str, str, float]], deletes: List[str], account_ids: List[str]) -> None:
+        pass
+
+    def purge(self, before: float) -> int:
+        return 0
+
+    def close(self) -> None:
+        pass
+
+
+class SqliteAffinityBackend(AffinityBackend):
+    """SQLite 文件后端"""
+
+    name = "sqlite"
+    persistent = True
+
+    def __init__(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS session_affinity (
+                conv_key TEXT PRIMARY KEY,
+                account_id TEXT NOT NULL,
+                session_id TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_session_affinity_account ON session_affinity (account_id)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_session_affinity_updated ON session_affinity (updated_at)")
+        self._conn.commit()
+
+    def lookup(self, conv_key: str, min_updated_at: float) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT account_id, session_id, updated_at FROM session_affinity WHERE conv_key = ? AND updated_at >= ?",
+                (conv_key, min_updated_at),
+            ).fetchone()
+        if row is None:
+            return None
+        return {"account_id": row[0], "session_id": row[1], "updated_at": row[2]}
+
+    def apply(self, upserts: List[Tuple[str, str, str, float]], deletes: List[str], account_ids: List[str]) -> None:
+        with self._lock, self._conn:
+            # 先按账户失效，同一批次里更新的绑定不会被误删
+            if account_ids:
+                self._conn.executemany("DELETE FROM session_affinity WHERE account_id = ?", [(a,) for a in account_ids])
+            if deletes:
+                self._conn.executemany("DELETE FROM session_affinity WHERE conv_key = ?", [(k,) for k in deletes])
+            if upserts:
+                self._conn.executemany(
+                    """
+                    INSERT INTO session_affinity (conv_key, account_id, session_id, updated_at)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT (conv_key) DO UPDATE SET
+                        account_id = excluded.account_id,
+                        session_id = excluded.session_id,
+                        updated_at = excluded.updated_at
+                    """,
+                    upserts,
+                )
+
+    def purge(self, before: float) -> int:
+        with self._lock, self._conn:
+            return self._conn.execute("DELETE FROM session_affinity WHERE updated_at < ?", (before,)).rowcount
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class PostgresAffinityBackend(AffinityBackend):
+    """PostgreSQL 后端（复用 storage 连接池）"""
+
+    name = "postgres"
+    persistent = True
+
+    def lookup(self, conv_key: str, min_updated_at: float) -> Optional[dict]:
+        return storage.affinity_lookup_sync(conv_key, min_updated_at)
+
+    def apply(self, upserts: List[Tuple[str, str, str, float]], deletes: List[str], account_ids: List[str]) -> None:
+        storage.affinity_apply_sync(upserts, deletes, account_ids)
+
+    def purge(self, before: float) -> int:
+        return storage.affinity_purge_sync(before)
+
+
+def create_backend(name: str, data_dir: str) -> AffinityBackend:
+    """按配置创建后端；不可用时回退到 memory"""
+    name = (name or "memory").lower()
+    try:
+        if name == "sqlite":
+            return SqliteAffinityBackend(os.path.join(data_dir, "session_affinity.db"))
+        if name == "postgres":
+            if storage.is_database_enabled():
+                return PostgresAffinityBackend()
+            logger.warning("[AFFINITY] 未配置 DATABASE_URL，会话亲和性回退到内存模式")
+        elif name != "memory":
+            logger.warning(f"[AFFINITY] 未知的会话亲和性后端: {name}，回退到内存模式")
+    except Exception as e:
+        logger.error(f"[AFFINITY] 初始化 {name} 后端失败，回退到内存模式: {e}")
+    return AffinityBackend()
+
+
+class SessionAffinityStore:
+    """会话绑定的写回与回源查询
+
+    Args:
+        backend: 持久化后端
+        ttl: 绑定有效期（秒），返回值支持热更新
+        flush_interval: 批量写回间隔（秒）
+    """
+
+    PURGE_INTERVAL_SECONDS = 600
+
+    def __init__(self, backend: AffinityBackend, ttl, flush_interval: float = 2.0) -> None:
+        self.backend = backend
+        self._ttl = ttl
+        self._flush_interval = flush_interval
+        # 待写回的变更：conv_key -> (account_id, session_id, updated_at)，None 表示删除
+        self._pending: Dict[str, Optional[Tuple[str, str, float]]] = {}
+        self._pending_accounts: Set[str] = set()
+        self._task: Optional[asyncio.Task] = None
+        self._last_purge = 0.0
+        # 指标
+        self.lookups = 0
+        self.lookup_hits = 0
+        self.lookup_errors = 0
+        self.flush_count = 0
+        self.flush_errors = 0
+        self.written = 0
+        self.invalidated_accounts = 0
+
+    @property
+    def persistent(self) -> bool:
+        return self.backend.persistent
+
+    # ---------- 记录变更（事件循环线程内，O(1)） ----------
+
+    def record(self, conv_key: str, entry: dict) -> None:
+        if self.persistent:
+            self._pending[conv_key] = (entry["account_id"], entry["session_id"], entry["updated_at"])
+
+    def record_delete(self, conv_key: str) -> None:
+        if self.persistent:
+            self._pending[conv_key] = None
+
+    def invalidate_accounts(self, account_ids: Iterable[str]) -> None:
+        """删除指定账户的全部绑定"""
+        if not self.persistent:
+            return
+        account_ids = set(account_ids)
+        if not account_ids:
+            return
+        self._pending_accounts |= account_ids
+        # 尚未写回的旧绑定直接丢弃
+        for conv_key, value in list(self._pending.items()):
+            if value is not None and value[0] in account_ids:
+                del self._pending[conv_key]
+        self.invalidated_accounts += len(account_ids)
+
+    # ---------- 回源查询 ----------
+
+    async def lookup(self, conv_key: str) -> Optional[dict]:
+        if not self.persistent:
+            return None
+        pending = self._pending.get(conv_key, ())
+        if pending is None:
+            return None
+        self.lookups += 1
+        if pending:
+            # 尚未写回的绑定
+            account_id, session_id, updated_at = pending
+            if time.time() - updated_at > self._ttl():
+                return None
+            self.lookup_hits += 1
+            return {"account_id": account_id, "session_id": session_id, "updated_at": updated_at}
+        try:
+            entry = await asyncio.to_thread(self.backend.lookup, conv_key, time.time() - self._ttl())
+        except Exception as e:
+            self.lookup_errors += 1
+            logger.error(f"[AFFINITY] 查询会话绑定失败: {e}")
+            return None
+        if entry is not None:
+            self.lookup_hits += 1
+        return entry
+
+    # ---------- 后台写回 ----------
+
+    def start(self) -> None:
+        if not self.persistent or (self._task is not None and not self._task.done()):
+            return
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        try:
+            while True:
+                await asyncio.sleep(self._flush_interval)
+                await self.flush()
+        except asyncio.CancelledError:
+            logger.info("[AFFINITY] 后台写回任务已停止")
+
+    async def flush(self) -> None:
+        now = time.time()
+        if self._pending or self._pending_accounts:
+            pending, self._pending = self._pending, {}
+            accounts, self._pending_accounts = self._pending_accounts, set()
+            upserts = [(key, *value) for key, value in pending.items() if value is not None]
+            deletes = [key for key, value in pending.items() if value is None]
+            try:
+                await asyncio.to_thread(self.backend.apply, upserts, deletes, sorted(accounts))
+                self.flush_count += 1
+                self.written += len(pending)
+            except Exception as e:
+                self.flush_errors += 1
+                logger.error(f"[AFFINITY] 写回会话绑定失败: {e}")
+                # 放回队列，期间产生的新变更优先；写回期间被失效的账户的绑定不再放回
+                invalidated = self._pending_accounts
+                for key, value in pending.items():
+                    if value is not None and value[0] in invalidated:
+                        continue
+                    self._pending.setdefault(key, value)
+                self._pending_accounts |= accounts
+        if now - self._last_purge >= self.PURGE_INTERVAL_SECONDS:
+            self._last_purge = now
+            try:
+                removed = await asyncio.to_thread(self.backend.purge, now - self._ttl())
+                if removed:
+                    logger.info(f"[AFFINITY] 清理 {removed} 个过期会话绑定")
+            except Exception as e:
+                logger.error(f"[AFFINITY] 清理过期会话绑定失败: {e}")
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.persistent:
+            await self.flush()
+            await asyncio.to_thread(self.backend.close)
+
+    def get_metrics(self) -> dict:
+        return {
+            "backend": self.backend.name,
+            "pending": len(self._pending),
+            "pending_account_invalidations": len(self._pending_accounts),
+            "lookups": self.lookups,
+            "lookup_hits": self.lookup_hits,
+            "lookup_errors": self.lookup_errors,
+            "flush_count": self.flush_count,
+            "flush_errors": self.flush_errors,
+            "written": self.written,
+            "invalidated_accounts": self.invalidated_accounts,
+        }
@@ -0,0 +1,204 @@
+"""会话缓存
+
+对话指纹 -> {account_id, session_id, updated_at} 的映射：
+- OrderedDict 维护最近使用顺序，超出容量时 O(1) 淘汰最久未使用的条目
+- 哈希时间轮管理 TTL：条目按到期时间挂到对应槽位，时间推进时只检查到期槽位，
+  不再定期全量扫描；读取时也会惰性检查是否过期
+- 可挂接 SessionAffinityStore，写入/刷新/删除同步记录到持久化后端
+  （容量淘汰与过期不会删除后端数据，后端按 TTL 自行清理）
+"""
+import logging
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, List, Optional, Set
+
+if TYPE_CHECKING:
+    from core.session_affinity import SessionAffinityStore
+
+logger = logging.getLogger(__name__)
+
+
+class SessionCache:
+    """带 TTL 的 LRU 会话缓存（仅在事件循环线程内使用）"""
+
+    def __init__(self, ttl_seconds: int, capacity: int, tick_seconds: int = 10, wheel_size: int = 512) -> None:
+        self.ttl = ttl_seconds
+        self._capacity = capacity
+        self._tick_seconds = tick_seconds
+        self._entries: "OrderedDict[str, dict]" = OrderedDict()
+        # 时间轮：槽位 -> 到期落在该槽的 key 集合
+        self._wheel: List[Set[str]] = [set() for _ in range(wheel_size)]
+        self._slot_of: Dict[str, int] = {}
+        self._tick = int(time.time() // tick_seconds)
+        self.store: Optional["SessionAffinityStore"] = None
+        # 指标
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    # ---------- 容量 ----------
+
+    @property
+    def capacity(self) -> int:
+        return self._capacity
+
+    @capacity.setter
+    def capacity(self, value: int) -> None:
+        self._capacity = value
+        self._evict_overflow()
+
+    def _evict_overflow(self) -> None:
+        while len(self._entries) > self._capacity:
+            key, _ = self._entries.popitem(last=False)
+            self._unschedule(key)
+            self.evictions += 1
+
+    # ---------- 时间轮 ----------
+
+    def _slot_for(self, updated_at: float) -> int:
+        deadline_tick = int((updated_at + self.ttl) // self._tick_seconds) + 1
+        return deadline_tick % len(self._wheel)
+
+    def _schedule(self, key: str, updated_at: float) -> None:
+        slot = self._slot_for(updated_at)
+        old = self._slot_of.get(key)
+        if old == slot:
+            return
+        if old is not None:
+            self._wheel[old].discard(key)
+        self._wheel[slot].add(key)
+        self._slot_of[key] = slot
+
+    def _unschedule(self, key: str) -> None:
+        slot = self._slot_of.pop(key, None)
+        if slot is not None:
+            self._wheel[slot].discard(key)
+
+    def _is_expired(self, entry: dict, now: float) -> bool:
+        return now - entry["updated_at"] > self.ttl
+
+    def expire(self, now: Optional[float] = None) -> int:
+        """推进时间轮，删除已到期的条目，返回删除数量"""
+        now = time.time() if now is None else now
+        target = int(now // self._tick_seconds)
+        if target <= self._tick:
+            return 0
+        # 超过一整圈时每个槽位只需处理一次
+        start = max(self._tick + 1, target - len(self._wheel) + 1)
+        self._tick = target
+        removed = 0
+        for tick in range(start, target + 1):
+            slot = self._wheel[tick % len(self._wheel)]
+            for key in list(slot):
+                entry = self._entries.get(key)
+                if entry is None:
+                    slot.discard(key)
+                    self._slot_of.pop(key, None)
+                elif self._is_expired(entry, now):
+                    del self._entries[key]
+                    self._unschedule(key)
+                    removed += 1
+                else:
+                    # 尚未到期（属于后续轮次或 TTL 被调大）：放回正确的槽位
+                    self._schedule(key, entry["updated_at"])
+        if removed:
+            self.expirations += removed
+            logger.info(f"[CACHE] 清理 {removed} 个过期会话缓存")
+        return removed
+
+    # ---------- 读写 ----------
+
+    def get(self, key: str) -> Optional[dict]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        if self._is_expired(entry, time.time()):
+            del self._entries[key]
+            self._unschedule(key)
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry
+
+    def set(self, key: str, account_id: str, session_id: str) -> None:
+        entry = self.restore(key, account_id, session_id, time.time())
+        if self.store is not None:
+            self.store.record(key, entry)
+
+    def restore(self, key: str, account_id: str, session_id: str, updated_at: float) -> dict:
+        """写入条目但不记录到持久化后端（用于从后端回填）"""
+        entry = {"account_id": account_id, "session_id": session_id, "updated_at": updated_at}
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        self._schedule(key, updated_at)
+        self.expire(time.time())
+        self._evict_overflow()
+        return entry
+
+    def touch(self, key: str) -> None:
+        """刷新条目的最近使用时间（O(1)）"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return
+        now = time.time()
+        entry["updated_at"] = now
+        self._entries.move_to_end(key)
+        self._schedule(key, now)
+        if self.store is not None:
+            self.store.record(key, entry)
+
+    def pop(self, key: str) -> Optional[dict]:
+        self._unschedule(key)
+        if self.store is not None:
+            self.store.record_delete(key)
+        return self._entries.pop(key, None)
+
+    def remove_accounts(self, account_ids: Iterable[str]) -> int:
+        """删除绑定到指定账户的全部条目（包括持久化后端），返回内存中删除的数量"""
+        account_ids = set(account_ids)
+        if not account_ids:
+            return 0
+        keys = [key for key, entry in self._entries.items() if entry["account_id"] in account_ids]
+        for key in keys:
+            del self._entries[key]
+            self._unschedule(key)
+        if self.store is not None:
+            self.store.invalidate_accounts(account_ids)
+        return len(keys)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._slot_of.clear()
+        for slot in self._wheel:
+            slot.clear()
+
+    def keys(self):
+        return self._entries.keys()
+
+    def items(self):
+        return self._entries.items()
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._entries)
+
+    def get_metrics(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "capacity": self._capacity,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
@@ -0,0 +1,103 @@
+"""对话级锁
+
+同一对话的并发请求需要串行化（共享同一个 Google Session）。SessionLockRegistry 按需为
+对话创建锁并记录引用计数（持有者 + 等待者），最后一个引用退出时删除锁：
+- 锁只会在无人持有、无人等待时被删除，不存在"等待中的锁被清理"的问题
+- 注册表大小等于当前活跃对话数，无需定期清理
+- 只在事件循环线程内使用，字典操作之间没有 await，因此不需要全局锁
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict
+
+
+class _LockEntry:
+    __slots__ = ("lock", "refs")
+
+    def __init__(self) -> None:
+        self.lock = asyncio.Lock()
+        self.refs = 0
+
+
+class SessionLockRegistry:
+    """引用计数的对话锁注册表"""
+
+    def __init__(self, max_tracked_conversations: int = 100) -> None:
+        self._entries: Dict[str, _LockEntry] = {}
+        # 最近发生竞争的对话：conv_key -> {"contended", "wait_total", "wait_max"}
+        self._contention: "OrderedDict[str, dict]" = OrderedDict()
+        self._max_tracked = max_tracked_conversations
+        # 指标
+        self.acquisitions = 0
+        self.contended = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    @asynccontextmanager
+    async def hold(self, conv_key: str) -> AsyncIterator[None]:
+        """持有指定对话的锁"""
+        entry = self._entries.get(conv_key)
+        if entry is None:
+            entry = self._entries[conv_key] = _LockEntry()
+        entry.refs += 1
+        try:
+            if entry.refs > 1:
+                # 已有其他持有者或等待者
+                start = time.perf_counter()
+                await entry.lock.acquire()
+                self._record_wait(conv_key, time.perf_counter() - start)
+            else:
+                await entry.lock.acquire()
+            self.acquisitions += 1
+            try:
+                yield
+            finally:
+                entry.lock.release()
+        finally:
+            # 等待期间被取消也会走到这里，保证引用计数正确
+            entry.refs -= 1
+            if entry.refs == 0 and self._entries.get(conv_key) is entry:
+                del self._entries[conv_key]
+
+    def _record_wait(self, conv_key: str, waited: float) -> None:
+        self.contended += 1
+        self.wait_total += waited
+        self.wait_max = max(self.wait_max, waited)
+
+        stats = self._contention.get(conv_key)
+        if stats is None:
+            stats = self._contention[conv_key] = {"contended": 0, "wait_total": 0.0, "wait_max": 0.0}
+            if len(self._contention) > self._max_tracked:
+                self._contention.popitem(last=False)
+        else:
+            self._contention.move_to_end(conv_key)
+        stats["contended"] += 1
+        stats["wait_total"] += waited
+        stats["wait_max"] = max(stats["wait_max"], waited)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get_metrics(self, top: int = 10) -> dict:
+        busiest = sorted(self._contention.items(), key=lambda item: item[1]["wait_total"], reverse=True)[:top]
+        return {
+            "active_locks": len(self._entries),
+            "waiters": sum(entry.refs - 1 for entry in self._entries.values()),
+            "acquisitions": self.acquisitions,
+            "contended": self.contended,
+            "contention_rate": round(self.contended / self.acquisitions, 4) if self.acquisitions else 0.0,
+            "wait_total_ms": round(self.wait_total * 1000, 2),
+            "wait_avg_ms": round(self.wait_total * 1000 / self.contended, 2) if self.contended else 0.0,
+            "wait_max_ms": round(self.wait_max * 1000, 2),
+            "top_contended": [
+                {
+                    "conversation": conv_key[:12],
+                    "contended": stats["contended"],
+                    "wait_total_ms": round(stats["wait_total"] * 1000, 2),
+                    "wait_max_ms": round(stats["wait_max"] * 1000, 2),
+                }
+                for conv_key, stats in busiest
+            ],
+        }
@@ -0,0 +1,195 @@
+"""预热 Session 池
+
+新对话和账户切换都要先调用 widgetCreateSession 才能开始对话，这一步直接计入首字延迟。
+WarmSessionPool 按账户在后台预先创建少量未使用的 Session：
+
+- 每个账户的目标数量按最近的取用频率（指数衰减计数）估算，不超过配置上限
+- Session 超过最大存活时间后丢弃；账户凭据变化后旧 Session 不再使用
+- 取用时命中则立即返回，未命中由调用方按原流程同步创建
+"""
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+from typing import TYPE_CHECKING, Awaitable, Callable, Deque, Dict, Optional, Tuple
+
+from core.account import session_identity
+
+if TYPE_CHECKING:
+    from core.account import AccountManager, MultiAccountManager
+
+logger = logging.getLogger(__name__)
+
+
+class _AccountSlots:
+    __slots__ = ("sessions", "demand", "demand_at", "filling")
+
+    def __init__(self) -> None:
+        # (session_name, 创建时间, 账户凭据快照)
+        self.sessions: Deque[Tuple[str, float, tuple]] = deque()
+        self.demand = 0.0
+        self.demand_at = 0.0
+        self.filling = 0
+
+
+class WarmSessionPool:
+    """按账户的预热 Session 池
+
+    Args:
+        get_manager: 返回当前的 MultiAccountManager
+        create_session: 为账户创建一个 Google Session，返回 session name
+        enabled / max_per_account / max_age_seconds: 返回配置值，支持热更新
+    """
+
+    TICK_SECONDS = 5.0
+    DEMAND_DECAY_SECONDS = 300.0  # 取用频率的衰减时间常数
+    LOOKAHEAD_SECONDS = 60.0  # 按未来 60 秒的预计取用量补充
+    MAX_CONCURRENT_CREATES = 4
+
+    def __init__(
+        self,
+        get_manager: Callable[[], "MultiAccountManager"],
+        create_session: Callable[["AccountManager"], Awaitable[str]],
+        enabled: Callable[[], bool],
+        max_per_account: Callable[[], int],
+        max_age_seconds: Callable[[], int],
+    ) -> None:
+        self._get_manager = get_manager
+        self._create_session = create_session
+        self._enabled = enabled
+        self._max_per_account = max_per_account
+        self._max_age_seconds = max_age_seconds
+        self._slots: Dict[str, _AccountSlots] = {}
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._task: Optional[asyncio.Task] = None
+        self._fill_tasks: set = set()
+        # 指标
+        self.hits = 0
+        self.misses = 0
+        self.created = 0
+        self.create_failures = 0
+        self.expired = 0
+        self.create_ms_avg: Optional[float] = None
+
+    # ---------- 取用 ----------
+
+    def _record_demand(self, slots: _AccountSlots, now: float) -> None:
+        if slots.demand_at:
+            slots.demand *= math.exp(-(now - slots.demand_at) / self.DEMAND_DECAY_SECONDS)
+        slots.demand += 1
+        slots.demand_at = now
+
+    def take(self, account: "AccountManager") -> Optional[str]:
+        """取出账户的一个预热 Session；池未启用或为空时返回 None"""
+        if not self._enabled():
+            return None
+        now = time.time()
+        account_id = account.config.account_id
+        slots = self._slots.get(account_id)
+        if slots is None:
+            slots = self._slots[account_id] = _AccountSlots()
+        self._record_demand(slots, now)
+        identity = session_identity(account.config)
+        max_age = self._max_age_seconds()
+        while slots.sessions:
+            session_name, created_at, session_owner = slots.sessions.popleft()
+            if now - created_at > max_age or session_owner != identity:
+                self.expired += 1
+                continue
+            self.hits += 1
+            return session_name
+        self.misses += 1
+        return None
+
+    # ---------- 后台补充 ----------
+
+    def start(self) -> None:
+        if self._task is not None and not self._task.done():
+            return
+        self._semaphore = asyncio.Semaphore(self.MAX_CONCURRENT_CREATES)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        tasks = [t for t in (self._task, *self._fill_tasks) if t is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = None
+        self._fill_tasks.clear()
+
+    async def _run(self) -> None:
+        try:
+            while True:
+                await asyncio.sleep(self.TICK_SECONDS)
+                if self._enabled():
+                    self._tick(time.time())
+                elif self._slots:
+                    self._slots.clear()
+        except asyncio.CancelledError:
+            logger.info("[SESSION] 预热 Session 池已停止")
+
+    def _target(self, slots: _AccountSlots, now: float) -> int:
+        demand = slots.demand * math.exp(-(now - slots.demand_at) / self.DEMAND_DECAY_SECONDS)
+        rate = demand / self.DEMAND_DECAY_SECONDS  # 每秒取用次数的估计
+        return min(self._max_per_account(), math.ceil(rate * self.LOOKAHEAD_SECONDS - 0.05))
+
+    def _tick(self, now: float) -> None:
+        manager = self._get_manager()
+        max_age = self._max_age_seconds()
+        for account_id in list(self._slots):
+            account = manager.accounts.get(account_id)
+            slots = self._slots[account_id]
+            if account is None:
+                self.expired += len(slots.sessions)
+                del self._slots[account_id]
+                continue
+            # 丢弃过期 Session（队首最旧）
+            while slots.sessions and now - slots.sessions[0][1] > max_age:
+                slots.sessions.popleft()
+                self.expired += 1
+            if account.config.disabled or not manager.pool.is_selectable(account_id):
+                continue
+            missing = self._target(slots, now) - len(slots.sessions) - slots.filling
+            for _ in range(max(0, missing)):
+                slots.filling += 1
+                task = asyncio.create_task(self._fill(account, slots))
+                self._fill_tasks.add(task)
+                task.add_done_callback(self._fill_tasks.discard)
+
+    async def _fill(self, account: "AccountManager", slots: _AccountSlots) -> None:
+        try:
+            async with self._semaphore:
+                start = time.perf_counter()
+                try:
+                    session_name = await self._create_session(account)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    self.create_failures += 1
+                    logger.warning(f"[SESSION] [{account.config.account_id}] 预热 Session 创建失败: {type(e).__name__}")
+                    return
+                elapsed_ms = (time.perf_counter() - start) * 1000
+                self.create_ms_avg = elapsed_ms if self.create_ms_avg is None else self.create_ms_avg * 0.9 + elapsed_ms * 0.1
+                self.created += 1
+                slots.sessions.append((session_name, time.time(), session_identity(account.config)))
+        finally:
+            slots.filling -= 1
+
+    def get_metrics(self) -> dict:
+        total = self.hits + self.misses
+        avg = self.create_ms_avg or 0.0
+        return {
+            "enabled": self._enabled(),
+            "ready_sessions": sum(len(s.sessions) for s in self._slots.values()),
+            "accounts": len(self._slots),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "created": self.created,
+            "create_failures": self.create_failures,
+            "expired": self.expired,
+            "create_session_ms_avg": round(avg, 2),
+            # 每次命中省去一次 widgetCreateSession，按平均创建耗时估算节省的首字延迟
+            "ttft_saved_ms_total": round(self.hits * avg, 1),
+        }
@@ -0,0 +1,420 @@
+"""多 worker 共享账户状态
+
+多个 uvicorn worker（或多个容器）各自维护一份 MultiAccountManager。为了让它们对账户健康度
+达成一致（例如某个账户 429 后所有 worker 都进入冷却），账户的 is_available / error_count /
+429 冷却时间 / 对话次数需要通过共享后端同步：
+
+- memory：进程内（默认，单 worker 部署无需同步）
+- postgres：复用 storage 模块的 PostgreSQL 连接池（account_state 表）
+
+同步方式：本地状态变化只标记为"脏"，后台任务每秒批量推送并拉取其他 worker 的变更。
+健康状态按变更时间"后写者胜"，对话次数按增量累加；账户第一次写入共享后端时以本地
+（stats.json 中）的历史对话次数作为初始值，避免历史次数被同步清零。
+
+postgres 后端下还负责：
+- 统计数据（SharedStats）：写回时把本地增量合并进数据库中的共享快照，而不是整体覆盖
+- 选主（LeaderElection）：过期检查轮询、心跳写盘等单例任务只在一个 worker 上运行
+"""
+import asyncio
+import copy
+import logging
+import os
+import time
+from typing import TYPE_CHECKING, Callable, Dict, Optional, Set
+
+from core import storage
+from core.time_buckets import RequestCounters, TimeBucketCounter
+
+if TYPE_CHECKING:
+    from core.account import MultiAccountManager
+
+logger = logging.getLogger(__name__)
+
+SHARED_STATE_BACKENDS = ("memory", "postgres")
+
+
+def get_shared_state_backend() -> str:
+    """从环境变量 SHARED_STATE_BACKEND 读取共享状态后端（所有 worker 需一致）"""
+    backend = os.environ.get("SHARED_STATE_BACKEND", "memory").strip().lower()
+    if backend not in SHARED_STATE_BACKENDS:
+        logger.warning(f"[SHARED] 未知的共享状态后端: {backend}，使用 memory")
+        return "memory"
+    if backend == "postgres" and not storage.is_database_enabled():
+        logger.warning("[SHARED] 未配置 DATABASE_URL，共享状态回退到 memory")
+        return "memory"
+    return backend
+
+
+class AccountStateSync:
+    """账户状态同步器
+
+    Args:
+        backend: memory 或 postgres
+        get_manager: 返回当前的 MultiAccountManager（账户重载后会替换）
+    """
+
+    SYNC_INTERVAL_SECONDS = 1.0
+    # 拉取时回看的时间窗口，覆盖并发事务的提交顺序差异（重复应用是幂等的）
+    PULL_OVERLAP_SECONDS = 5.0
+
+    def __init__(self, backend: str, get_manager: Callable[[], "MultiAccountManager"]) -> None:
+        self.backend = backend
+        self._get_manager = get_manager
+        self._dirty: Set[str] = set()
+        self._conversation_deltas: Dict[str, int] = {}
+        self._since = 0.0
+        self._task: Optional[asyncio.Task] = None
+        # 指标
+        self.push_count = 0
+        self.pull_count = 0
+        self.applied = 0
+        self.errors = 0
+        self.last_sync_ms: Optional[float] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.backend != "memory"
+
+    # ---------- 本地变更（事件循环线程内，O(1)） ----------
+
+    def mark_dirty(self, account_id: str) -> None:
+        if self.enabled:
+            self._dirty.add(account_id)
+
+    def add_conversation(self, account_id: str) -> None:
+        if self.enabled:
+            self._conversation_deltas[account_id] = self._conversation_deltas.get(account_id, 0) + 1
+
+    def resync(self) -> None:
+        """账户重载后调用：下次同步时全量拉取"""
+        self._since = 0.0
+
+    # ---------- 后台同步 ----------
+
+    def start(self) -> None:
+        if not self.enabled or (self._task is not None and not self._task.done()):
+            return
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        try:
+            while True:
+                await self.sync()
+                await asyncio.sleep(self.SYNC_INTERVAL_SECONDS)
+        except asyncio.CancelledError:
+            logger.info("[SHARED] 账户状态同步任务已停止")
+
+    async def sync(self) -> None:
+        if not self.enabled:
+            return
+        start = time.perf_counter()
+        try:
+            await self._push()
+            await self._pull()
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"[SHARED] 账户状态同步失败: {type(e).__name__}: {str(e)[:100]}")
+        self.last_sync_ms = round((time.perf_counter() - start) * 1000, 2)
+
+    async def _push(self) -> None:
+        if not self._dirty and not self._conversation_deltas:
+            return
+        manager = self._get_manager()
+        dirty, self._dirty = self._dirty, set()
+        deltas, self._conversation_deltas = self._conversation_deltas, {}
+        rows = []
+        for account_id in dirty | deltas.keys():
+            account = manager.accounts.get(account_id)
+            if account is None:
+                continue
+            rows.append((
+                account_id,
+                account.is_available,
+                account.error_count,
+                account.last_429_time,
+                account.last_error_time,
+                account.state_updated_at if account_id in dirty else None,
+                deltas.get(account_id, 0),
+                # 本地对话次数（含历史与本次增量），用于初始化共享计数
+                account.conversation_count,
+            ))
+        if not rows:
+            return
+        try:
+            totals = await asyncio.to_thread(storage.account_state_push_sync, rows)
+        except Exception:
+            # 放回队列，下次重试
+            self._dirty |= dirty
+            for account_id, delta in deltas.items():
+                self._conversation_deltas[account_id] = self._conversation_deltas.get(account_id, 0) + delta
+            raise
+        self.push_count += 1
+        self._apply_conversation_totals(dict(totals))
+
+    def _apply_conversation_totals(self, totals: Dict[str, int]) -> None:
+        manager = self._get_manager()
+        for account_id, total in totals.items():
+            account = manager.accounts.get(account_id)
+            if account is not None:
+                # 尚未推送的本地增量需要保留
+                account.conversation_count = total + self._conversation_deltas.get(account_id, 0)
+
+    async def _pull(self) -> None:
+        rows = await asyncio.to_thread(storage.account_state_pull_sync, max(0.0, self._since - self.PULL_OVERLAP_SECONDS))
+        self.pull_count += 1
+        if not rows:
+            return
+        manager = self._get_manager()
+        totals = {}
+        for row in rows:
+            self._since = max(self._since, float(row["updated_at"]))
+            account = manager.accounts.get(row["account_id"])
+            if account is None:
+                continue
+            totals[row["account_id"]] = int(row["conversation_count"])
+            # 本地有更新的变更（或正等待推送）时以本地为准
+            if row["account_id"] in self._dirty:
+                continue
+            if account.apply_shared_state(
+                is_available=row["is_available"],
+                error_count=row["error_count"],
+                last_429_time=float(row["last_429_time"]),
+                last_error_time=float(row["last_error_time"]),
+                updated_at=float(row["health_updated_at"]),
+            ):
+                self.applied += 1
+        self._apply_conversation_totals(totals)
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.enabled:
+            try:
+                await self._push()
+            except Exception as e:
+                logger.error(f"[SHARED] 关闭时推送账户状态失败: {e}")
+
+    def get_metrics(self) -> dict:
+        return {
+            "backend": self.backend,
+            "dirty_accounts": len(self._dirty),
+            "pending_conversations": sum(self._conversation_deltas.values()),
+            "push_count": self.push_count,
+            "pull_count": self.pull_count,
+            "applied_remote_changes": self.applied,
+            "errors": self.errors,
+            "last_sync_ms": self.last_sync_ms,
+        }
+
+
+# ---------- 统计数据 ----------
+
+RECENT_CONVERSATIONS_LIMIT = 60
+
+
+def _merge_counter(shared: Optional[dict], local: Optional[dict], base: Optional[dict]) -> dict:
+    counter = TimeBucketCounter.from_dict(shared or {})
+    counter.merge(TimeBucketCounter.from_dict(local or {}))
+    counter.merge(TimeBucketCounter.from_dict(base or {}), -1)
+    return counter.to_dict()
+
+
+def merge_stats(
+    shared: Optional[dict], local: dict, base: Optional[dict], visitor_window: float = 86400
+) -> dict:
+    """把本地统计数据自 base 以来的变化合并到 shared 上
+
+    - 累计值（total_requests / total_visitors / 分钟桶计数）：shared + (local - base)
+    - 访客 IP：取并集，保留最近访问时间，并清理 visitor_window 秒之前的记录
+    - 账户对话次数：取较大值（各 worker 的计数已通过 account_state 同步）
+    - 最近对话：按 request_id 合并，保留最新的 60 条
+
+    共享快照仍是旧版格式（时间戳列表）时先迁移为分桶计数，合并结果不再包含旧字段。
+    """
+    shared = shared or {}
+    base = base or {}
+    if any(key in shared for key in RequestCounters.LEGACY_KEYS):
+        shared = dict(shared)
+        shared["counters"] = RequestCounters.from_stats(shared).to_dict()
+    merged = {**local, **shared}
+    for key in ("total_requests", "total_visitors"):
+        delta = max(0, int(local.get(key, 0)) - int(base.get(key, 0)))
+        merged[key] = int(shared.get(key, 0)) + delta
+
+    visitor_ips = dict(shared.get("visitor_ips") or {})
+    for ip, ts in (local.get("visitor_ips") or {}).items():
+        visitor_ips[ip] = max(ts, visitor_ips.get(ip, ts))
+    expire_before = time.time() - visitor_window
+    merged["visitor_ips"] = {ip: ts for ip, ts in visitor_ips.items() if ts >= expire_before}
+
+    account_conversations = dict(shared.get("account_conversations") or {})
+    for account_id, count in (local.get("account_conversations") or {}).items():
+        account_conversations[account_id] = max(count, account_conversations.get(account_id, count))
+    merged["account_conversations"] = account_conversations
+
+    recent = {entry.get("request_id"): entry for entry in shared.get("recent_conversations") or []}
+    recent.update((entry.get("request_id"), entry) for entry in local.get("recent_conversations") or [])
+    merged["recent_conversations"] = sorted(
+        recent.values(), key=lambda entry: entry.get("start_ts") or 0
+    )[-RECENT_CONVERSATIONS_LIMIT:]
+
+    shared_counters = shared.get("counters") or {}
+    local_counters = local.get("counters") or {}
+    base_counters = base.get("counters") or {}
+    counters = {
+        key: _merge_counter(shared_counters.get(key), local_counters.get(key), base_counters.get(key))
+        for key in ("requests", "failures", "rate_limits")
+    }
+    models = {}
+    for model in {**(shared_counters.get("models") or {}), **(local_counters.get("models") or {})}:
+        models[model] = _merge_counter(
+            (shared_counters.get("models") or {}).get(model),
+            (local_counters.get("models") or {}).get(model),
+            (base_counters.get("models") or {}).get(model),
+        )
+    counters["models"] = models
+    merged["counters"] = counters
+    return merged
+
+
+class SharedStats:
+    """多 worker 共享统计数据（postgres 后端）
+
+    各 worker 只在本地累加统计数据。写回时在数据库事务内把"本地自上次合并以来的增量"
+    合并到共享快照上（merge_stats），再把结果（含其他 worker 的增量）带回本地，
+    避免各 worker 整体覆盖共享快照导致的计数丢失。
+    """
+
+    def __init__(self, backend: str) -> None:
+        self.backend = backend
+        # 上一次合并后的共享快照（本地增量 = 当前本地统计 - base）
+        self._base: Optional[dict] = None
+        # 指标
+        self.merge_count = 0
+        self.last_merge_ms: Optional[float] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.backend != "memory"
+
+    def set_base(self, stats: dict) -> None:
+        """启动时记录加载到的统计数据（含 counters）作为增量基准"""
+        self._base = copy.deepcopy(stats)
+
+    async def merge(self, local: dict) -> dict:
+        """把本地快照的增量合并进共享快照，返回合并后的共享快照"""
+        base = self._base
+        start = time.perf_counter()
+        # 数据库中还没有统计数据时，以本地加载的历史数据（stats.json）为起点
+        merged = await asyncio.to_thread(
+            storage.stats_merge_sync,
+            lambda shared: merge_stats(shared if shared is not None else base, local, base),
+        )
+        self._base = merged
+        self.merge_count += 1
+        self.last_merge_ms = round((time.perf_counter() - start) * 1000, 2)
+        return merged
+
+    def get_metrics(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "merge_count": self.merge_count,
+            "last_merge_ms": self.last_merge_ms,
+        }
+
+
+# ---------- 选主 ----------
+
+class LeaderElection:
+    """多 worker 选主（postgres 会话级 advisory lock）
+
+    只需要在一个 worker 上运行的后台任务（账户过期检查轮询会触发浏览器自动登录、
+    心跳写盘）由 leader 运行。leader 退出或数据库连接断开时锁自动释放，
+    其他 worker 在下一次检查时接任。memory 后端（单 worker）始终是 leader。
+
+    Args:
+        backend: memory 或 postgres
+        on_elected / on_demoted: 成为 / 不再是 leader 时调用（事件循环线程内）
+    """
+
+    CHECK_INTERVAL_SECONDS = 10.0
+
+    def __init__(self, backend: str, on_elected: Callable[[], None], on_demoted: Callable[[], None]) -> None:
+        self.backend = backend
+        self._on_elected = on_elected
+        self._on_demoted = on_demoted
+        self.is_leader = False
+        self._task: Optional[asyncio.Task] = None
+        # 指标
+        self.transitions = 0
+        self.errors = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.backend != "memory"
+
+    def start(self) -> None:
+        if not self.enabled:
+            self._set_leader(True)
+            return
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        try:
+            while True:
+                await self.check()
+                await asyncio.sleep(self.CHECK_INTERVAL_SECONDS)
+        except asyncio.CancelledError:
+            logger.info("[SHARED] 选主任务已停止")
+
+    async def check(self) -> None:
+        try:
+            leader = await asyncio.to_thread(storage.leader_lock_sync)
+        except Exception as e:
+            self.errors += 1
+            leader = False
+            logger.error(f"[SHARED] 选主失败: {type(e).__name__}: {str(e)[:100]}")
+        self._set_leader(leader)
+
+    def _set_leader(self, leader: bool) -> None:
+        if leader == self.is_leader:
+            return
+        self.is_leader = leader
+        self.transitions += 1
+        if leader:
+            logger.info(f"[SHARED] 当前 worker 成为 leader（pid={os.getpid()}），启动单例后台任务")
+            self._on_elected()
+        else:
+            logger.warning(f"[SHARED] 当前 worker 不再是 leader（pid={os.getpid()}），停止单例后台任务")
+            self._on_demoted()
+
+    async def close(self) -> None:
+        """停止选主并释放锁（不触发 on_demoted，由关闭流程自行停止任务）"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.enabled and self.is_leader:
+            try:
+                await asyncio.to_thread(storage.leader_unlock_sync)
+            except Exception as e:
+                logger.error(f"[SHARED] 释放 leader 锁失败: {e}")
+        self.is_leader = False
+
+    def get_metrics(self) -> dict:
+        return {
+            "backend": self.backend,
+            "is_leader": self.is_leader,
+            "pid": os.getpid(),
+            "transitions": self.transitions,
+            "errors": self.errors,
+        }
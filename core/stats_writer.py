@@ -0,0 +1,144 @@
+"""统计数据写回模块
+
+请求路径只把统计数据标记为"脏"，由后台任务按固定间隔或累计变更数批量写回，
+多次变更合并为一次持久化，关闭时再做最后一次写回。
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class StatsWriter:
+    """全局统计数据的批量写回器（write-behind）
+
+    Args:
+        snapshot: 在事件循环线程内调用，返回可直接持久化的一致快照
+        save: 异步保存快照的函数
+        flush_interval: 写回间隔（秒），返回值支持热更新
+        max_pending: 累计多少次变更后立即写回，返回值支持热更新
+        sync_when_idle: 返回 True 时没有本地变更也按间隔写回（多 worker 共享统计数据时
+            借此拉取其他 worker 的变更）
+    """
+
+    def __init__(
+        self,
+        snapshot: Callable[[], Any],
+        save: Callable[[Any], Awaitable[None]],
+        flush_interval: Callable[[], float],
+        max_pending: Callable[[], int],
+        sync_when_idle: Callable[[], bool] = lambda: False,
+    ) -> None:
+        self._snapshot = snapshot
+        self._save = save
+        self._flush_interval = flush_interval
+        self._max_pending = max_pending
+        self._sync_when_idle = sync_when_idle
+        self._pending = 0
+        self._dirty_since: Optional[float] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._task: Optional[asyncio.Task] = None
+        # 指标
+        self.flush_count = 0
+        self.flush_errors = 0
+        self.coalesced_writes = 0
+        self.last_flush_at: Optional[float] = None
+        self.last_flush_ms: Optional[float] = None
+        self.max_flush_ms = 0.0
+
+    def mark_dirty(self) -> None:
+        """标记统计数据已变更（O(1)，不做任何 I/O）"""
+        self._pending += 1
+        if self._dirty_since is None:
+            self._dirty_since = time.time()
+        if self._wakeup is not None and self._pending >= self._max_pending():
+            self._wakeup.set()
+
+    @property
+    def pending(self) -> int:
+        """尚未写回的变更次数"""
+        return self._pending
+
+    def start(self) -> None:
+        """启动后台写回任务（需在事件循环中调用）"""
+        if self._task is not None and not self._task.done():
+            return
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        try:
+            while True:
+                try:
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout=self._flush_interval())
+                    except asyncio.TimeoutError:
+                        pass
+                    self._wakeup.clear()
+                    if self._pending or self._sync_when_idle():
+                        await self.flush()
+                except Exception as e:
+                    # 单次异常不终止后台任务，否则之后只能在关闭时写回
+                    logger.error(f"[STATS] 后台写回任务异常: {type(e).__name__}: {str(e)[:100]}")
+                    await asyncio.sleep(1)
+        except asyncio.CancelledError:
+            logger.info("[STATS] 后台写回任务已停止")
+
+    async def flush(self) -> None:
+        """立即写回（并发调用会合并为一次）"""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            pending = self._pending
+            if not pending and not self._sync_when_idle():
+                return
+            self._pending = 0
+            self._dirty_since = None
+            start = time.perf_counter()
+            try:
+                # 快照在事件循环线程内同步生成，之后的变更计入下一批；序列化失败同样计为写回失败
+                snapshot = self._snapshot()
+                await self._save(snapshot)
+            except Exception as e:
+                self.flush_errors += 1
+                self._pending += pending
+                if self._dirty_since is None:
+                    self._dirty_since = time.time()
+                logger.error(f"[STATS] 统计数据写回失败: {type(e).__name__}: {str(e)[:100]}")
+                return
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            self.flush_count += 1
+            self.coalesced_writes += max(pending - 1, 0)
+            self.last_flush_at = time.time()
+            self.last_flush_ms = round(elapsed_ms, 2)
+            self.max_flush_ms = max(self.max_flush_ms, round(elapsed_ms, 2))
+
+    async def close(self) -> None:
+        """停止后台任务并写回剩余变更（用于关闭服务）"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def get_metrics(self) -> dict:
+        """写回延迟与积压指标"""
+        return {
+            "pending_changes": self._pending,
+            "oldest_pending_seconds": round(time.time() - self._dirty_since, 1) if self._dirty_since else 0,
+            "flush_count": self.flush_count,
+            "flush_errors": self.flush_errors,
+            "coalesced_writes": self.coalesced_writes,
+            "last_flush_at": self.last_flush_at,
+            "last_flush_ms": self.last_flush_ms,
+            "max_flush_ms": self.max_flush_ms,
+            "flush_interval_seconds": self._flush_interval(),
+            "max_pending": self._max_pending(),
+        }
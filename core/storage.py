@@ -9,7 +9,7 @@ import json
 import logging
 import os
 import threading
-from typing import Optional
+from typing import Callable, Optional
 
 from dotenv import load_dotenv
 
@@ -22,6 +22,12 @@ _db_pool_lock = None
 _db_loop = None
 _db_thread = None
 _db_loop_lock = threading.Lock()
+# Session-level advisory lock held by the leader worker for its lifetime
+_leader_conn = None
+
+# Advisory lock keys (arbitrary constants shared by all workers)
+LEADER_LOCK_ID = 0x6762_3261_0001
+STATS_MERGE_LOCK_ID = 0x6762_3261_0002
 
 
 def _get_database_url() -> str:
@@ -103,6 +109,39 @@ async def _init_tables(pool) -> None:
             )
             """
         )
+        await conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS session_affinity (
+                conv_key TEXT PRIMARY KEY,
+                account_id TEXT NOT NULL,
+                session_id TEXT NOT NULL,
+                updated_at DOUBLE PRECISION NOT NULL
+            )
+            """
+        )
+        await conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_session_affinity_account ON session_affinity (account_id)"
+        )
+        await conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_session_affinity_updated ON session_affinity (updated_at)"
+        )
+        await conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS account_state (
+                account_id TEXT PRIMARY KEY,
+                is_available BOOLEAN NOT NULL DEFAULT TRUE,
+                error_count INTEGER NOT NULL DEFAULT 0,
+                last_429_time DOUBLE PRECISION NOT NULL DEFAULT 0,
+                last_error_time DOUBLE PRECISION NOT NULL DEFAULT 0,
+                health_updated_at DOUBLE PRECISION NOT NULL DEFAULT 0,
+                conversation_count BIGINT NOT NULL DEFAULT 0,
+                updated_at DOUBLE PRECISION NOT NULL
+            )
+            """
+        )
+        await conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_account_state_updated ON account_state (updated_at)"
+        )
         logger.info("[STORAGE] Database tables initialized")
 
 
@@ -123,6 +162,11 @@ async def db_get(key: str) -> Optional[dict]:
 
 async def db_set(key: str, value: dict) -> None:
     """Persist a value to the database."""
+    await db_set_raw(key, json.dumps(value, ensure_ascii=False))
+
+
+async def db_set_raw(key: str, payload: str) -> None:
+    """Persist an already serialized JSON value to the database."""
     pool = await _get_pool()
     async with pool.acquire() as conn:
         await conn.execute(
@@ -134,7 +178,7 @@ async def db_set(key: str, value: dict) -> None:
                 updated_at = CURRENT_TIMESTAMP
             """,
             key,
-            json.dumps(value, ensure_ascii=False),
+            payload,
         )
 
 
@@ -256,6 +300,18 @@ async def save_stats(stats: dict) -> bool:
     return False
 
 
+async def save_stats_payload(payload: str) -> bool:
+    """Persist a pre-serialized stats snapshot (produced by the stats writer)."""
+    if not is_database_enabled():
+        return False
+    try:
+        await db_set_raw("stats", payload)
+        return True
+    except Exception as e:
+        logger.error(f"[STORAGE] Stats write failed: {e}")
+    return False
+
+
 def load_settings_sync() -> Optional[dict]:
     return _run_in_db_loop(load_settings())
 
@@ -270,3 +326,254 @@ def load_stats_sync() -> Optional[dict]:
 
 def save_stats_sync(stats: dict) -> bool:
     return _run_in_db_loop(save_stats(stats))
+
+
+def save_stats_payload_sync(payload: str) -> bool:
+    return _run_in_db_loop(save_stats_payload(payload))
+
+
+async def stats_merge(merge: Callable[[Optional[dict]], dict]) -> dict:
+    """
+    Read-modify-write the shared stats snapshot (multi-worker mode).
+    merge(current) receives the stored stats (None if absent) and returns the
+    new stats; merges from different workers are serialized with a
+    transaction-scoped advisory lock. Returns the stored result.
+    """
+    pool = await _get_pool()
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            await conn.execute("SELECT pg_advisory_xact_lock($1)", STATS_MERGE_LOCK_ID)
+            row = await conn.fetchrow("SELECT value FROM kv_store WHERE key = $1", "stats")
+            current = None
+            if row:
+                current = row["value"]
+                if isinstance(current, str):
+                    current = json.loads(current)
+            merged = merge(current)
+            if merged != current:
+                await conn.execute(
+                    """
+                    INSERT INTO kv_store (key, value, updated_at)
+                    VALUES ($1, $2, CURRENT_TIMESTAMP)
+                    ON CONFLICT (key) DO UPDATE SET
+                        value = EXCLUDED.value,
+                        updated_at = CURRENT_TIMESTAMP
+                    """,
+                    "stats",
+                    json.dumps(merged, ensure_ascii=False),
+                )
+            return merged
+
+
+def stats_merge_sync(merge: Callable[[Optional[dict]], dict]) -> dict:
+    return _run_in_db_loop(stats_merge(merge))
+
+
+# ==================== Session affinity storage ====================
+
+async def affinity_lookup(conv_key: str, min_updated_at: float) -> Optional[dict]:
+    """Fetch a conversation binding that is newer than min_updated_at."""
+    pool = await _get_pool()
+    async with pool.acquire() as conn:
+        row = await conn.fetchrow(
+            """
+            SELECT account_id, session_id, updated_at FROM session_affinity
+            WHERE conv_key = $1 AND updated_at >= $2
+            """,
+            conv_key,
+            min_updated_at,
+        )
+        if not row:
+            return None
+        return {
+            "account_id": row["account_id"],
+            "session_id": row["session_id"],
+            "updated_at": float(row["updated_at"]),
+        }
+
+
+async def affinity_apply(upserts: list, deletes: list, account_ids: list) -> None:
+    """
+    Apply a batch of binding changes in one transaction.
+    Account invalidations run first so newer bindings in the same batch survive.
+    """
+    pool = await _get_pool()
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            if account_ids:
+                await conn.execute(
+                    "DELETE FROM session_affinity WHERE account_id = ANY($1::text[])",
+                    list(account_ids),
+                )
+            if deletes:
+                await conn.execute(
+                    "DELETE FROM session_affinity WHERE conv_key = ANY($1::text[])",
+                    list(deletes),
+                )
+            if upserts:
+                await conn.executemany(
+                    """
+                    INSERT INTO session_affinity (conv_key, account_id, session_id, updated_at)
+                    VALUES ($1, $2, $3, $4)
+                    ON CONFLICT (conv_key) DO UPDATE SET
+                        account_id = EXCLUDED.account_id,
+                        session_id = EXCLUDED.session_id,
+                        updated_at = EXCLUDED.updated_at
+                    """,
+                    upserts,
+                )
+
+
+async def affinity_purge(before: float) -> int:
+    """Delete bindings last used before the given timestamp."""
+    pool = await _get_pool()
+    async with pool.acquire() as conn:
+        result = await conn.execute(
+            "DELETE FROM session_affinity WHERE updated_at < $1", before
+        )
+    try:
+        return int(result.split()[-1])
+    except (ValueError, IndexError):
+        return 0
+
+
+def affinity_lookup_sync(conv_key: str, min_updated_at: float) -> Optional[dict]:
+    return _run_in_db_loop(affinity_lookup(conv_key, min_updated_at))
+
+
+def affinity_apply_sync(upserts: list, deletes: list, account_ids: list) -> None:
+    return _run_in_db_loop(affinity_apply(upserts, deletes, account_ids))
+
+
+def affinity_purge_sync(before: float) -> int:
+    return _run_in_db_loop(affinity_purge(before))
+
+
+# ==================== Shared account state ====================
+
+async def account_state_push(rows: list) -> list:
+    """
+    Upsert account health and add conversation deltas.
+    Each row is (account_id, is_available, error_count, last_429_time,
+    last_error_time, health_updated_at or None, conversation_delta,
+    local_conversation_count).
+    Health fields follow last-writer-wins on health_updated_at; conversation
+    counts are additive. A new row is seeded with the worker's local
+    (historical) count, which already includes the delta, and an existing row
+    never drops below it. Returns [(account_id, conversation_count), ...].
+    """
+    pool = await _get_pool()
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            result = []
+            for row in rows:
+                record = await conn.fetchrow(
+                    """
+                    INSERT INTO account_state (
+                        account_id, is_available, error_count, last_429_time, last_error_time,
+                        health_updated_at, conversation_count, updated_at
+                    )
+                    VALUES ($1, $2, $3, $4, $5, COALESCE($6::double precision, 0), $8::bigint, EXTRACT(EPOCH FROM clock_timestamp()))
+                    ON CONFLICT (account_id) DO UPDATE SET
+                        is_available = CASE WHEN $6::double precision IS NOT NULL AND $6::double precision >= account_state.health_updated_at
+                            THEN EXCLUDED.is_available ELSE account_state.is_available END,
+                        error_count = CASE WHEN $6::double precision IS NOT NULL AND $6::double precision >= account_state.health_updated_at
+                            THEN EXCLUDED.error_count ELSE account_state.error_count END,
+                        last_429_time = CASE WHEN $6::double precision IS NOT NULL AND $6::double precision >= account_state.health_updated_at
+                            THEN EXCLUDED.last_429_time ELSE account_state.last_429_time END,
+                        last_error_time = CASE WHEN $6::double precision IS NOT NULL AND $6::double precision >= account_state.health_updated_at
+                            THEN EXCLUDED.last_error_time ELSE account_state.last_error_time END,
+                        health_updated_at = GREATEST(account_state.health_updated_at, COALESCE($6::double precision, 0)),
+                        conversation_count = GREATEST(account_state.conversation_count + $7::bigint, $8::bigint),
+                        updated_at = EXTRACT(EPOCH FROM clock_timestamp())
+                    RETURNING account_id, conversation_count
+                    """,
+                    *row,
+                )
+                result.append((record["account_id"], int(record["conversation_count"])))
+            return result
+
+
+async def account_state_pull(since: float) -> list:
+    """Fetch account state rows changed after the given database timestamp."""
+    pool = await _get_pool()
+    async with pool.acquire() as conn:
+        rows = await conn.fetch(
+            """
+            SELECT account_id, is_available, error_count, last_429_time, last_error_time,
+                   health_updated_at, conversation_count, updated_at
+            FROM account_state WHERE updated_at > $1
+            """,
+            since,
+        )
+    return [dict(row) for row in rows]
+
+
+def account_state_push_sync(rows: list) -> list:
+    return _run_in_db_loop(account_state_push(rows))
+
+
+def account_state_pull_sync(since: float) -> list:
+    return _run_in_db_loop(account_state_pull(since))
+
+
+# ==================== Leader election ====================
+
+async def _drop_leader_conn() -> None:
+    global _leader_conn
+    conn, _leader_conn = _leader_conn, None
+    if conn is None:
+        return
+    pool = await _get_pool()
+    try:
+        await pool.release(conn)
+    except Exception as e:
+        logger.warning(f"[STORAGE] Leader connection release failed: {e}")
+
+
+async def leader_lock() -> bool:
+    """
+    Try to become (or stay) the leader worker.
+    The leader holds a session-level advisory lock on a dedicated pooled
+    connection; it is released automatically when the process or connection
+    dies. Returns True while this process holds the lock.
+    """
+    global _leader_conn
+    if _leader_conn is not None:
+        try:
+            await _leader_conn.fetchval("SELECT 1")
+            return True
+        except Exception as e:
+            logger.warning(f"[STORAGE] Leader connection lost: {e}")
+            await _drop_leader_conn()
+    pool = await _get_pool()
+    conn = await pool.acquire()
+    try:
+        acquired = await conn.fetchval("SELECT pg_try_advisory_lock($1)", LEADER_LOCK_ID)
+    except Exception:
+        await pool.release(conn)
+        raise
+    if not acquired:
+        await pool.release(conn)
+        return False
+    _leader_conn = conn
+    return True
+
+
+async def leader_unlock() -> None:
+    """Release the leader lock (on shutdown)."""
+    if _leader_conn is None:
+        return
+    try:
+        await _leader_conn.execute("SELECT pg_advisory_unlock($1)", LEADER_LOCK_ID)
+    except Exception as e:
+        logger.warning(f"[STORAGE] Leader unlock failed: {e}")
+    await _drop_leader_conn()
+
+
+def leader_lock_sync() -> bool:
+    return _run_in_db_loop(leader_lock())
+
+
+def leader_unlock_sync() -> None:
+    return _run_in_db_loop(leader_unlock())
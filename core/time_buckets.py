@@ -0,0 +1,193 @@
+"""时间分桶计数器
+
+用固定大小的环形缓冲区按分钟统计事件数量，替代不断增长的时间戳列表：
+- 计数 O(1)，查询 O(桶数)，内存与持久化体积与请求量无关
+- 支持从旧的时间戳列表格式迁移
+"""
+import time
+from typing import Dict, Iterable, List, Optional
+
+# 默认保留 13 小时的分钟桶，覆盖管理面板 12 小时趋势图（含当前未满的小时）
+DEFAULT_BUCKET_SECONDS = 60
+DEFAULT_BUCKET_COUNT = 13 * 60
+
+
+class TimeBucketCounter:
+    """按固定时间粒度分桶的环形计数器"""
+
+    __slots__ = ("bucket_seconds", "size", "_counts", "_head")
+
+    def __init__(self, bucket_seconds: int = DEFAULT_BUCKET_SECONDS, size: int = DEFAULT_BUCKET_COUNT) -> None:
+        self.bucket_seconds = bucket_seconds
+        self.size = size
+        self._counts = [0] * size
+        # 最新一个桶的绝对序号（epoch // bucket_seconds），-1 表示尚无数据
+        self._head = -1
+
+    def _advance(self, index: int) -> None:
+        """把环形缓冲区推进到 index，清空中间跳过的旧桶"""
+        if self._head < 0 or index - self._head >= self.size:
+            self._counts = [0] * self.size
+        else:
+            for i in range(self._head + 1, index + 1):
+                self._counts[i % self.size] = 0
+        self._head = index
+
+    def add(self, ts: Optional[float] = None, n: int = 1) -> None:
+        """记录 n 次事件（默认当前时间）"""
+        index = int((time.time() if ts is None else ts) // self.bucket_seconds)
+        if index > self._head:
+            self._advance(index)
+        elif index <= self._head - self.size:
+            return  # 超出保留窗口
+        self._counts[index % self.size] += n
+
+    def _iter_buckets(self, now: float):
+        """按时间顺序遍历窗口内的 (桶起始时间, 计数)，跳过空桶"""
+        if self._head < 0:
+            return
+        newest = min(self._head, int(now // self.bucket_seconds))
+        oldest = max(self._head - self.size + 1, int(now // self.bucket_seconds) - self.size + 1)
+        for index in range(oldest, newest + 1):
+            count = self._counts[index % self.size]
+            if count:
+                yield index * self.bucket_seconds, count
+
+    def count_last(self, seconds: float, now: Optional[float] = None) -> int:
+        """
+        统计最近 seconds 秒内的事件数。
+
+        窗口起点落在某个桶中间时按比例折算该桶（滑动窗口近似）。
+        """
+        now = time.time() if now is None else now
+        start = now - seconds
+        total = 0.0
+        for bucket_start, count in self._iter_buckets(now):
+            bucket_end = bucket_start + self.bucket_seconds
+            if bucket_end <= start:
+                continue
+            if bucket_start < start:
+                total += count * (bucket_end - start) / self.bucket_seconds
+            else:
+                total += count
+        return int(round(total))
+
+    def histogram(self, start_ts: float, span_seconds: int, buckets: int, now: Optional[float] = None) -> List[int]:
+        """把分钟桶聚合成从 start_ts 开始、每段 span_seconds 秒的 buckets 段计数"""
+        now = time.time() if now is None else now
+        result = [0] * buckets
+        for bucket_start, count in self._iter_buckets(now):
+            idx = int((bucket_start - start_ts) // span_seconds)
+            if 0 <= idx < buckets:
+                result[idx] += count
+        return result
+
+    def merge(self, other: "TimeBucketCounter", sign: int = 1) -> None:
+        """把 other 各桶的计数加到本计数器（sign=-1 时减去，结果不低于 0），用于合并多个 worker 的增量"""
+        if other._head < 0:
+            return
+        for index in range(other._head - other.size + 1, other._head + 1):
+            count = other._counts[index % other.size]
+            if not count:
+                continue
+            if index > self._head:
+                self._advance(index)
+            elif index <= self._head - self.size:
+                continue
+            slot = index % self.size
+            self._counts[slot] = max(0, self._counts[slot] + sign * count)
+
+    def to_dict(self) -> dict:
+        """紧凑序列化：只保存最新桶序号与去掉前导 0 的计数"""
+        if self._head < 0:
+            return {"bucket_seconds": self.bucket_seconds, "end": -1, "counts": []}
+        counts = [self._counts[i % self.size] for i in range(self._head - self.size + 1, self._head + 1)]
+        first = next((i for i, c in enumerate(counts) if c), len(counts))
+        return {"bucket_seconds": self.bucket_seconds, "end": self._head, "counts": counts[first:]}
+
+    @classmethod
+    def from_dict(cls, data: dict, size: int = DEFAULT_BUCKET_COUNT) -> "TimeBucketCounter":
+        """从 to_dict() 的结果恢复（粒度不一致时丢弃旧数据）"""
+        counter = cls(DEFAULT_BUCKET_SECONDS, size)
+        bucket_seconds = int(data.get("bucket_seconds") or DEFAULT_BUCKET_SECONDS)
+        end = int(data.get("end", -1))
+        counts = data.get("counts") or []
+        if end < 0 or bucket_seconds != DEFAULT_BUCKET_SECONDS:
+            return counter
+        start = end - len(counts) + 1
+        for offset, count in enumerate(counts):
+            if count:
+                counter.add((start + offset) * bucket_seconds, int(count))
+        return counter
+
+    @classmethod
+    def from_timestamps(cls, timestamps: Iterable[float], size: int = DEFAULT_BUCKET_COUNT) -> "TimeBucketCounter":
+        """从旧格式的时间戳列表迁移"""
+        counter = cls(DEFAULT_BUCKET_SECONDS, size)
+        for ts in sorted(timestamps):
+            counter.add(ts)
+        return counter
+
+
+class RequestCounters:
+    """请求 / 失败 / 限流 / 按模型请求数的分桶计数集合"""
+
+    # 旧版 global_stats 中的时间戳列表字段
+    LEGACY_KEYS = ("request_timestamps", "failure_timestamps", "rate_limit_timestamps", "model_request_timestamps")
+
+    def __init__(self) -> None:
+        self.requests = TimeBucketCounter()
+        self.failures = TimeBucketCounter()
+        self.rate_limits = TimeBucketCounter()
+        self.models: Dict[str, TimeBucketCounter] = {}
+
+    def record_request(self, model: str, ts: Optional[float] = None) -> None:
+        self.requests.add(ts)
+        counter = self.models.get(model)
+        if counter is None:
+            counter = self.models[model] = TimeBucketCounter()
+        counter.add(ts)
+
+    def record_failure(self, ts: Optional[float] = None) -> None:
+        self.failures.add(ts)
+
+    def record_rate_limit(self, ts: Optional[float] = None) -> None:
+        self.rate_limits.add(ts)
+
+    def to_dict(self) -> dict:
+        return {
+            "requests": self.requests.to_dict(),
+            "failures": self.failures.to_dict(),
+            "rate_limits": self.rate_limits.to_dict(),
+            "models": {model: counter.to_dict() for model, counter in self.models.items()},
+        }
+
+    @classmethod
+    def from_stats(cls, stats: dict) -> "RequestCounters":
+        """
+        从持久化的统计数据恢复。
+
+        优先读取新格式的 "counters"；若存在旧版时间戳列表则迁移并从 stats 中移除。
+        """
+        counters = cls()
+        data = stats.pop("counters", None)
+        if isinstance(data, dict):
+            counters.requests = TimeBucketCounter.from_dict(data.get("requests") or {})
+            counters.failures = TimeBucketCounter.from_dict(data.get("failures") or {})
+            counters.rate_limits = TimeBucketCounter.from_dict(data.get("rate_limits") or {})
+            counters.models = {
+                model: TimeBucketCounter.from_dict(item or {})
+                for model, item in (data.get("models") or {}).items()
+            }
+
+        legacy = {key: stats.pop(key, None) for key in cls.LEGACY_KEYS}
+        if legacy["request_timestamps"]:
+            counters.requests = TimeBucketCounter.from_timestamps(legacy["request_timestamps"])
+        if legacy["failure_timestamps"]:
+            counters.failures = TimeBucketCounter.from_timestamps(legacy["failure_timestamps"])
+        if legacy["rate_limit_timestamps"]:
+            counters.rate_limits = TimeBucketCounter.from_timestamps(legacy["rate_limit_timestamps"])
+        for model, timestamps in (legacy["model_request_timestamps"] or {}).items():
+            if timestamps:
+                counters.models[model] = TimeBucketCounter.from_timestamps(timestamps)
+        return counters
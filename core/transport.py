@@ -0,0 +1,118 @@
+"""上游 HTTP 传输层
+
+过去所有出站请求共用一个 httpx.AsyncClient（最多 200 个连接）：对话流、Session 创建、
+JWT 获取、文件上传、图片下载，以及用户消息里任意 URL 的图片下载。慢速的用户 URL 下载会占满
+连接数，导致正在进行的对话流拿不到连接。这里按上游类别拆分为独立的连接池：
+
+- streaming：widgetStreamAssist 对话流（长连接，读超时为 TIMEOUT_SECONDS）
+- control：创建 Session、上传文件、查询/下载生成的文件（短请求，复用连接）
+- auth：getoxsrf 获取 JWT
+- fetch：用户消息中的图片 URL（任意主机，连接数单独限制，不影响 Google 上游）
+
+Google 上游（streaming / control / auth）可选启用 HTTP/2 多路复用，需要安装 h2；
+未安装时回退到 HTTP/1.1。
+"""
+import importlib.util
+import logging
+from typing import Dict, NamedTuple, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+
+class PoolSpec(NamedTuple):
+    max_connections: int
+    max_keepalive_connections: int
+    timeout: Optional[httpx.Timeout]  # None 表示使用对话流超时
+    google: bool  # 是否为 Google 上游（可启用 HTTP/2）
+    follow_redirects: bool = False
+
+
+POOL_SPECS: Dict[str, PoolSpec] = {
+    "streaming": PoolSpec(200, 100, None, google=True),
+    "control": PoolSpec(50, 20, httpx.Timeout(120.0, connect=30.0), google=True),
+    "auth": PoolSpec(20, 10, httpx.Timeout(30.0, connect=15.0), google=True),
+    "fetch": PoolSpec(20, 10, httpx.Timeout(30.0, connect=10.0), google=False, follow_redirects=True),
+}
+
+
+class UpstreamClients:
+    """按上游类别划分的 HTTP 客户端
+
+    Args:
+        proxy: 代理地址（为空则直连）
+        stream_timeout: 对话流的读超时（秒）
+        http2: Google 上游是否启用 HTTP/2
+    """
+
+    def __init__(self, proxy: Optional[str], stream_timeout: float, http2: bool = False) -> None:
+        self.proxy = proxy or None
+        self.stream_timeout = stream_timeout
+        self.http2_requested = http2
+        self.streaming: httpx.AsyncClient
+        self.control: httpx.AsyncClient
+        self.auth: httpx.AsyncClient
+        self.fetch: httpx.AsyncClient
+        self._build()
+
+    @property
+    def http2(self) -> bool:
+        """实际是否启用 HTTP/2"""
+        return self.http2_requested and HTTP2_AVAILABLE
+
+    def _build(self) -> None:
+        if self.http2_requested and not HTTP2_AVAILABLE:
+            logger.warning("[HTTP] 未安装 h2，上游请求回退到 HTTP/1.1（pip install h2）")
+        for name, spec in POOL_SPECS.items():
+            timeout = spec.timeout or httpx.Timeout(self.stream_timeout, connect=60.0)
+            client = httpx.AsyncClient(
+                proxy=self.proxy,
+                verify=False,
+                http2=spec.google and self.http2,
+                timeout=timeout,
+                follow_redirects=spec.follow_redirects,
+                limits=httpx.Limits(
+                    max_keepalive_connections=spec.max_keepalive_connections,
+                    max_connections=spec.max_connections,
+                ),
+            )
+            setattr(self, name, client)
+
+    async def rebuild(self, proxy: Optional[str], stream_timeout: float, http2: bool) -> None:
+        """代理或协议配置变化后重建全部客户端（旧客户端关闭）"""
+        old_clients = [getattr(self, name) for name in POOL_SPECS]
+        self.proxy = proxy or None
+        self.stream_timeout = stream_timeout
+        self.http2_requested = http2
+        self._build()
+        for client in old_clients:
+            await client.aclose()
+
+    async def aclose(self) -> None:
+        for name in POOL_SPECS:
+            await getattr(self, name).aclose()
+
+    def get_metrics(self) -> dict:
+        pools = {}
+        for name, spec in POOL_SPECS.items():
+            info = {
+                "max_connections": spec.max_connections,
+                "max_keepalive_connections": spec.max_keepalive_connections,
+                "http2": spec.google and self.http2,
+            }
+            # httpcore 连接池的内部状态（不同版本可能不存在）
+            connections = getattr(getattr(getattr(self, name), "_transport", None), "_pool", None)
+            connections = getattr(connections, "connections", None)
+            if connections is not None:
+                info["connections"] = len(connections)
+                info["idle_connections"] = sum(1 for conn in connections if conn.is_idle())
+            pools[name] = info
+        return {
+            "http2_requested": self.http2_requested,
+            "http2_available": HTTP2_AVAILABLE,
+            "proxy": bool(self.proxy),
+            "pools": pools,
+        }
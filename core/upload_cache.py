@@ -0,0 +1,174 @@
+"""附件上传：缓存与并发控制
+
+上传到 Google 的文件（widgetAddContextFile 返回的 fileId）绑定在 Session 上。客户端在
+同一对话的每一轮都重新附带同一张图片/PDF 时，过去每一轮都会把相同的内容再上传一次。
+这里按 (账户, Session, 内容 sha256) -> fileId 缓存上传结果：
+
+- 当前 Session 中已经存在的附件直接复用 fileId，不再上传
+- 同一请求中内容相同的附件只上传一次
+- 条目按 TTL 过期，超出容量时淘汰最久未使用的条目（OrderedDict LRU）
+
+不同内容的附件并发上传，同时受单请求并发数与全局并发数（UploadLimiter）限制，
+避免一条带几十个附件的消息占满 control 连接池。
+"""
+import asyncio
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Deque, Optional, Tuple
+
+CacheKey = Tuple[str, str, str]  # (account_id, session_name, sha256)
+
+
+class UploadCache:
+    """(账户, Session, sha256) -> fileId（仅在事件循环线程内使用）
+
+    Args:
+        ttl_seconds / max_entries: 返回配置值，支持热更新；ttl_seconds 为 0 时禁用
+    """
+
+    def __init__(self, ttl_seconds: Callable[[], int], max_entries: Callable[[], int]) -> None:
+        self._ttl_seconds = ttl_seconds
+        self._max_entries = max_entries
+        self._entries: "OrderedDict[CacheKey, Tuple[str, float]]" = OrderedDict()
+        # 指标
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.uploads = 0
+        self.upload_failures = 0
+        self.bytes_uploaded = 0
+        self.bytes_saved = 0
+        self.round_trips_saved = 0
+        self.upload_ms_avg: Optional[float] = None
+        self.upload_ms_max = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self._ttl_seconds() > 0
+
+    def get(self, account_id: str, session_name: str, sha256: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+        key = (account_id, session_name, sha256)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        file_id, stored_at = entry
+        if time.time() - stored_at > self._ttl_seconds():
+            del self._entries[key]
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return file_id
+
+    def put(self, account_id: str, session_name: str, sha256: str, file_id: str) -> None:
+        if not self.enabled or not file_id:
+            return
+        key = (account_id, session_name, sha256)
+        self._entries[key] = (file_id, time.time())
+        self._entries.move_to_end(key)
+        max_entries = self._max_entries()
+        while len(self._entries) > max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def record_upload(self, body_bytes: int, elapsed_ms: float) -> None:
+        self.uploads += 1
+        self.bytes_uploaded += body_bytes
+        self.upload_ms_avg = elapsed_ms if self.upload_ms_avg is None else self.upload_ms_avg * 0.9 + elapsed_ms * 0.1
+        self.upload_ms_max = max(self.upload_ms_max, elapsed_ms)
+
+    def record_failure(self) -> None:
+        self.upload_failures += 1
+
+    def record_saved(self, body_bytes: int) -> None:
+        """一次上传被复用（缓存命中或同一请求内去重）"""
+        self.round_trips_saved += 1
+        self.bytes_saved += body_bytes
+
+    def get_metrics(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "max_entries": self._max_entries(),
+            "ttl_seconds": self._ttl_seconds(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "uploads": self.uploads,
+            "upload_failures": self.upload_failures,
+            "upload_ms_avg": round(self.upload_ms_avg or 0.0, 2),
+            "upload_ms_max": round(self.upload_ms_max, 2),
+            "bytes_uploaded": self.bytes_uploaded,
+            "bytes_saved": self.bytes_saved,
+            "round_trips_saved": self.round_trips_saved,
+        }
+
+
+class UploadLimiter:
+    """全局上传并发上限（上限支持热更新，调小后已在进行的上传不受影响）"""
+
+    def __init__(self, limit: Callable[[], int]) -> None:
+        self._limit = limit
+        self._waiters: Deque[asyncio.Future] = deque()
+        self.active = 0
+        # 指标
+        self.peak_active = 0
+        self.queued = 0
+        self.wait_ms_total = 0.0
+
+    def _wake_next(self) -> None:
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+
+    async def acquire(self) -> None:
+        if self.active >= self._limit():
+            self.queued += 1
+            start = time.perf_counter()
+            loop = asyncio.get_running_loop()
+            while self.active >= self._limit():
+                waiter = loop.create_future()
+                self._waiters.append(waiter)
+                try:
+                    await waiter
+                except asyncio.CancelledError:
+                    # 已被唤醒却被取消：把名额让给下一个等待者
+                    if waiter.done() and not waiter.cancelled():
+                        self._wake_next()
+                    raise
+            self.wait_ms_total += (time.perf_counter() - start) * 1000
+        self.active += 1
+        self.peak_active = max(self.peak_active, self.active)
+
+    def release(self) -> None:
+        self.active -= 1
+        self._wake_next()
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        await self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def get_metrics(self) -> dict:
+        return {
+            "limit": self._limit(),
+            "active": self.active,
+            "waiting": sum(1 for waiter in self._waiters if not waiter.done()),
+            "peak_active": self.peak_active,
+            "queued": self.queued,
+            "wait_ms_total": round(self.wait_ms_total, 1),
+        }
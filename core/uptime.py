@@ -2,13 +2,19 @@
 Uptime 实时监控与心跳历史持久化。
 """
 
+import asyncio
+import contextlib
 from collections import deque
 from datetime import datetime, timezone, timedelta
-from typing import Dict, List, Optional
+from typing import Dict, Iterable, List, Optional
 import json
+import logging
 import os
+import tempfile
 from threading import Lock
 
+logger = logging.getLogger(__name__)
+
 # 北京时区 UTC+8
 BEIJING_TZ = timezone(timedelta(hours=8))
 
@@ -16,22 +22,21 @@ BEIJING_TZ = timezone(timedelta(hours=8))
 MAX_HEARTBEATS = 60
 SLOW_THRESHOLD_MS = 40000
 WARNING_STATUS_CODES = {429}
+# 心跳写盘的最小间隔（秒），期间的多次心跳合并为一次写入
+PERSIST_INTERVAL_SECONDS = 10
 
 _storage_path: Optional[str] = None
 _storage_lock = Lock()
+# 自上次写盘以来是否有新心跳
+_dirty = False
+_persist_task: Optional[asyncio.Task] = None
 
-# 服务注册表
+# 服务注册表（模型服务由 register_models 按 MODEL_MAPPING 注册）
 SERVICES = {
     "api_service": {"name": "API 服务", "heartbeats": deque(maxlen=MAX_HEARTBEATS)},
     "account_pool": {"name": "服务资源", "heartbeats": deque(maxlen=MAX_HEARTBEATS)},
-    "gemini-2.5-flash": {"name": "Gemini 2.5 Flash", "heartbeats": deque(maxlen=MAX_HEARTBEATS)},
-    "gemini-2.5-pro": {"name": "Gemini 2.5 Pro", "heartbeats": deque(maxlen=MAX_HEARTBEATS)},
-    "gemini-3-flash-preview": {"name": "Gemini 3 Flash Preview", "heartbeats": deque(maxlen=MAX_HEARTBEATS)},
-    "gemini-3-pro-preview": {"name": "Gemini 3 Pro Preview", "heartbeats": deque(maxlen=MAX_HEARTBEATS)},
 }
 
-SUPPORTED_MODELS = ["gemini-2.5-flash", "gemini-2.5-pro", "gemini-3-flash-preview", "gemini-3-pro-preview"]
-
 
 def configure_storage(path: Optional[str]) -> None:
     """配置心跳持久化路径。"""
@@ -39,6 +44,21 @@ def configure_storage(path: Optional[str]) -> None:
     _storage_path = path
 
 
+def _model_display_name(model_id: str) -> str:
+    """gemini-3-flash-preview -> Gemini 3 Flash Preview"""
+    return " ".join(part[:1].upper() + part[1:] for part in model_id.split("-") if part)
+
+
+def register_models(model_ids: Iterable[str]) -> None:
+    """为每个模型注册心跳队列（已注册的保持不变）。需在 load_heartbeats 之前调用。"""
+    for model_id in model_ids:
+        if model_id not in SERVICES:
+            SERVICES[model_id] = {
+                "name": _model_display_name(model_id),
+                "heartbeats": deque(maxlen=MAX_HEARTBEATS),
+            }
+
+
 def _classify_level(success: bool, status_code: Optional[int], latency_ms: Optional[int]) -> str:
     if status_code in WARNING_STATUS_CODES:
         return "warn"
@@ -47,18 +67,74 @@ def _classify_level(success: bool, status_code: Optional[int], latency_ms: Optio
     return "up" if success else "down"
 
 
-def _save_heartbeats() -> None:
-    if not _storage_path:
+def _write_heartbeats(path: str, payload: Dict[str, List[dict]]) -> None:
+    """序列化并原子写入心跳快照（在工作线程中执行）"""
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    with _storage_lock:
+        # 临时文件名唯一，多个进程同时写回不会写到同一个临时文件
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f"{os.path.basename(path)}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(payload, f, ensure_ascii=True, separators=(",", ":"))
+            os.replace(tmp_path, path)
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.remove(tmp_path)
+            raise
+
+
+async def flush_heartbeats() -> None:
+    """把内存中的心跳写盘（没有新心跳时跳过）"""
+    global _dirty
+    if not _storage_path or not _dirty:
         return
+    # 在事件循环线程内复制快照，序列化与写盘交给工作线程
+    payload = {service_id: list(data["heartbeats"]) for service_id, data in SERVICES.items()}
+    _dirty = False
     try:
-        payload = {}
-        for service_id, service_data in SERVICES.items():
-            payload[service_id] = list(service_data["heartbeats"])
-        os.makedirs(os.path.dirname(_storage_path), exist_ok=True)
-        with _storage_lock, open(_storage_path, "w", encoding="utf-8") as f:
-            json.dump(payload, f, ensure_ascii=True, indent=2)
-    except Exception:
-        return
+        await asyncio.to_thread(_write_heartbeats, _storage_path, payload)
+    except Exception as e:
+        _dirty = True
+        logger.error(f"[UPTIME] 心跳持久化失败: {type(e).__name__}: {str(e)[:100]}")
+
+
+async def _persist_loop() -> None:
+    try:
+        while True:
+            await asyncio.sleep(PERSIST_INTERVAL_SECONDS)
+            await flush_heartbeats()
+    except asyncio.CancelledError:
+        pass
+
+
+def start_persistence() -> None:
+    """启动后台心跳持久化任务（需在事件循环中调用）"""
+    global _persist_task
+    if _persist_task is None or _persist_task.done():
+        _persist_task = asyncio.create_task(_persist_loop())
+
+
+def cancel_persistence() -> None:
+    """停止后台心跳持久化任务，不再写盘（多 worker 时当前 worker 不再是 leader）"""
+    global _persist_task
+    if _persist_task is not None:
+        _persist_task.cancel()
+        _persist_task = None
+
+
+async def stop_persistence(flush: bool = True) -> None:
+    """停止后台任务并写回剩余心跳（用于关闭服务）"""
+    global _persist_task
+    if _persist_task is not None:
+        _persist_task.cancel()
+        try:
+            await _persist_task
+        except asyncio.CancelledError:
+            pass
+        _persist_task = None
+    if flush:
+        await flush_heartbeats()
 
 
 def load_heartbeats() -> None:
@@ -83,7 +159,8 @@ def record_request(
     latency_ms: Optional[int] = None,
     status_code: Optional[int] = None
 ):
-    """记录一次心跳。"""
+    """记录一次心跳（仅写内存，由后台任务定期持久化）。"""
+    global _dirty
     if service not in SERVICES:
         return
 
@@ -99,7 +176,7 @@ def record_request(
         heartbeat["status_code"] = status_code
 
     SERVICES[service]["heartbeats"].append(heartbeat)
-    _save_heartbeats()
+    _dirty = True
 
 
 def get_realtime_status() -> Dict:
@@ -84,6 +84,36 @@ export interface Settings {
   session: {
     expire_hours: number
   }
+  performance?: {
+    stats_flush_interval_seconds: number
+    stats_flush_max_pending: number
+    public_cache_ttl_seconds: number
+    session_cache_max_size: number
+    session_affinity_backend: 'memory' | 'sqlite' | 'postgres'
+    jwt_refresh_enabled: boolean
+    jwt_refresh_lead_seconds: number
+    jwt_refresh_jitter_seconds: number
+    session_pool_enabled: boolean
+    session_pool_max_per_account: number
+    session_pool_max_age_seconds: number
+    hedge_enabled: boolean
+    hedge_percentile: number
+    hedge_min_delay_ms: number
+    hedge_budget_percent: number
+    account_concurrency_enabled: boolean
+    account_concurrency_initial: number
+    account_concurrency_max: number
+    account_queue_timeout_seconds: number
+    upstream_http2: boolean
+    attachment_max_mb: number
+    attachment_total_max_mb: number
+    attachment_spool_threshold_kb: number
+    upload_cache_ttl_seconds: number
+    upload_cache_max_entries: number
+    upload_concurrency_per_request: number
+    upload_concurrency_global: number
+    conversation_key_hash: 'md5' | 'xxh3'
+  }
 }
 
 export interface LogEntry {
@@ -125,7 +155,7 @@ export type PublicLogStatus = 'success' | 'error' | 'timeout' | 'in_progress'
 
 export interface PublicLogEvent {
   time: string
-  type: 'start' | 'select' | 'retry' | 'switch' | 'complete'
+  type: 'start' | 'select' | 'retry' | 'switch' | 'hedge' | 'hedge_cancelled' | 'complete'
   status?: 'success' | 'error' | 'timeout'
   content: string
 }
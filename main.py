@@ -1,6 +1,6 @@
-import json, time, os, asyncio, uuid, ssl, re, yaml, shutil, base64
+import json, time, os, sys, asyncio, uuid, ssl, yaml, shutil, base64, tempfile, contextlib
 from datetime import datetime, timezone, timedelta
-from typing import List, Optional, Union, Dict, Any
+from typing import List, Optional, Union, Dict, Any, NamedTuple, AsyncIterator, Tuple
 from pathlib import Path
 import logging
 from dotenv import load_dotenv
@@ -13,6 +13,8 @@ from fastapi.responses import StreamingResponse, JSONResponse, FileResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 from util.streaming_parser import parse_json_array_stream_async
+from util import json_codec
+from util.sse_encoder import ChunkEncoder
 from collections import deque
 from threading import Lock
 
@@ -44,6 +46,7 @@ from core.session_auth import is_logged_in, login_user, logout_user, require_log
 # 导入核心模块
 from core.message import (
     get_conversation_key,
+    CONVERSATION_KEY_HASHES,
     parse_last_message,
     build_full_context_text
 )
@@ -56,6 +59,7 @@ from core.google_api import (
     save_image_to_hf
 )
 from core.account import (
+    CONCURRENCY_POLICY,
     AccountManager,
     MultiAccountManager,
     format_account_expiration,
@@ -69,6 +73,19 @@ from core.account import (
 
 # 导入 Uptime 追踪器
 from core import uptime as uptime_tracker
+from core.stats_writer import StatsWriter
+from core.time_buckets import RequestCounters
+from core.request_log import RequestEventLog
+from core.public_cache import PublicResponseCache
+from core.session_affinity import AFFINITY_BACKENDS, SessionAffinityStore, create_backend
+from core.shared_state import AccountStateSync, LeaderElection, SharedStats, get_shared_state_backend, merge_stats
+from core.jwt_refresher import JWTRefresher
+from core.session_pool import WarmSessionPool
+from core.hedging import UpstreamHedger
+from core.concurrency import concurrency_metrics
+from core.transport import UpstreamClients
+from core.attachments import Attachment, close_after
+from core.upload_cache import UploadCache, UploadLimiter
 
 # 导入配置管理和模板系统
 from core.config import config_manager, config
@@ -104,42 +121,73 @@ async def load_stats():
     return {
         "total_visitors": 0,
         "total_requests": 0,
-        "request_timestamps": [],
-        "model_request_timestamps": {},
-        "failure_timestamps": [],
-        "rate_limit_timestamps": [],
         "visitor_ips": {},
         "account_conversations": {},
         "recent_conversations": []
     }
 
-async def save_stats(stats):
-    """保存统计数据（异步，避免阻塞事件循环）"""
+def _write_file_atomic(path: str, payload: bytes) -> None:
+    """先写临时文件再原子替换，避免进程中断时留下半截文件（临时文件名唯一，多个进程不会互相覆盖）"""
+    fd, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(path) or ".", prefix=f"{os.path.basename(path)}.", suffix=".tmp"
+    )
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(payload)
+        os.replace(tmp_path, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(tmp_path)
+        raise
+
+async def save_shared_stats(payload: bytes):
+    """多 worker：把本地增量合并进数据库中的共享统计数据，并带回其他 worker 的变更"""
+    global request_counters
+    snapshot = json_codec.loads(payload)
+    merged = await shared_stats.merge(snapshot)
+    # 合并期间本地新增的变更（当前统计 - snapshot）保留在本地，计入下一次合并
+    current = merge_stats(merged, json_codec.loads(_snapshot_stats()), snapshot)
+    global_stats.clear()
+    global_stats.update(current)
+    request_counters = RequestCounters.from_stats(global_stats)
+
+async def save_stats_payload(payload: bytes):
+    """保存已序列化的统计数据快照（由 stats_writer 在后台调用）"""
+    if shared_stats.enabled:
+        await save_shared_stats(payload)
+        return
     if storage.is_database_enabled():
         try:
-            saved = await asyncio.to_thread(storage.save_stats_sync, stats)
+            saved = await asyncio.to_thread(storage.save_stats_payload_sync, payload.decode("utf-8"))
             if saved:
                 return
         except Exception as e:
             logger.error(f"[STATS] 数据库保存失败: {str(e)[:50]}")
-    try:
-        async with aiofiles.open(STATS_FILE, 'w', encoding='utf-8') as f:
-            await f.write(json.dumps(stats, ensure_ascii=False, indent=2))
-    except Exception as e:
-        logger.error(f"[STATS] 保存统计数据失败: {str(e)[:50]}")
+    await asyncio.to_thread(_write_file_atomic, STATS_FILE, payload)
+
+def _snapshot_stats() -> bytes:
+    """在事件循环线程内序列化统计数据，得到一致的快照"""
+    return json_codec.dumps({**global_stats, "counters": request_counters.to_dict()})
+
+# 统计数据批量写回：请求路径只标记变更，后台按间隔/变更数合并写回
+stats_writer = StatsWriter(
+    snapshot=_snapshot_stats,
+    save=save_stats_payload,
+    flush_interval=lambda: config.performance.stats_flush_interval_seconds,
+    max_pending=lambda: config.performance.stats_flush_max_pending,
+    sync_when_idle=lambda: shared_stats.enabled,
+)
 
 # 初始化统计数据（需要在启动时异步加载）
 global_stats = {
     "total_visitors": 0,
     "total_requests": 0,
-    "request_timestamps": [],
-    "model_request_timestamps": {},
-    "failure_timestamps": [],
-    "rate_limit_timestamps": [],
     "visitor_ips": {},
     "account_conversations": {},
     "recent_conversations": []
 }
+# 请求/失败/限流/模型请求数的分钟级分桶计数（持久化在统计数据的 "counters" 字段）
+request_counters = RequestCounters()
 
 
 def get_beijing_time_str(ts: Optional[float] = None) -> str:
@@ -213,18 +261,52 @@ def build_recent_conversation_entry(
     }
 
 class MemoryLogHandler(logging.Handler):
-    """自定义日志处理器，将日志写入内存缓冲区"""
+    """自定义日志处理器，将日志写入内存缓冲区（同时增量维护缓冲区内的统计）"""
+    def __init__(self):
+        super().__init__()
+        self.level_counts: Dict[str, int] = {}
+        self.error_count = 0
+        self.chat_count = 0
+
+    @staticmethod
+    def _is_error(entry: dict) -> bool:
+        return entry["level"] in ("ERROR", "CRITICAL")
+
+    @staticmethod
+    def _is_chat(entry: dict) -> bool:
+        return "收到请求" in entry["message"]
+
     def emit(self, record):
         log_entry = self.format(record)
         # 转换为北京时间（UTC+8）
         beijing_tz = timezone(timedelta(hours=8))
         beijing_time = datetime.fromtimestamp(record.created, tz=beijing_tz)
+        entry = {
+            "time": beijing_time.strftime("%Y-%m-%d %H:%M:%S"),
+            "level": record.levelname,
+            "message": record.getMessage()
+        }
         with log_lock:
-            log_buffer.append({
-                "time": beijing_time.strftime("%Y-%m-%d %H:%M:%S"),
-                "level": record.levelname,
-                "message": record.getMessage()
-            })
+            if len(log_buffer) == log_buffer.maxlen:
+                self._account(log_buffer[0], -1)  # 即将被挤出缓冲区的最旧日志
+            log_buffer.append(entry)
+            self._account(entry, 1)
+
+    def _account(self, entry: dict, delta: int) -> None:
+        level = entry["level"]
+        self.level_counts[level] = self.level_counts.get(level, 0) + delta
+        if not self.level_counts[level]:
+            del self.level_counts[level]
+        if self._is_error(entry):
+            self.error_count += delta
+        if self._is_chat(entry):
+            self.chat_count += delta
+
+    def reset_stats(self) -> None:
+        """清空缓冲区后调用（需持有 log_lock）"""
+        self.level_counts = {}
+        self.error_count = 0
+        self.chat_count = 0
 
 # 配置日志
 logging.basicConfig(
@@ -276,16 +358,8 @@ MODEL_MAPPING = {
 }
 
 # ---------- HTTP 客户端 ----------
-http_client = httpx.AsyncClient(
-    proxy=PROXY or None,
-    verify=False,
-    http2=False,
-    timeout=httpx.Timeout(TIMEOUT_SECONDS, connect=60.0),
-    limits=httpx.Limits(
-        max_keepalive_connections=100,  # 增加5倍：20 -> 100
-        max_connections=200              # 增加4倍：50 -> 200
-    )
-)
+# 按上游类别拆分连接池：对话流 / 控制请求 / JWT / 用户 URL 下载互不抢占连接
+upstream = UpstreamClients(PROXY, TIMEOUT_SECONDS, http2=config.performance.upstream_http2)
 
 # ---------- 工具函数 ----------
 def get_base_url(request: Request) -> str:
@@ -313,7 +387,7 @@ USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTM
 
 # 初始化多账户管理器
 multi_account_mgr = load_multi_account_config(
-    http_client,
+    upstream.auth,
     USER_AGENT,
     ACCOUNT_FAILURE_THRESHOLD,
     RATE_LIMIT_COOLDOWN_SECONDS,
@@ -321,6 +395,155 @@ multi_account_mgr = load_multi_account_config(
     global_stats
 )
 
+# JWT 后台预刷新（活跃账户在过期前带抖动地续签）
+jwt_refresher = JWTRefresher(
+    lambda: multi_account_mgr,
+    enabled=lambda: config.performance.jwt_refresh_enabled,
+    lead_seconds=lambda: config.performance.jwt_refresh_lead_seconds,
+    jitter_seconds=lambda: config.performance.jwt_refresh_jitter_seconds,
+)
+
+# 预热 Session 池（可选）：新对话/切换账户时直接取用已创建好的 Session
+warm_sessions = WarmSessionPool(
+    lambda: multi_account_mgr,
+    lambda account: create_google_session(account, upstream.control, USER_AGENT),
+    enabled=lambda: config.performance.session_pool_enabled,
+    max_per_account=lambda: config.performance.session_pool_max_per_account,
+    max_age_seconds=lambda: config.performance.session_pool_max_age_seconds,
+)
+
+async def obtain_google_session(account_manager: AccountManager, request_id: str = "") -> str:
+    """优先取用预热 Session，未命中时同步创建"""
+    session_name = warm_sessions.take(account_manager)
+    if session_name:
+        logger.info(f"[SESSION] [{account_manager.config.account_id}] [req_{request_id}] 使用预热 Session: {session_name[-12:]}")
+        return session_name
+    return await create_google_session(account_manager, upstream.control, USER_AGENT, request_id)
+
+# 附件上传缓存：(账户, Session, sha256) -> fileId，同一 Session 中已上传的附件不再重复上传
+upload_cache = UploadCache(
+    ttl_seconds=lambda: config.performance.upload_cache_ttl_seconds,
+    max_entries=lambda: config.performance.upload_cache_max_entries,
+)
+# 所有请求共享的附件上传并发上限
+upload_limiter = UploadLimiter(lambda: config.performance.upload_concurrency_global)
+
+def is_transient_upload_error(e: BaseException) -> bool:
+    """网络错误或上游 5xx：值得在同一 Session 上重试一次"""
+    if isinstance(e, HTTPException):
+        return e.status_code >= 500
+    return isinstance(e, (httpx.HTTPError, ssl.SSLError))
+
+async def upload_attachments(session_name: str, attachments: List[Attachment], account_manager: AccountManager, request_id: str = "") -> List[str]:
+    """上传附件到 Session，返回 fileId 列表（按附件顺序，内容相同的只保留一个）
+
+    已在该 Session 中上传过的附件复用缓存的 fileId，其余不同内容的附件并发上传
+    （受单请求与全局并发上限限制）。部分附件上传失败时，已成功的结果写入缓存，
+    失败的附件在同一 Session 上重试一次（仅限网络错误或 5xx），仍失败则抛出异常。
+    """
+    account_id = account_manager.config.account_id
+    digests = [await attachment.sha256() for attachment in attachments]
+    file_ids: Dict[str, str] = {}
+    pending: Dict[str, Attachment] = {}
+    for attachment, digest in zip(attachments, digests):
+        if digest in file_ids or digest in pending:
+            upload_cache.record_saved(attachment.base64_length)
+            continue
+        cached = upload_cache.get(account_id, session_name, digest)
+        if cached:
+            file_ids[digest] = cached
+            upload_cache.record_saved(attachment.base64_length)
+            continue
+        pending[digest] = attachment
+
+    reused = len(attachments) - len(pending)
+    if reused:
+        logger.info(f"[FILE] [{account_id}] [req_{request_id}] 复用已上传的文件: {reused}/{len(attachments)}")
+
+    if pending:
+        request_slots = asyncio.Semaphore(config.performance.upload_concurrency_per_request)
+
+        async def upload_one(attachment: Attachment) -> Tuple[str, float]:
+            async with request_slots, upload_limiter.slot():
+                start = time.perf_counter()
+                file_id = await upload_context_file(session_name, attachment, account_manager, upstream.control, USER_AGENT, request_id)
+                elapsed_ms = (time.perf_counter() - start) * 1000
+            upload_cache.record_upload(attachment.base64_length, elapsed_ms)
+            return file_id, elapsed_ms
+
+        started_at = time.perf_counter()
+        timings: List[str] = []
+        for attempt in range(2):
+            results = await asyncio.gather(*(upload_one(attachment) for attachment in pending.values()), return_exceptions=True)
+            failed: Dict[str, Attachment] = {}
+            errors: List[BaseException] = []
+            for (digest, attachment), result in zip(pending.items(), results):
+                if isinstance(result, BaseException):
+                    upload_cache.record_failure()
+                    failed[digest] = attachment
+                    errors.append(result)
+                    continue
+                file_id, elapsed_ms = result
+                upload_cache.put(account_id, session_name, digest, file_id)
+                file_ids[digest] = file_id
+                timings.append(f"{attachment.size // 1024}KB {elapsed_ms:.0f}ms")
+            if not failed:
+                break
+            # 只重试失败的附件；已成功的 fileId 保留
+            pending = failed
+            if attempt == 0 and all(is_transient_upload_error(e) for e in errors):
+                logger.warning(f"[FILE] [{account_id}] [req_{request_id}] {len(failed)} 个文件上传失败，重试失败的文件")
+                continue
+            break
+        total_ms = (time.perf_counter() - started_at) * 1000
+        if timings:
+            logger.info(f"[FILE] [{account_id}] [req_{request_id}] 上传 {len(timings)} 个文件，总耗时 {total_ms:.0f}ms: {', '.join(timings)}")
+        if failed:
+            raise errors[0]
+
+    return [file_ids[digest] for digest in dict.fromkeys(digests)]
+
+def record_account_failure(account_manager: AccountManager, e: Exception, request_id: str = "") -> bool:
+    """记录账户的一次对话失败，返回是否为429限流"""
+    # 429错误单独处理（不增加error_count，只设置冷却时间）
+    if isinstance(e, HTTPException) and e.status_code == 429:
+        account_manager.last_429_time = time.time()
+        account_manager.is_available = False  # 临时禁用，冷却期后自动恢复
+        logger.warning(f"[ACCOUNT] [{account_manager.config.account_id}] [req_{request_id}] 遇到429限流，账户将休息{RATE_LIMIT_COOLDOWN_SECONDS}秒后自动恢复")
+        return True
+    # 非429错误才增加失败计数
+    account_manager.last_error_time = time.time()
+    account_manager.error_count += 1
+    if account_manager.error_count >= ACCOUNT_FAILURE_THRESHOLD:
+        account_manager.is_available = False
+        logger.error(f"[ACCOUNT] [{account_manager.config.account_id}] [req_{request_id}] 请求连续失败{account_manager.error_count}次，账户已永久禁用")
+    return False
+
+# 对冲请求（可选）：首字超时后在另一个账户上并行发起请求，先出字的一方胜出
+upstream_hedger = UpstreamHedger(
+    enabled=lambda: config.performance.hedge_enabled,
+    percentile=lambda: config.performance.hedge_percentile,
+    min_delay_ms=lambda: config.performance.hedge_min_delay_ms,
+    budget_percent=lambda: config.performance.hedge_budget_percent,
+)
+
+# 多 worker 共享账户状态（SHARED_STATE_BACKEND=memory / postgres）
+SHARED_STATE_BACKEND = get_shared_state_backend()
+account_state_sync = AccountStateSync(SHARED_STATE_BACKEND, lambda: multi_account_mgr)
+multi_account_mgr.attach_state_sync(account_state_sync)
+# 多 worker 共享统计数据：写回时合并各 worker 的增量
+shared_stats = SharedStats(SHARED_STATE_BACKEND)
+
+# 会话亲和性持久化后端（memory / sqlite / postgres，重启后生效）
+# 共享状态使用 PostgreSQL 时，会话绑定也必须共享，否则其他 worker 无法继续对话
+affinity_backend_name = config.performance.session_affinity_backend
+if SHARED_STATE_BACKEND == "postgres" and affinity_backend_name == "memory":
+    affinity_backend_name = "postgres"
+session_affinity = SessionAffinityStore(
+    create_backend(affinity_backend_name, DATA_DIR),
+    ttl=lambda: SESSION_CACHE_TTL_SECONDS,
+)
+
 # ---------- 自动注册/刷新服务 ----------
 register_service = None
 login_service = None
@@ -341,7 +564,7 @@ try:
     from core.login_service import LoginService
     register_service = RegisterService(
         multi_account_mgr,
-        http_client,
+        upstream.auth,
         USER_AGENT,
         ACCOUNT_FAILURE_THRESHOLD,
         RATE_LIMIT_COOLDOWN_SECONDS,
@@ -351,7 +574,7 @@ try:
     )
     login_service = LoginService(
         multi_account_mgr,
-        http_client,
+        upstream.auth,
         USER_AGENT,
         ACCOUNT_FAILURE_THRESHOLD,
         RATE_LIMIT_COOLDOWN_SECONDS,
@@ -364,6 +587,26 @@ except Exception as e:
     register_service = None
     login_service = None
 
+# 只需在一个 worker 上运行的后台任务（由 leader 运行）
+_leader_tasks: List[asyncio.Task] = []
+
+def _start_leader_tasks():
+    """成为 leader：启动心跳写盘与账户过期检查轮询"""
+    uptime_tracker.start_persistence()
+    if login_service:
+        _leader_tasks.append(asyncio.create_task(login_service.start_polling()))
+        logger.info("[SYSTEM] 账户过期检查轮询已启动（间隔: 30分钟）")
+    else:
+        logger.info("[SYSTEM] 自动登录刷新未启用或依赖不可用")
+
+def _stop_leader_tasks():
+    """不再是 leader：停止单例任务，交给新的 leader"""
+    uptime_tracker.cancel_persistence()
+    while _leader_tasks:
+        _leader_tasks.pop().cancel()
+
+leader_election = LeaderElection(SHARED_STATE_BACKEND, _start_leader_tasks, _stop_leader_tasks)
+
 # 验证必需的环境变量
 if not ADMIN_KEY:
     logger.error("[SYSTEM] 未配置 ADMIN_KEY 环境变量，请设置后重启")
@@ -431,7 +674,7 @@ async def serve_logo():
 @app.get("/admin/health")
 async def health_check():
     """健康检查端点，用于 Docker HEALTHCHECK"""
-    return {"status": "ok"}
+    return {"status": "ok", "json_backend": json_codec.BACKEND}
 
 # ---------- Session 中间件配置 ----------
 from starlette.middleware.sessions import SessionMiddleware
@@ -525,7 +768,7 @@ async def auto_refresh_accounts_task():
                 # 重新加载账号配置
                 multi_account_mgr = _reload_accounts(
                     multi_account_mgr,
-                    http_client,
+                    upstream.auth,
                     USER_AGENT,
                     ACCOUNT_FAILURE_THRESHOLD,
                     RATE_LIMIT_COOLDOWN_SECONDS,
@@ -547,7 +790,7 @@ async def auto_refresh_accounts_task():
 @app.on_event("startup")
 async def startup_event():
     """应用启动时初始化后台任务"""
-    global global_stats
+    global global_stats, request_counters
 
     # 文件迁移逻辑：将根目录的旧文件迁移到 data 目录
     old_accounts = "accounts.json"
@@ -560,18 +803,36 @@ async def startup_event():
 
     # 加载统计数据
     global_stats = await load_stats()
-    global_stats.setdefault("request_timestamps", [])
-    global_stats.setdefault("model_request_timestamps", {})
-    global_stats.setdefault("failure_timestamps", [])
-    global_stats.setdefault("rate_limit_timestamps", [])
     global_stats.setdefault("recent_conversations", [])
+    # 旧版时间戳列表会在这里迁移为分桶计数
+    request_counters = RequestCounters.from_stats(global_stats)
+    if shared_stats.enabled:
+        # 以迁移后的计数作为增量基准，避免每个 worker 都把迁移出的计数再加一遍
+        shared_stats.set_base({**global_stats, "counters": request_counters.to_dict()})
     uptime_tracker.configure_storage(os.path.join(DATA_DIR, "uptime.json"))
+    uptime_tracker.register_models(MODEL_MAPPING.keys())
     uptime_tracker.load_heartbeats()
     logger.info(f"[SYSTEM] 统计数据已加载: {global_stats['total_requests']} 次请求, {global_stats['total_visitors']} 位访客")
+    stats_writer.start()
+    logger.info(f"[SYSTEM] 统计数据后台写回已启动（间隔: {config.performance.stats_flush_interval_seconds}秒）")
+
+    # 会话亲和性持久化（重启/多实例后继续使用原 Session）
+    multi_account_mgr.global_session_cache.store = session_affinity
+    session_affinity.start()
+    logger.info(f"[SYSTEM] 会话亲和性后端: {session_affinity.backend.name}")
+
+    # 多 worker 账户状态同步
+    account_state_sync.start()
+    logger.info(f"[SYSTEM] 共享状态后端: {SHARED_STATE_BACKEND}")
+
+    jwt_refresher.start()
+    logger.info("[SYSTEM] JWT 后台刷新任务已启动")
+
+    warm_sessions.start()
 
     # 启动缓存清理任务
     asyncio.create_task(multi_account_mgr.start_background_cleanup())
-    logger.info("[SYSTEM] 后台缓存清理任务已启动（间隔: 5分钟）")
+    logger.info("[SYSTEM] 后台缓存清理任务已启动（间隔: 1分钟）")
 
     # 启动自动刷新账号任务（仅数据库模式有效）
     if os.environ.get("ACCOUNTS_CONFIG"):
@@ -582,220 +843,25 @@ async def startup_event():
     elif storage.is_database_enabled():
         logger.info("[SYSTEM] 自动刷新账号功能已禁用（配置为0）")
 
-    # 启动自动登录刷新轮询
-    if login_service:
-        try:
-            asyncio.create_task(login_service.start_polling())
-            logger.info("[SYSTEM] 账户过期检查轮询已启动（间隔: 30分钟）")
-        except Exception as e:
-            logger.error(f"[SYSTEM] 启动登录服务失败: {e}")
-    else:
-        logger.info("[SYSTEM] 自动登录刷新未启用或依赖不可用")
-
-# ---------- 日志脱敏函数 ----------
-def get_sanitized_logs(limit: int = 100) -> list:
-    """获取脱敏后的日志列表，按请求ID分组并提取关键事件"""
-    with log_lock:
-        logs = list(log_buffer)
-
-    # 按请求ID分组（支持两种格式：带[req_xxx]和不带的）
-    request_logs = {}
-    orphan_logs = []  # 没有request_id的日志（如选择账户）
-
-    for log in logs:
-        message = log["message"]
-        req_match = re.search(r'\[req_([a-z0-9]+)\]', message)
-
-        if req_match:
-            request_id = req_match.group(1)
-            if request_id not in request_logs:
-                request_logs[request_id] = []
-            request_logs[request_id].append(log)
-        else:
-            # 没有request_id的日志（如选择账户），暂存
-            orphan_logs.append(log)
-
-    # 将orphan_logs（如选择账户）关联到对应的请求
-    # 策略：将orphan日志关联到时间上最接近的后续请求
-    for orphan in orphan_logs:
-        orphan_time = orphan["time"]
-        # 找到时间上最接近且在orphan之后的请求
-        closest_request_id = None
-        min_time_diff = None
-
-        for request_id, req_logs in request_logs.items():
-            if req_logs:
-                first_log_time = req_logs[0]["time"]
-                # orphan应该在请求之前或同时
-                if first_log_time >= orphan_time:
-                    if min_time_diff is None or first_log_time < min_time_diff:
-                        min_time_diff = first_log_time
-                        closest_request_id = request_id
-
-        # 如果找到最接近的请求，将orphan日志插入到该请求的日志列表开头
-        if closest_request_id:
-            request_logs[closest_request_id].insert(0, orphan)
-
-    # 为每个请求提取关键事件
-    sanitized = []
-    for request_id, req_logs in request_logs.items():
-        # 收集关键信息
-        model = None
-        message_count = None
-        retry_events = []
-        final_status = "in_progress"
-        duration = None
-        start_time = req_logs[0]["time"]
-
-        # 遍历该请求的所有日志
-        for log in req_logs:
-            message = log["message"]
-
-            # 提取模型名称和消息数量（开始对话）
-            if '收到请求:' in message and not model:
-                model_match = re.search(r'收到请求: ([^ |]+)', message)
-                if model_match:
-                    model = model_match.group(1)
-                count_match = re.search(r'(\d+)条消息', message)
-                if count_match:
-                    message_count = int(count_match.group(1))
-
-            # 提取重试事件（包括失败尝试、账户切换、选择账户）
-            # 注意：不提取"正在重试"日志，因为它和"失败 (尝试"是配套的
-            if any(keyword in message for keyword in ['切换账户', '选择账户', '失败 (尝试']):
-                retry_events.append({
-                    "time": log["time"],
-                    "message": message
-                })
-
-            # 提取响应完成（最高优先级 - 最终成功则忽略中间错误）
-            if '响应完成:' in message:
-                time_match = re.search(r'响应完成: ([\d.]+)秒', message)
-                if time_match:
-                    duration = time_match.group(1) + 's'
-                    final_status = "success"
-
-            # 检测非流式响应完成
-            if '非流式响应完成' in message:
-                final_status = "success"
-
-            # 检测失败状态（仅在非success状态下）
-            if final_status != "success" and (log['level'] == 'ERROR' or '失败' in message):
-                final_status = "error"
-
-            # 检测超时（仅在非success状态下）
-            if final_status != "success" and '超时' in message:
-                final_status = "timeout"
-
-        # 如果没有模型信息但有错误，仍然显示
-        if not model and final_status == "in_progress":
-            continue
-
-        # 构建关键事件列表
-        events = []
-
-        # 1. 开始对话
-        if model:
-            events.append({
-                "time": start_time,
-                "type": "start",
-                "content": f"{model} | {message_count}条消息" if message_count else model
-            })
-        else:
-            # 没有模型信息但有错误的情况
-            events.append({
-                "time": start_time,
-                "type": "start",
-                "content": "请求处理中"
-            })
-
-        # 2. 重试事件
-        failure_count = 0  # 失败重试计数
-        account_select_count = 0  # 账户选择计数
-
-        for i, retry in enumerate(retry_events):
-            msg = retry["message"]
-
-            # 识别不同类型的重试事件（按优先级匹配）
-            if '失败 (尝试' in msg:
-                # 创建会话失败
-                failure_count += 1
-                events.append({
-                    "time": retry["time"],
-                    "type": "retry",
-                    "content": f"服务异常，正在重试（{failure_count}）"
-                })
-            elif '选择账户' in msg:
-                # 账户选择/切换
-                account_select_count += 1
-
-                # 检查下一条日志是否是"切换账户"，如果是则跳过当前"选择账户"（避免重复）
-                next_is_switch = (i + 1 < len(retry_events) and '切换账户' in retry_events[i + 1]["message"])
-
-                if not next_is_switch:
-                    if account_select_count == 1:
-                        # 第一次选择：显示为"选择服务节点"
-                        events.append({
-                            "time": retry["time"],
-                            "type": "select",
-                            "content": "选择服务节点"
-                        })
-                    else:
-                        # 第二次及以后：显示为"切换服务节点"
-                        events.append({
-                            "time": retry["time"],
-                            "type": "switch",
-                            "content": "切换服务节点"
-                        })
-            elif '切换账户' in msg:
-                # 运行时切换账户（显示为"切换服务节点"）
-                events.append({
-                    "time": retry["time"],
-                    "type": "switch",
-                    "content": "切换服务节点"
-                })
-
-        # 3. 完成事件
-        if final_status == "success":
-            if duration:
-                events.append({
-                    "time": req_logs[-1]["time"],
-                    "type": "complete",
-                    "status": "success",
-                    "content": f"响应完成 | 耗时{duration}"
-                })
-            else:
-                events.append({
-                    "time": req_logs[-1]["time"],
-                    "type": "complete",
-                    "status": "success",
-                    "content": "响应完成"
-                })
-        elif final_status == "error":
-            events.append({
-                "time": req_logs[-1]["time"],
-                "type": "complete",
-                "status": "error",
-                "content": "请求失败"
-            })
-        elif final_status == "timeout":
-            events.append({
-                "time": req_logs[-1]["time"],
-                "type": "complete",
-                "status": "timeout",
-                "content": "请求超时"
-            })
-
-        sanitized.append({
-            "request_id": request_id,
-            "start_time": start_time,
-            "status": final_status,
-            "events": events
-        })
-
-    # 按时间排序并限制数量
-    sanitized.sort(key=lambda x: x["start_time"], reverse=True)
-    return sanitized[:limit]
+    # 心跳写盘与自动登录刷新轮询只在 leader 上运行（单 worker 时始终是 leader）
+    leader_election.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """应用关闭时写回尚未持久化的数据"""
+    await stats_writer.close()
+    await uptime_tracker.stop_persistence(flush=leader_election.is_leader)
+    await leader_election.close()
+    await session_affinity.close()
+    await jwt_refresher.stop()
+    await warm_sessions.stop()
+    await account_state_sync.close()
+    await upstream.aclose()
+    logger.info("[SYSTEM] 统计数据、心跳记录与会话绑定已写回")
+
+# ---------- 请求事件索引 ----------
+# 对话请求的关键事件在发生时直接写入，/public/log 按需读取最近 N 条
+request_events = RequestEventLog(capacity=log_buffer.maxlen)
 
 class Message(BaseModel):
     role: str
@@ -808,21 +874,45 @@ class ChatRequest(BaseModel):
     temperature: Optional[float] = 0.7
     top_p: Optional[float] = 1.0
 
-def create_chunk(id: str, created: int, model: str, delta: dict, finish_reason: Union[str, None]) -> str:
-    chunk = {
-        "id": id,
-        "object": "chat.completion.chunk",
-        "created": created,
-        "model": model,
-        "choices": [{
-            "index": 0,
-            "delta": delta,
-            "logprobs": None,  # OpenAI 标准字段
-            "finish_reason": finish_reason
-        }],
-        "system_fingerprint": None  # OpenAI 标准字段（可选）
-    }
-    return json.dumps(chunk)
+class ChatDelta(NamedTuple):
+    """对话生成器产出的结构化增量事件（只在流式出口才编码为 SSE）"""
+    delta: dict
+    finish_reason: Optional[str] = None
+
+def is_first_token(event) -> bool:
+    """对冲判定：首个内容（含思考过程）或结束事件"""
+    return isinstance(event, ChatDelta) and (
+        event.finish_reason is not None or "content" in event.delta or "reasoning_content" in event.delta
+    )
+
+class ChatError(NamedTuple):
+    """对话生成器产出的错误事件（流式出口编码为 error 事件，非流式忽略）"""
+    message: str
+
+SSE_DONE = b"data: [DONE]\n\n"
+
+def format_sse(payload: bytes) -> bytes:
+    """封装为一条 SSE data 事件（字节形式，StreamingResponse 无需再次编码）"""
+    return b"data: " + payload + b"\n\n"
+
+async def encode_sse_events(events: AsyncIterator[Union[ChatDelta, ChatError]], chat_id: str, created: int, model: str):
+    """流式出口：把结构化事件编码为 SSE 字节流（信封字段按补全预序列化一次）"""
+    encoder = ChunkEncoder(chat_id, created, model)
+    async for event in events:
+        if isinstance(event, ChatError):
+            yield format_sse(json_codec.dumps({"error": {"message": event.message}}))
+            continue
+        delta = event.delta
+        if event.finish_reason:
+            yield encoder.encode(delta, event.finish_reason)
+            yield SSE_DONE
+        elif len(delta) == 1 and "content" in delta:
+            yield encoder.content(delta["content"])
+        elif len(delta) == 1 and "reasoning_content" in delta:
+            yield encoder.reasoning(delta["reasoning_content"])
+        else:
+            yield encoder.encode(delta)
+
 # ---------- Auth endpoints (API) ----------
 
 @app.post("/login")
@@ -850,7 +940,6 @@ async def admin_logout(request: Request):
 @require_login()
 async def admin_stats(request: Request):
     now = time.time()
-    window_seconds = 12 * 3600
 
     active_accounts = 0
     failed_accounts = 0
@@ -883,51 +972,16 @@ async def admin_stats(request: Request):
     start_ts = start_dt.timestamp()
     labels = [(start_dt + timedelta(hours=i)).strftime("%H:00") for i in range(12)]
 
-    def bucketize(timestamps: list) -> list:
-        buckets = [0] * 12
-        for ts in timestamps:
-            idx = int((ts - start_ts) // 3600)
-            if 0 <= idx < 12:
-                buckets[idx] += 1
-        return buckets
+    def bucketize(counter) -> list:
+        return counter.histogram(start_ts, 3600, 12, now)
 
-    async with stats_lock:
-        global_stats.setdefault("request_timestamps", [])
-        global_stats.setdefault("failure_timestamps", [])
-        global_stats.setdefault("rate_limit_timestamps", [])
-        global_stats.setdefault("model_request_timestamps", {})
-        global_stats["request_timestamps"] = [
-            ts for ts in global_stats["request_timestamps"]
-            if now - ts < window_seconds
-        ]
-        global_stats["failure_timestamps"] = [
-            ts for ts in global_stats["failure_timestamps"]
-            if now - ts < window_seconds
-        ]
-        global_stats["rate_limit_timestamps"] = [
-            ts for ts in global_stats["rate_limit_timestamps"]
-            if now - ts < window_seconds
-        ]
-        model_request_timestamps = {}
-        for model, timestamps in global_stats["model_request_timestamps"].items():
-            model_request_timestamps[model] = [
-                ts for ts in timestamps
-                if now - ts < window_seconds
-            ]
-        global_stats["model_request_timestamps"] = model_request_timestamps
-
-        await save_stats(global_stats)
-
-        request_timestamps = list(global_stats["request_timestamps"])
-        failure_timestamps = list(global_stats["failure_timestamps"])
-        rate_limit_timestamps = list(global_stats["rate_limit_timestamps"])
-        model_request_timestamps = global_stats.get("model_request_timestamps", {})
-        model_requests = {}
-        for model in MODEL_MAPPING.keys():
-            model_requests[model] = bucketize(model_request_timestamps.get(model, []))
-        for model, timestamps in model_request_timestamps.items():
-            if model not in model_requests:
-                model_requests[model] = bucketize(timestamps)
+    model_requests = {}
+    for model in MODEL_MAPPING.keys():
+        counter = request_counters.models.get(model)
+        model_requests[model] = bucketize(counter) if counter else [0] * 12
+    for model, counter in request_counters.models.items():
+        if model not in model_requests:
+            model_requests[model] = bucketize(counter)
 
     return {
         "total_accounts": total_accounts,
@@ -937,13 +991,35 @@ async def admin_stats(request: Request):
         "idle_accounts": idle_accounts,
         "trend": {
             "labels": labels,
-            "total_requests": bucketize(request_timestamps),
-            "failed_requests": bucketize(failure_timestamps),
-            "rate_limited_requests": bucketize(rate_limit_timestamps),
+            "total_requests": bucketize(request_counters.requests),
+            "failed_requests": bucketize(request_counters.failures),
+            "rate_limited_requests": bucketize(request_counters.rate_limits),
             "model_requests": model_requests,
         }
     }
 
+@app.get("/admin/metrics")
+@require_login()
+async def admin_metrics(request: Request):
+    """获取内部子系统的运行指标"""
+    return {
+        "stats_writer": stats_writer.get_metrics(),
+        "public_cache": public_cache.get_metrics(),
+        "session_cache": multi_account_mgr.global_session_cache.get_metrics(),
+        "session_locks": multi_account_mgr.session_locks.get_metrics(),
+        "session_affinity": session_affinity.get_metrics(),
+        "shared_state": account_state_sync.get_metrics(),
+        "shared_stats": shared_stats.get_metrics(),
+        "leader": leader_election.get_metrics(),
+        "jwt_refresher": jwt_refresher.get_metrics(),
+        "session_pool": warm_sessions.get_metrics(),
+        "hedging": upstream_hedger.get_metrics(),
+        "account_concurrency": concurrency_metrics(CONCURRENCY_POLICY, multi_account_mgr.accounts.values()),
+        "upstream": upstream.get_metrics(),
+        "upload_cache": upload_cache.get_metrics(),
+        "upload_limiter": upload_limiter.get_metrics(),
+    }
+
 @app.get("/admin/accounts")
 @require_login()
 async def admin_get_accounts(request: Request):
@@ -989,7 +1065,7 @@ async def admin_update_config(request: Request, accounts_data: list = Body(...))
     global multi_account_mgr
     try:
         multi_account_mgr = _update_accounts_config(
-            accounts_data, multi_account_mgr, http_client, USER_AGENT,
+            accounts_data, multi_account_mgr, upstream.auth, USER_AGENT,
             ACCOUNT_FAILURE_THRESHOLD, RATE_LIMIT_COOLDOWN_SECONDS,
             SESSION_CACHE_TTL_SECONDS, global_stats
         )
@@ -1069,7 +1145,7 @@ async def admin_delete_account(request: Request, account_id: str):
     global multi_account_mgr
     try:
         multi_account_mgr = _delete_account(
-            account_id, multi_account_mgr, http_client, USER_AGENT,
+            account_id, multi_account_mgr, upstream.auth, USER_AGENT,
             ACCOUNT_FAILURE_THRESHOLD, RATE_LIMIT_COOLDOWN_SECONDS,
             SESSION_CACHE_TTL_SECONDS, global_stats
         )
@@ -1085,7 +1161,7 @@ async def admin_disable_account(request: Request, account_id: str):
     global multi_account_mgr
     try:
         multi_account_mgr = _update_account_disabled_status(
-            account_id, True, multi_account_mgr, http_client, USER_AGENT,
+            account_id, True, multi_account_mgr, upstream.auth, USER_AGENT,
             ACCOUNT_FAILURE_THRESHOLD, RATE_LIMIT_COOLDOWN_SECONDS,
             SESSION_CACHE_TTL_SECONDS, global_stats
         )
@@ -1101,7 +1177,7 @@ async def admin_enable_account(request: Request, account_id: str):
     global multi_account_mgr
     try:
         multi_account_mgr = _update_account_disabled_status(
-            account_id, False, multi_account_mgr, http_client, USER_AGENT,
+            account_id, False, multi_account_mgr, upstream.auth, USER_AGENT,
             ACCOUNT_FAILURE_THRESHOLD, RATE_LIMIT_COOLDOWN_SECONDS,
             SESSION_CACHE_TTL_SECONDS, global_stats
         )
@@ -1159,6 +1235,36 @@ async def admin_get_settings(request: Request):
         },
         "session": {
             "expire_hours": config.session.expire_hours
+        },
+        "performance": {
+            "stats_flush_interval_seconds": config.performance.stats_flush_interval_seconds,
+            "stats_flush_max_pending": config.performance.stats_flush_max_pending,
+            "public_cache_ttl_seconds": config.performance.public_cache_ttl_seconds,
+            "session_cache_max_size": config.performance.session_cache_max_size,
+            "session_affinity_backend": config.performance.session_affinity_backend,
+            "jwt_refresh_enabled": config.performance.jwt_refresh_enabled,
+            "jwt_refresh_lead_seconds": config.performance.jwt_refresh_lead_seconds,
+            "jwt_refresh_jitter_seconds": config.performance.jwt_refresh_jitter_seconds,
+            "session_pool_enabled": config.performance.session_pool_enabled,
+            "session_pool_max_per_account": config.performance.session_pool_max_per_account,
+            "session_pool_max_age_seconds": config.performance.session_pool_max_age_seconds,
+            "hedge_enabled": config.performance.hedge_enabled,
+            "hedge_percentile": config.performance.hedge_percentile,
+            "hedge_min_delay_ms": config.performance.hedge_min_delay_ms,
+            "hedge_budget_percent": config.performance.hedge_budget_percent,
+            "account_concurrency_enabled": config.performance.account_concurrency_enabled,
+            "account_concurrency_initial": config.performance.account_concurrency_initial,
+            "account_concurrency_max": config.performance.account_concurrency_max,
+            "account_queue_timeout_seconds": config.performance.account_queue_timeout_seconds,
+            "upstream_http2": config.performance.upstream_http2,
+            "attachment_max_mb": config.performance.attachment_max_mb,
+            "attachment_total_max_mb": config.performance.attachment_total_max_mb,
+            "attachment_spool_threshold_kb": config.performance.attachment_spool_threshold_kb,
+            "upload_cache_ttl_seconds": config.performance.upload_cache_ttl_seconds,
+            "upload_cache_max_entries": config.performance.upload_cache_max_entries,
+            "upload_concurrency_per_request": config.performance.upload_concurrency_per_request,
+            "upload_concurrency_global": config.performance.upload_concurrency_global,
+            "conversation_key_hash": config.performance.conversation_key_hash
         }
     }
 
@@ -1170,7 +1276,7 @@ async def admin_update_settings(request: Request, new_settings: dict = Body(...)
     global IMAGE_GENERATION_ENABLED, IMAGE_GENERATION_MODELS
     global MAX_NEW_SESSION_TRIES, MAX_REQUEST_RETRIES, MAX_ACCOUNT_SWITCH_TRIES
     global ACCOUNT_FAILURE_THRESHOLD, RATE_LIMIT_COOLDOWN_SECONDS, SESSION_CACHE_TTL_SECONDS, AUTO_REFRESH_ACCOUNTS_SECONDS
-    global SESSION_EXPIRE_HOURS, multi_account_mgr, http_client
+    global SESSION_EXPIRE_HOURS, multi_account_mgr
 
     try:
         basic = dict(new_settings.get("basic") or {})
@@ -1198,6 +1304,43 @@ async def admin_update_settings(request: Request, new_settings: dict = Body(...)
         retry.setdefault("auto_refresh_accounts_seconds", config.retry.auto_refresh_accounts_seconds)
         new_settings["retry"] = retry
 
+        performance = dict(new_settings.get("performance") or {})
+        performance.setdefault("stats_flush_interval_seconds", config.performance.stats_flush_interval_seconds)
+        performance.setdefault("stats_flush_max_pending", config.performance.stats_flush_max_pending)
+        performance.setdefault("public_cache_ttl_seconds", config.performance.public_cache_ttl_seconds)
+        performance.setdefault("session_cache_max_size", config.performance.session_cache_max_size)
+        affinity_backend = str(performance.get("session_affinity_backend") or config.performance.session_affinity_backend).lower()
+        if affinity_backend not in AFFINITY_BACKENDS:
+            affinity_backend = "memory"
+        performance["session_affinity_backend"] = affinity_backend
+        performance.setdefault("jwt_refresh_enabled", config.performance.jwt_refresh_enabled)
+        performance.setdefault("jwt_refresh_lead_seconds", config.performance.jwt_refresh_lead_seconds)
+        performance.setdefault("jwt_refresh_jitter_seconds", config.performance.jwt_refresh_jitter_seconds)
+        performance.setdefault("session_pool_enabled", config.performance.session_pool_enabled)
+        performance.setdefault("session_pool_max_per_account", config.performance.session_pool_max_per_account)
+        performance.setdefault("session_pool_max_age_seconds", config.performance.session_pool_max_age_seconds)
+        performance.setdefault("hedge_enabled", config.performance.hedge_enabled)
+        performance.setdefault("hedge_percentile", config.performance.hedge_percentile)
+        performance.setdefault("hedge_min_delay_ms", config.performance.hedge_min_delay_ms)
+        performance.setdefault("hedge_budget_percent", config.performance.hedge_budget_percent)
+        performance.setdefault("account_concurrency_enabled", config.performance.account_concurrency_enabled)
+        performance.setdefault("account_concurrency_initial", config.performance.account_concurrency_initial)
+        performance.setdefault("account_concurrency_max", config.performance.account_concurrency_max)
+        performance.setdefault("account_queue_timeout_seconds", config.performance.account_queue_timeout_seconds)
+        performance.setdefault("upstream_http2", config.performance.upstream_http2)
+        performance.setdefault("attachment_max_mb", config.performance.attachment_max_mb)
+        performance.setdefault("attachment_total_max_mb", config.performance.attachment_total_max_mb)
+        performance.setdefault("attachment_spool_threshold_kb", config.performance.attachment_spool_threshold_kb)
+        performance.setdefault("upload_cache_ttl_seconds", config.performance.upload_cache_ttl_seconds)
+        performance.setdefault("upload_cache_max_entries", config.performance.upload_cache_max_entries)
+        performance.setdefault("upload_concurrency_per_request", config.performance.upload_concurrency_per_request)
+        performance.setdefault("upload_concurrency_global", config.performance.upload_concurrency_global)
+        key_hash = str(performance.get("conversation_key_hash") or config.performance.conversation_key_hash).lower()
+        if key_hash not in CONVERSATION_KEY_HASHES:
+            key_hash = "md5"
+        performance["conversation_key_hash"] = key_hash
+        new_settings["performance"] = performance
+
         # 保存旧配置用于对比
         old_proxy = PROXY
         old_retry_config = {
@@ -1229,22 +1372,12 @@ async def admin_update_settings(request: Request, new_settings: dict = Body(...)
         AUTO_REFRESH_ACCOUNTS_SECONDS = config.retry.auto_refresh_accounts_seconds
         SESSION_EXPIRE_HOURS = config.session.expire_hours
 
-        # 检查是否需要重建 HTTP 客户端（代理变化）
-        if old_proxy != PROXY:
-            logger.info(f"[CONFIG] 代理配置已变化，重建 HTTP 客户端")
-            await http_client.aclose()  # 关闭旧客户端
-            http_client = httpx.AsyncClient(
-                proxy=PROXY or None,
-                verify=False,
-                http2=False,
-                timeout=httpx.Timeout(TIMEOUT_SECONDS, connect=60.0),
-                limits=httpx.Limits(
-                    max_keepalive_connections=100,
-                    max_connections=200
-                )
-            )
+        # 检查是否需要重建 HTTP 客户端（代理或 HTTP/2 配置变化）
+        if old_proxy != PROXY or upstream.http2_requested != config.performance.upstream_http2:
+            logger.info(f"[CONFIG] 代理或 HTTP/2 配置已变化，重建 HTTP 客户端")
+            await upstream.rebuild(PROXY, TIMEOUT_SECONDS, config.performance.upstream_http2)
             # 更新所有账户的 http_client 引用
-            multi_account_mgr.update_http_client(http_client)
+            multi_account_mgr.update_http_client(upstream.auth)
 
         # 检查是否需要更新账户管理器配置（重试策略变化）
         retry_changed = (
@@ -1253,6 +1386,9 @@ async def admin_update_settings(request: Request, new_settings: dict = Body(...)
             old_retry_config["session_cache_ttl_seconds"] != SESSION_CACHE_TTL_SECONDS
         )
 
+        # 会话缓存容量调小时立即淘汰超出部分
+        multi_account_mgr.global_session_cache.capacity = config.performance.session_cache_max_size
+
         if retry_changed:
             logger.info(f"[CONFIG] 重试策略已变化，更新账户管理器配置")
             # 更新所有账户管理器的配置
@@ -1260,6 +1396,7 @@ async def admin_update_settings(request: Request, new_settings: dict = Body(...)
             for account_id, account_mgr in multi_account_mgr.accounts.items():
                 account_mgr.account_failure_threshold = ACCOUNT_FAILURE_THRESHOLD
                 account_mgr.rate_limit_cooldown_seconds = RATE_LIMIT_COOLDOWN_SECONDS
+            multi_account_mgr.pool.rebuild()
 
         logger.info(f"[CONFIG] 系统设置已更新并实时生效")
         return {"status": "success", "message": "设置已保存并实时生效！"}
@@ -1277,32 +1414,40 @@ async def admin_get_logs(
     start_time: str = None,
     end_time: str = None
 ):
-    with log_lock:
-        logs = list(log_buffer)
-
-    stats_by_level = {}
-    error_logs = []
-    chat_count = 0
-    for log in logs:
-        level_name = log.get("level", "INFO")
-        stats_by_level[level_name] = stats_by_level.get(level_name, 0) + 1
-        if level_name in ["ERROR", "CRITICAL"]:
-            error_logs.append(log)
-        if "收到请求" in log.get("message", ""):
-            chat_count += 1
-
     if level:
         level = level.upper()
-        logs = [log for log in logs if log["level"] == level]
-    if search:
-        logs = [log for log in logs if search.lower() in log["message"].lower()]
-    if start_time:
-        logs = [log for log in logs if log["time"] >= start_time]
-    if end_time:
-        logs = [log for log in logs if log["time"] <= end_time]
+    search_lower = search.lower() if search else None
+    limit = max(0, min(limit, log_buffer.maxlen))
 
-    limit = min(limit, log_buffer.maxlen)
-    filtered_logs = logs[-limit:]
+    # 从最新的日志倒序筛选，凑够 limit 条即停止
+    filtered_logs = []
+    with log_lock:
+        if limit:
+            for log in reversed(log_buffer):
+                if level and log["level"] != level:
+                    continue
+                if search_lower and search_lower not in log["message"].lower():
+                    continue
+                if start_time and log["time"] < start_time:
+                    continue
+                if end_time and log["time"] > end_time:
+                    continue
+                filtered_logs.append(log)
+                if len(filtered_logs) >= limit:
+                    break
+        total_logs = len(log_buffer)
+        stats_by_level = dict(memory_handler.level_counts)
+        error_count = memory_handler.error_count
+        chat_count = memory_handler.chat_count
+        recent_errors = []
+        if error_count:
+            for log in reversed(log_buffer):
+                if log["level"] in ("ERROR", "CRITICAL"):
+                    recent_errors.append(log)
+                    if len(recent_errors) >= 10:
+                        break
+    filtered_logs.reverse()
+    recent_errors.reverse()
 
     return {
         "total": len(filtered_logs),
@@ -1310,8 +1455,8 @@ async def admin_get_logs(
         "filters": {"level": level, "search": search, "start_time": start_time, "end_time": end_time},
         "logs": filtered_logs,
         "stats": {
-            "memory": {"total": len(log_buffer), "by_level": stats_by_level, "capacity": log_buffer.maxlen},
-            "errors": {"count": len(error_logs), "recent": error_logs[-10:]},
+            "memory": {"total": total_logs, "by_level": stats_by_level, "capacity": log_buffer.maxlen},
+            "errors": {"count": error_count, "recent": recent_errors},
             "chat_count": chat_count
         }
     }
@@ -1324,6 +1469,8 @@ async def admin_clear_logs(request: Request, confirm: str = None):
     with log_lock:
         cleared_count = len(log_buffer)
         log_buffer.clear()
+        memory_handler.reset_stats()
+    request_events.clear()
     logger.info("[LOG] 日志已清空")
     return {"status": "success", "message": "已清空内存日志", "cleared_count": cleared_count}
 
@@ -1366,6 +1513,7 @@ async def chat_impl(
     start_ts = time.time()
     request.state.first_response_time = None
     message_count = len(req.messages)
+    request_events.start(request_id, req.model, message_count, start_ts)
 
     monitor_recorded = False
 
@@ -1387,6 +1535,7 @@ async def chat_impl(
             latency_ms = int(duration_s * 1000)
 
         uptime_tracker.record_request("api_service", status == "success", latency_ms, status_code)
+        request_events.complete(request_id, status, duration_s if status == "success" else None)
 
         entry = build_recent_conversation_entry(
             request_id=request_id,
@@ -1399,17 +1548,15 @@ async def chat_impl(
         )
 
         async with stats_lock:
-            global_stats.setdefault("failure_timestamps", [])
-            global_stats.setdefault("rate_limit_timestamps", [])
             global_stats.setdefault("recent_conversations", [])
             if status != "success":
                 if status_code == 429:
-                    global_stats["rate_limit_timestamps"].append(time.time())
+                    request_counters.record_rate_limit()
                 else:
-                    global_stats["failure_timestamps"].append(time.time())
+                    request_counters.record_failure()
             global_stats["recent_conversations"].append(entry)
             global_stats["recent_conversations"] = global_stats["recent_conversations"][-60:]
-            await save_stats(global_stats)
+            stats_writer.mark_dirty()
 
     def classify_error_status(status_code: Optional[int], error: Exception) -> str:
         if status_code == 504:
@@ -1428,12 +1575,9 @@ async def chat_impl(
 
     # 记录请求统计
     async with stats_lock:
-        timestamp = time.time()
         global_stats["total_requests"] += 1
-        global_stats["request_timestamps"].append(timestamp)
-        global_stats.setdefault("model_request_timestamps", {})
-        global_stats["model_request_timestamps"].setdefault(req.model, []).append(timestamp)
-        await save_stats(global_stats)
+        request_counters.record_request(req.model)
+        stats_writer.mark_dirty()
 
     # 2. 模型校验
     if req.model not in MODEL_MAPPING:
@@ -1448,12 +1592,11 @@ async def chat_impl(
     request.state.model = req.model
 
     # 3. 生成会话指纹，获取Session锁（防止同一对话的并发请求冲突）
-    conv_key = get_conversation_key([m.model_dump() for m in req.messages], client_ip)
-    session_lock = await multi_account_mgr.acquire_session_lock(conv_key)
+    conv_key = get_conversation_key(req.messages, client_ip, config.performance.conversation_key_hash)
 
     # 4. 在锁的保护下检查缓存和处理Session（保证同一对话的请求串行化）
-    async with session_lock:
-        cached_session = multi_account_mgr.global_session_cache.get(conv_key)
+    async with multi_account_mgr.session_lock(conv_key):
+        cached_session = await multi_account_mgr.get_session_cache(conv_key)
 
         if cached_session:
             # 使用已绑定的账户
@@ -1470,7 +1613,8 @@ async def chat_impl(
             for attempt in range(max_account_tries):
                 try:
                     account_manager = await multi_account_mgr.get_account(None, request_id)
-                    google_session = await create_google_session(account_manager, http_client, USER_AGENT, request_id)
+                    request_events.select(request_id)
+                    google_session = await obtain_google_session(account_manager, request_id)
                     # 线程安全地绑定账户到此对话
                     await multi_account_mgr.set_session_cache(
                         conv_key,
@@ -1488,6 +1632,7 @@ async def chat_impl(
                     # 安全获取账户ID
                     account_id = account_manager.config.account_id if 'account_manager' in locals() and account_manager else 'unknown'
                     logger.error(f"[CHAT] [req_{request_id}] 账户 {account_id} 创建会话失败 (尝试 {attempt + 1}/{max_account_tries}) - {error_type}: {str(e)}")
+                    request_events.retry(request_id)
                     # 记录账号池状态（单个账户失败）
                     status_code = e.status_code if isinstance(e, HTTPException) else None
                     uptime_tracker.record_request("account_pool", False, status_code=status_code)
@@ -1520,7 +1665,7 @@ async def chat_impl(
 
     # 3. 解析请求内容
     try:
-        last_text, current_images = await parse_last_message(req.messages, http_client, request_id)
+        last_text, current_images = await parse_last_message(req.messages, upstream.fetch, request_id)
     except HTTPException as e:
         status = classify_error_status(e.status_code, e)
         await finalize_result(status, e.status_code, f"HTTP {e.status_code}: {e.detail}")
@@ -1561,6 +1706,68 @@ async def chat_impl(
         # 记录已失败的账户，避免重复使用
         failed_accounts = set()
 
+        # 对冲请求：在另一个账户上用新 Session 发送完整上下文
+        hedge_state = {}
+
+        async def hedge_attempt():
+            try:
+                hedge_account = await multi_account_mgr.get_account(
+                    None, request_id, exclude=failed_accounts | {account_manager.config.account_id}
+                )
+            except HTTPException:
+                logger.info(f"[CHAT] [req_{request_id}] 没有其他可用账户，放弃对冲")
+                return
+            logger.info(f"[CHAT] [req_{request_id}] 对冲请求: {account_manager.config.account_id} + {hedge_account.config.account_id}")
+            request_events.hedge(request_id)
+            hedge_state["account"] = hedge_account
+            redeemed = False
+            try:
+                hedge_session = await obtain_google_session(hedge_account, request_id)
+                hedge_file_ids = await upload_attachments(hedge_session, current_images, hedge_account, request_id)
+                hedge_state.update(session=hedge_session, file_ids=hedge_file_ids)
+                async for event in stream_chat_generator(
+                    hedge_session,
+                    build_full_context_text(req.messages),
+                    hedge_file_ids,
+                    req.model,
+                    hedge_account,
+                    request_id,
+                    request,
+                    chat_id
+                ):
+                    yield event
+                    # 首个事件（role）之后生成器会立即进入 concurrency.slot()，兑现 get_account 的预占
+                    redeemed = True
+            finally:
+                if not redeemed:
+                    # 在发出上游请求之前失败或被取消：撤销预占，避免该账户在预占有效期内显得更忙
+                    hedge_account.concurrency.cancel_reservation()
+
+        async def on_hedge_winner(index: int):
+            nonlocal account_manager, current_session, current_file_ids, current_retry_mode
+            if index == 0:
+                return
+            # 对冲请求胜出：后续对话绑定到对冲账户的 Session
+            account_manager = hedge_state["account"]
+            current_session = hedge_state["session"]
+            current_file_ids = hedge_state["file_ids"]
+            current_retry_mode = True
+            await multi_account_mgr.set_session_cache(conv_key, account_manager.config.account_id, current_session)
+
+        def on_hedge_loser(index: int, error: Optional[BaseException], elapsed_ms: float):
+            loser = account_manager if index == 0 else hedge_state.get("account")
+            if error is None:
+                # 被取消的一方没有完成请求：不计入可用性统计，作为单独的结果记录到请求事件
+                request_events.hedge_cancelled(request_id, index == 0, elapsed_ms)
+                return
+            status_code = error.status_code if isinstance(error, HTTPException) else None
+            uptime_tracker.record_request("account_pool", False, status_code=status_code)
+            if loser is not None:
+                failed_accounts.add(loser.config.account_id)
+                logger.warning(f"[CHAT] [{loser.config.account_id}] [req_{request_id}] 对冲中的请求失败: {type(error).__name__}: {str(error)[:200]}")
+                if isinstance(error, (httpx.HTTPError, ssl.SSLError, HTTPException)):
+                    record_account_failure(loser, error, request_id)
+
         # 重试逻辑：最多尝试 max_retries+1 次（初次+重试）
         while retry_count <= max_retries:
             try:
@@ -1568,7 +1775,7 @@ async def chat_impl(
                 cached = multi_account_mgr.global_session_cache.get(conv_key)
                 if not cached:
                     logger.warning(f"[CHAT] [{account_manager.config.account_id}] [req_{request_id}] 缓存已清理，重建Session")
-                    new_sess = await create_google_session(account_manager, http_client, USER_AGENT, request_id)
+                    new_sess = await obtain_google_session(account_manager, request_id)
                     await multi_account_mgr.set_session_cache(
                         conv_key,
                         account_manager.config.account_id,
@@ -1583,33 +1790,36 @@ async def chat_impl(
                 # A. 如果有图片且还没上传到当前 Session，先上传
                 # 注意：每次重试如果是新 Session，都需要重新上传图片
                 if current_images and not current_file_ids:
-                    for img in current_images:
-                        fid = await upload_context_file(current_session, img["mime"], img["data"], account_manager, http_client, USER_AGENT, request_id)
-                        current_file_ids.append(fid)
+                    current_file_ids = await upload_attachments(current_session, current_images, account_manager, request_id)
 
                 # B. 准备文本 (重试模式下发全文)
                 if current_retry_mode:
                     current_text = build_full_context_text(req.messages)
 
-                # C. 发起对话
-                async for chunk in stream_chat_generator(
-                    current_session,
-                    current_text,
-                    current_file_ids,
-                    req.model,
-                    chat_id,
-                    created_time,
-                    account_manager,
-                    req.stream,
-                    request_id,
-                    request
+                # C. 发起对话（开启对冲时，首字超时会在其他账户上同时发起请求）
+                async for event in upstream_hedger.stream(
+                    stream_chat_generator(
+                        current_session,
+                        current_text,
+                        current_file_ids,
+                        req.model,
+                        account_manager,
+                        request_id,
+                        request,
+                        chat_id
+                    ),
+                    hedge_attempt,
+                    is_first_token,
+                    on_hedge_winner,
+                    on_hedge_loser,
+                    log_tag=f"[{account_manager.config.account_id}] [req_{request_id}]",
                 ):
-                    yield chunk
+                    yield event
 
                 # 请求成功，重置账户失败计数
                 account_manager.is_available = True
                 account_manager.error_count = 0
-                account_manager.conversation_count += 1  # 增加对话次数
+                account_manager.record_conversation()  # 增加对话次数
 
                 # 记录账号池状态（请求成功）
                 uptime_tracker.record_request("account_pool", True)
@@ -1619,7 +1829,7 @@ async def chat_impl(
                     if "account_conversations" not in global_stats:
                         global_stats["account_conversations"] = {}
                     global_stats["account_conversations"][account_manager.config.account_id] = account_manager.conversation_count
-                    await save_stats(global_stats)
+                    stats_writer.mark_dirty()
 
                 await finalize_result("success", 200, None)
 
@@ -1641,20 +1851,7 @@ async def chat_impl(
                 uptime_tracker.record_request("account_pool", False, status_code=status_code)
 
                 # 检查是否为429错误（Rate Limit）
-                is_rate_limit = isinstance(e, HTTPException) and e.status_code == 429
-
-                # 429错误单独处理（不增加error_count，只设置冷却时间）
-                if is_rate_limit:
-                    account_manager.last_429_time = time.time()
-                    account_manager.is_available = False  # 临时禁用，冷却期后自动恢复
-                    logger.warning(f"[ACCOUNT] [{account_manager.config.account_id}] [req_{request_id}] 遇到429限流，账户将休息{RATE_LIMIT_COOLDOWN_SECONDS}秒后自动恢复")
-                else:
-                    # 非429错误才增加失败计数
-                    account_manager.last_error_time = time.time()
-                    account_manager.error_count += 1
-                    if account_manager.error_count >= ACCOUNT_FAILURE_THRESHOLD:
-                        account_manager.is_available = False
-                        logger.error(f"[ACCOUNT] [{account_manager.config.account_id}] [req_{request_id}] 请求连续失败{account_manager.error_count}次，账户已永久禁用")
+                is_rate_limit = record_account_failure(account_manager, e, request_id)
 
                 retry_count += 1
 
@@ -1676,42 +1873,27 @@ async def chat_impl(
                     logger.warning(f"[CHAT] [{account_manager.config.account_id}] [req_{request_id}] 正在重试 ({retry_count}/{max_retries})")
 
                     # 快速失败：检查是否还有可用账户（避免无效重试）
-                    available_count = sum(
-                        1 for acc in multi_account_mgr.accounts.values()
-                        if (acc.should_retry() and
-                            not acc.config.is_expired() and
-                            not acc.config.disabled and
-                            acc.config.account_id not in failed_accounts)
+                    available_count = multi_account_mgr.pool.available_count() - sum(
+                        1 for acc_id in failed_accounts
+                        if multi_account_mgr.pool.is_selectable(acc_id)
                     )
 
                     if available_count == 0:
                         logger.error(f"[CHAT] [req_{request_id}] 所有账户均不可用，快速失败")
                         await finalize_result("error", 503, "All accounts unavailable")
-                        if req.stream: yield f"data: {json.dumps({'error': {'message': 'All accounts unavailable'}})}\n\n"
+                        yield ChatError('All accounts unavailable')
                         return
 
                     # 尝试切换到其他账户（客户端会传递完整上下文）
                     try:
-                        # 获取新账户，跳过已失败的账户
-                        max_account_tries = min(MAX_ACCOUNT_SWITCH_TRIES, available_count)  # 限制尝试次数
-                        new_account = None
-
-                        for _ in range(max_account_tries):
-                            candidate = await multi_account_mgr.get_account(None, request_id)
-                            if candidate.config.account_id not in failed_accounts:
-                                new_account = candidate
-                                break
-
-                        if not new_account:
-                            logger.error(f"[CHAT] [req_{request_id}] 所有可用账户均已失败")
-                            await finalize_result("error", 503, "All available accounts failed")
-                            if req.stream: yield f"data: {json.dumps({'error': {'message': 'All available accounts failed'}})}\n\n"
-                            return
+                        # 获取新账户，直接在选择时跳过已失败的账户（只预占实际使用的账户）
+                        new_account = await multi_account_mgr.get_account(None, request_id, exclude=failed_accounts)
 
                         logger.info(f"[CHAT] [req_{request_id}] 切换账户: {account_manager.config.account_id} -> {new_account.config.account_id}")
+                        request_events.switch(request_id)
 
                         # 创建新 Session
-                        new_sess = await create_google_session(new_account, http_client, USER_AGENT, request_id)
+                        new_sess = await obtain_google_session(new_account, request_id)
 
                         # 更新缓存绑定到新账户
                         await multi_account_mgr.set_session_cache(
@@ -1738,35 +1920,35 @@ async def chat_impl(
                         status = classify_error_status(status_code, create_err)
 
                         await finalize_result(status, status_code, f"Account Failover Failed: {str(create_err)[:200]}")
-                        if req.stream: yield f"data: {json.dumps({'error': {'message': 'Account Failover Failed'}})}\n\n"
+                        yield ChatError('Account Failover Failed')
                         return
                 else:
                     # 已达到最大重试次数
                     logger.error(f"[CHAT] [req_{request_id}] 已达到最大重试次数 ({max_retries})，请求失败")
                     status = classify_error_status(status_code, e)
                     await finalize_result(status, status_code, error_detail)
-                    if req.stream: yield f"data: {json.dumps({'error': {'message': f'Max retries ({max_retries}) exceeded: {e}'}})}\n\n"
+                    yield ChatError(f'Max retries ({max_retries}) exceeded: {e}')
                     return
 
     if req.stream:
-        return StreamingResponse(response_wrapper(), media_type="text/event-stream")
-    
-    full_content = ""
-    full_reasoning = ""
-    async for chunk_str in response_wrapper():
-        if chunk_str.startswith("data: [DONE]"): break
-        if chunk_str.startswith("data: "):
-            try:
-                data = json.loads(chunk_str[6:])
-                delta = data["choices"][0]["delta"]
-                if "content" in delta:
-                    full_content += delta["content"]
-                if "reasoning_content" in delta:
-                    full_reasoning += delta["reasoning_content"]
-            except json.JSONDecodeError as e:
-                logger.error(f"[CHAT] [{account_manager.config.account_id}] [req_{request_id}] JSON解析失败: {str(e)}")
-            except (KeyError, IndexError) as e:
-                logger.error(f"[CHAT] [{account_manager.config.account_id}] [req_{request_id}] 响应格式错误 ({type(e).__name__}): {str(e)}")
+        return StreamingResponse(
+            encode_sse_events(close_after(response_wrapper(), current_images), chat_id, created_time, req.model),
+            media_type="text/event-stream"
+        )
+
+    # 非流式：直接聚合结构化事件，最后一次性拼接
+    content_parts = []
+    reasoning_parts = []
+    async for event in close_after(response_wrapper(), current_images):
+        if isinstance(event, ChatError):
+            continue
+        delta = event.delta
+        if "content" in delta:
+            content_parts.append(delta["content"])
+        if "reasoning_content" in delta:
+            reasoning_parts.append(delta["reasoning_content"])
+    full_content = "".join(content_parts)
+    full_reasoning = "".join(reasoning_parts)
 
     # 构建响应消息
     message = {"role": "assistant", "content": full_content}
@@ -1826,10 +2008,12 @@ def parse_images_from_response(data_list: list) -> tuple[list, str]:
     return file_ids, session_name
 
 
-async def stream_chat_generator(session: str, text_content: str, file_ids: List[str], model_name: str, chat_id: str, created_time: int, account_manager: AccountManager, is_stream: bool = True, request_id: str = "", request: Request = None):
+async def stream_chat_generator(session: str, text_content: str, file_ids: List[str], model_name: str, account_manager: AccountManager, request_id: str = "", request: Request = None, chat_id: str = ""):
+    """调用 widgetStreamAssist，产出结构化的 ChatDelta 事件（SSE 编码由出口负责）"""
     start_time = time.time()
-    full_content = ""
+    content_parts = []
     first_response_time = None
+    first_reasoning_time = None
 
     # 记录发送给API的内容
     text_preview = text_content[:500] + "...(已截断)" if len(text_content) > 500 else text_content
@@ -1872,28 +2056,31 @@ async def stream_chat_generator(session: str, text_content: str, file_ids: List[
             "modelId": target_model_id
         }
 
-    if is_stream:
-        chunk = create_chunk(chat_id, created_time, model_name, {"role": "assistant"}, None)
-        yield f"data: {chunk}\n\n"
+    yield ChatDelta({"role": "assistant"})
 
     # 使用流式请求
     json_objects = []  # 收集所有响应对象用于图片解析
     file_ids_info = None  # 保存图片信息
 
-    async with http_client.stream(
+    # 占用账户的并发名额（满载时排队），直到上游流结束
+    concurrency = account_manager.concurrency
+    async with concurrency.slot(), upstream.streaming.stream(
         "POST",
         "https://biz-discoveryengine.googleapis.com/v1alpha/locations/global/widgetStreamAssist",
         headers=headers,
         json=body,
     ) as r:
+        sent_time = time.time()  # 排队结束、请求发出的时间（自适应并发按此计算首字延迟）
         if r.status_code != 200:
             error_text = await r.aread()
             uptime_tracker.record_request(model_name, False, status_code=r.status_code)
+            if r.status_code == 429:
+                concurrency.on_rate_limited()
             raise HTTPException(status_code=r.status_code, detail=f"Upstream Error {error_text.decode()}")
 
-        # 使用异步解析器处理 JSON 数组流
+        # 使用异步解析器直接按字节块处理 JSON 数组流（无需先按行解码）
         try:
-            async for json_obj in parse_json_array_stream_async(r.aiter_lines()):
+            async for json_obj in parse_json_array_stream_async(r.aiter_bytes()):
                 json_objects.append(json_obj)  # 收集响应
 
                 # 提取文本内容
@@ -1906,16 +2093,19 @@ async def stream_chat_generator(session: str, text_content: str, file_ids: List[
 
                     # 区分思考过程和正常内容
                     if content_obj.get("thought"):
+                        if first_reasoning_time is None:
+                            first_reasoning_time = time.time()
                         # 思考过程使用 reasoning_content 字段（类似 OpenAI o1）
-                        chunk = create_chunk(chat_id, created_time, model_name, {"reasoning_content": text}, None)
-                        yield f"data: {chunk}\n\n"
+                        yield ChatDelta({"reasoning_content": text})
                     else:
                         if first_response_time is None:
                             first_response_time = time.time()
                         # 正常内容使用 content 字段
-                        full_content += text
-                        chunk = create_chunk(chat_id, created_time, model_name, {"content": text}, None)
-                        yield f"data: {chunk}\n\n"
+                        content_parts.append(text)
+                        yield ChatDelta({"content": text})
+
+            first_token_at = first_response_time or first_reasoning_time
+            concurrency.on_success((first_token_at - sent_time) * 1000 if first_token_at else None)
 
             # 提取图片信息（在 async with 块内）
             if json_objects:
@@ -1938,7 +2128,7 @@ async def stream_chat_generator(session: str, text_content: str, file_ids: List[
         file_ids, session_name = file_ids_info
         try:
             base_url = get_base_url(request) if request else ""
-            file_metadata = await get_session_file_metadata(account_manager, session_name, http_client, USER_AGENT, request_id)
+            file_metadata = await get_session_file_metadata(account_manager, session_name, upstream.control, USER_AGENT, request_id)
 
             # 并行下载所有图片
             download_tasks = []
@@ -1947,7 +2137,7 @@ async def stream_chat_generator(session: str, text_content: str, file_ids: List[
                 mime = file_info["mimeType"]
                 meta = file_metadata.get(fid, {})
                 correct_session = meta.get("session") or session_name
-                task = download_image_with_jwt(account_manager, correct_session, fid, http_client, USER_AGENT, request_id)
+                task = download_image_with_jwt(account_manager, correct_session, fid, upstream.control, USER_AGENT, request_id)
                 download_tasks.append((fid, mime, task))
 
             results = await asyncio.gather(*[task for _, _, task in download_tasks], return_exceptions=True)
@@ -1959,8 +2149,7 @@ async def stream_chat_generator(session: str, text_content: str, file_ids: List[
                     logger.error(f"[IMAGE] [{account_manager.config.account_id}] [req_{request_id}] 图片{idx}下载失败: {type(result).__name__}: {str(result)[:100]}")
                     # 降级处理：返回错误提示而不是静默失败
                     error_msg = f"\n\n⚠️ 图片 {idx} 下载失败\n\n"
-                    chunk = create_chunk(chat_id, created_time, model_name, {"content": error_msg}, None)
-                    yield f"data: {chunk}\n\n"
+                    yield ChatDelta({"content": error_msg})
                     continue
 
                 try:
@@ -1979,13 +2168,11 @@ async def stream_chat_generator(session: str, text_content: str, file_ids: List[
                         logger.info(f"[IMAGE] [{account_manager.config.account_id}] [req_{request_id}] 图片{idx}已保存: {image_url}")
 
                     success_count += 1
-                    chunk = create_chunk(chat_id, created_time, model_name, {"content": markdown}, None)
-                    yield f"data: {chunk}\n\n"
+                    yield ChatDelta({"content": markdown})
                 except Exception as save_error:
                     logger.error(f"[IMAGE] [{account_manager.config.account_id}] [req_{request_id}] 图片{idx}处理失败: {str(save_error)[:100]}")
                     error_msg = f"\n\n⚠️ 图片 {idx} 处理失败\n\n"
-                    chunk = create_chunk(chat_id, created_time, model_name, {"content": error_msg}, None)
-                    yield f"data: {chunk}\n\n"
+                    yield ChatDelta({"content": error_msg})
 
             logger.info(f"[IMAGE] [{account_manager.config.account_id}] [req_{request_id}] 图片处理完成: {success_count}/{len(file_ids)} 成功")
 
@@ -1993,9 +2180,9 @@ async def stream_chat_generator(session: str, text_content: str, file_ids: List[
             logger.error(f"[IMAGE] [{account_manager.config.account_id}] [req_{request_id}] 图片处理失败: {type(e).__name__}: {str(e)[:100]}")
             # 降级处理：通知用户图片处理失败
             error_msg = f"\n\n⚠️ 图片处理失败: {type(e).__name__}\n\n"
-            chunk = create_chunk(chat_id, created_time, model_name, {"content": error_msg}, None)
-            yield f"data: {chunk}\n\n"
+            yield ChatDelta({"content": error_msg})
 
+    full_content = "".join(content_parts)
     if full_content:
         response_preview = full_content[:500] + "...(已截断)" if len(full_content) > 500 else full_content
         logger.info(f"[CHAT] [{account_manager.config.account_id}] [req_{request_id}] AI响应: {response_preview}")
@@ -2009,56 +2196,76 @@ async def stream_chat_generator(session: str, text_content: str, file_ids: List[
     total_time = time.time() - start_time
     logger.info(f"[API] [{account_manager.config.account_id}] [req_{request_id}] 响应完成: {total_time:.2f}秒")
     
-    if is_stream:
-        final_chunk = create_chunk(chat_id, created_time, model_name, {}, "stop")
-        yield f"data: {final_chunk}\n\n"
-        yield "data: [DONE]\n\n"
+    yield ChatDelta({}, "stop")
 
 # ---------- 公开端点（无需认证） ----------
+# 状态页轮询的响应缓存（短 TTL + ETag），访客计数只改内存，由 stats_writer 定期写回
+public_cache = PublicResponseCache()
+VISITOR_WINDOW_SECONDS = 86400
+_visitor_pruned_at = 0.0
+
+
+def record_visitor(client_ip: str) -> None:
+    """记录公开页访客（24小时内同一IP只计数一次）"""
+    global _visitor_pruned_at
+    current_time = time.time()
+    visitor_ips = global_stats.setdefault("visitor_ips", {})
+
+    # 清理24小时前的IP记录（每分钟最多一次）
+    if current_time - _visitor_pruned_at >= 60:
+        _visitor_pruned_at = current_time
+        expired = [ip for ip, ts in visitor_ips.items() if current_time - ts > VISITOR_WINDOW_SECONDS]
+        for ip in expired:
+            del visitor_ips[ip]
+        if expired:
+            stats_writer.mark_dirty()
+
+    last_seen = visitor_ips.get(client_ip)
+    if last_seen is None or current_time - last_seen > VISITOR_WINDOW_SECONDS:
+        visitor_ips[client_ip] = current_time
+        global_stats["total_visitors"] = global_stats.get("total_visitors", 0) + 1
+        stats_writer.mark_dirty()
+
+
 @app.get("/public/uptime")
-async def get_public_uptime(days: int = 90):
+async def get_public_uptime(request: Request, days: int = 90):
     """获取 Uptime 监控数据（JSON格式）"""
     if days < 1 or days > 90:
         days = 90
-    return await uptime_tracker.get_uptime_summary(days)
+    return public_cache.respond(
+        request, ("uptime", days), config.performance.public_cache_ttl_seconds,
+        uptime_tracker.get_realtime_status
+    )
+
+
+def build_public_stats() -> dict:
+    # 计算每分钟请求数
+    requests_per_minute = request_counters.requests.count_last(60)
+
+    # 计算负载状态
+    if requests_per_minute < 10:
+        load_status = "low"
+        load_color = "#10b981"  # 绿色
+    elif requests_per_minute < 30:
+        load_status = "medium"
+        load_color = "#f59e0b"  # 黄色
+    else:
+        load_status = "high"
+        load_color = "#ef4444"  # 红色
+
+    return {
+        "total_visitors": global_stats["total_visitors"],
+        "total_requests": global_stats["total_requests"],
+        "requests_per_minute": requests_per_minute,
+        "load_status": load_status,
+        "load_color": load_color
+    }
 
 
 @app.get("/public/stats")
-async def get_public_stats():
+async def get_public_stats(request: Request):
     """获取公开统计信息"""
-    async with stats_lock:
-        # 清理1小时前的请求时间戳
-        current_time = time.time()
-        recent_requests = [
-            ts for ts in global_stats["request_timestamps"]
-            if current_time - ts < 3600
-        ]
-
-        # 计算每分钟请求数
-        recent_minute = [
-            ts for ts in recent_requests
-            if current_time - ts < 60
-        ]
-        requests_per_minute = len(recent_minute)
-
-        # 计算负载状态
-        if requests_per_minute < 10:
-            load_status = "low"
-            load_color = "#10b981"  # 绿色
-        elif requests_per_minute < 30:
-            load_status = "medium"
-            load_color = "#f59e0b"  # 黄色
-        else:
-            load_status = "high"
-            load_color = "#ef4444"  # 红色
-
-        return {
-            "total_visitors": global_stats["total_visitors"],
-            "total_requests": global_stats["total_requests"],
-            "requests_per_minute": requests_per_minute,
-            "load_status": load_status,
-            "load_color": load_color
-        }
+    return public_cache.respond(request, "stats", config.performance.public_cache_ttl_seconds, build_public_stats)
 
 @app.get("/public/display")
 async def get_public_display():
@@ -2068,63 +2275,51 @@ async def get_public_display():
         "chat_url": CHAT_URL
     }
 
-@app.get("/public/log")
-async def get_public_logs(request: Request, limit: int = 100):
-    try:
-        # 基于IP的访问统计（24小时内去重）
-        client_ip = request.client.host
-        current_time = time.time()
 
-        async with stats_lock:
-            # 清理24小时前的IP记录
-            if "visitor_ips" not in global_stats:
-                global_stats["visitor_ips"] = {}
-            global_stats["visitor_ips"] = {
-                ip: timestamp for ip, timestamp in global_stats["visitor_ips"].items()
-                if current_time - timestamp <= 86400
-            }
-
-            # 记录新访问（24小时内同一IP只计数一次）
-            if client_ip not in global_stats["visitor_ips"]:
-                global_stats["visitor_ips"][client_ip] = current_time
-                global_stats["total_visitors"] = global_stats.get("total_visitors", 0) + 1
+def build_public_logs(limit: int) -> dict:
+    """合并实时请求事件与持久化的最近对话（按开始时间倒序）"""
+    stored_logs = global_stats.get("recent_conversations", [])
+    live_logs = request_events.recent(limit=limit)
 
-            global_stats.setdefault("recent_conversations", [])
-            await save_stats(global_stats)
+    log_map = {log.get("request_id"): log for log in live_logs}
+    for log in stored_logs:
+        request_id = log.get("request_id")
+        if request_id and request_id not in log_map:
+            log_map[request_id] = log
 
-            stored_logs = list(global_stats.get("recent_conversations", []))
+    def get_log_ts(item: dict) -> float:
+        if "start_ts" in item:
+            return float(item["start_ts"])
+        try:
+            return datetime.strptime(item.get("start_time", ""), "%Y-%m-%d %H:%M:%S").timestamp()
+        except Exception:
+            return 0.0
+
+    merged_logs = sorted(log_map.values(), key=get_log_ts, reverse=True)[:limit]
+    output_logs = []
+    for log in merged_logs:
+        if "start_ts" in log:
+            log = dict(log)
+            log.pop("start_ts", None)
+        output_logs.append(log)
 
-        sanitized_logs = get_sanitized_logs(limit=min(limit, 1000))
+    return {
+        "total": len(output_logs),
+        "logs": output_logs
+    }
 
-        log_map = {log.get("request_id"): log for log in sanitized_logs}
-        for log in stored_logs:
-            request_id = log.get("request_id")
-            if request_id and request_id not in log_map:
-                log_map[request_id] = log
 
-        def get_log_ts(item: dict) -> float:
-            if "start_ts" in item:
-                return float(item["start_ts"])
-            try:
-                return datetime.strptime(item.get("start_time", ""), "%Y-%m-%d %H:%M:%S").timestamp()
-            except Exception:
-                return 0.0
-
-        merged_logs = sorted(log_map.values(), key=get_log_ts, reverse=True)[:min(limit, 1000)]
-        output_logs = []
-        for log in merged_logs:
-            if "start_ts" in log:
-                log = dict(log)
-                log.pop("start_ts", None)
-            output_logs.append(log)
-
-        return {
-            "total": len(output_logs),
-            "logs": output_logs
-        }
-    except Exception as e:
-        logger.error(f"[LOG] 获取公开日志失败: {e}")
-        return {"total": 0, "logs": [], "error": str(e)}
+@app.get("/public/log")
+async def get_public_logs(request: Request, limit: int = 100):
+    try:
+        # 基于IP的访问统计（24小时内去重）
+        record_visitor(request.client.host if request.client else "unknown")
+
+        limit = max(1, min(limit, 1000))
+        return public_cache.respond(
+            request, ("log", limit), config.performance.public_cache_ttl_seconds,
+            lambda: build_public_logs(limit)
+        )
     except Exception as e:
         logger.error(f"[LOG] 获取公开日志失败: {e}")
         return {"total": 0, "logs": [], "error": str(e)}
@@ -2142,4 +2337,13 @@ async def not_found_handler(request: Request, exc: HTTPException):
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("PORT", "7860"))
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    workers = int(os.getenv("WORKERS", "1"))
+    if workers > 1:
+        if SHARED_STATE_BACKEND != "postgres":
+            # 各 worker 会各自覆盖统计数据、心跳记录并重复运行后台任务
+            logger.error("[SYSTEM] 多 worker 模式需要 SHARED_STATE_BACKEND=postgres（并配置 DATABASE_URL）")
+            sys.exit(1)
+        # 多 worker 需要以导入字符串启动，每个 worker 独立加载本模块
+        uvicorn.run("main:app", host="0.0.0.0", port=port, workers=workers)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=port)
@@ -0,0 +1,257 @@
+"""多 worker 共享账户状态：对话次数同步
+
+共享后端用内存表模拟 storage.account_state_push / account_state_pull 的 SQL 语义：
+- 新行以本地对话次数初始化，已有行累加增量且不低于本地次数
+- 拉取返回 updated_at 晚于 since 的行
+"""
+import asyncio
+import itertools
+import json
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+os.environ.setdefault("ADMIN_KEY", "test")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core import storage  # noqa: E402
+from core.account import AccountConfig, MultiAccountManager  # noqa: E402
+from core.shared_state import AccountStateSync, SharedStats, merge_stats  # noqa: E402
+from core.time_buckets import RequestCounters  # noqa: E402
+
+
+class FakeAccountStateTable:
+    def __init__(self) -> None:
+        self.rows = {}
+        self._clock = itertools.count(1)
+
+    def push(self, rows: list) -> list:
+        result = []
+        for account_id, is_available, error_count, last_429, last_error, health_at, delta, local_count in rows:
+            row = self.rows.get(account_id)
+            if row is None:
+                row = self.rows[account_id] = {
+                    "account_id": account_id,
+                    "is_available": is_available,
+                    "error_count": error_count,
+                    "last_429_time": last_429,
+                    "last_error_time": last_error,
+                    "health_updated_at": health_at or 0.0,
+                    "conversation_count": local_count,
+                }
+            else:
+                if health_at is not None and health_at >= row["health_updated_at"]:
+                    row.update(
+                        is_available=is_available,
+                        error_count=error_count,
+                        last_429_time=last_429,
+                        last_error_time=last_error,
+                        health_updated_at=health_at,
+                    )
+                row["conversation_count"] = max(row["conversation_count"] + delta, local_count)
+            row["updated_at"] = float(next(self._clock))
+            result.append((account_id, row["conversation_count"]))
+        return result
+
+    def pull(self, since: float) -> list:
+        return [dict(row) for row in self.rows.values() if row["updated_at"] > since]
+
+
+def make_worker(stats_path: str) -> MultiAccountManager:
+    """模拟一个 worker 启动：从 stats.json 加载历史对话次数"""
+    with open(stats_path, encoding="utf-8") as f:
+        global_stats = json.load(f)
+    manager = MultiAccountManager(3600, 100)
+    for account_id in ("acc1", "acc2"):
+        config = AccountConfig(
+            account_id=account_id, secure_c_ses="x", host_c_oses=None, csesidx="1", config_id="c"
+        )
+        manager.add_account(config, None, "test", 3, 60, global_stats)
+    return manager
+
+
+class ConversationCountSyncTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.table = FakeAccountStateTable()
+        patches = [
+            mock.patch.object(storage, "account_state_push_sync", self.table.push),
+            mock.patch.object(storage, "account_state_pull_sync", self.table.pull),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        fd, self.stats_path = tempfile.mkstemp(suffix=".json")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"account_conversations": {"acc1": 120, "acc2": 7}}, f)
+        self.addCleanup(os.remove, self.stats_path)
+
+    def attach(self, manager: MultiAccountManager) -> AccountStateSync:
+        sync = AccountStateSync("postgres", lambda: manager)
+        manager.attach_state_sync(sync)
+        return sync
+
+    def test_history_survives_first_sync(self) -> None:
+        manager = make_worker(self.stats_path)
+        sync = self.attach(manager)
+        manager.accounts["acc1"].record_conversation()
+        asyncio.run(sync.sync())
+        self.assertEqual(manager.accounts["acc1"].conversation_count, 121)
+        self.assertEqual(manager.accounts["acc2"].conversation_count, 7)
+        self.assertEqual(self.table.rows["acc1"]["conversation_count"], 121)
+
+    def test_health_only_push_seeds_history(self) -> None:
+        manager = make_worker(self.stats_path)
+        sync = self.attach(manager)
+        sync.mark_dirty("acc2")
+        asyncio.run(sync.sync())
+        self.assertEqual(self.table.rows["acc2"]["conversation_count"], 7)
+        self.assertEqual(manager.accounts["acc2"].conversation_count, 7)
+
+    def test_workers_add_increments_on_top_of_history(self) -> None:
+        worker_a = make_worker(self.stats_path)
+        worker_b = make_worker(self.stats_path)
+        sync_a = self.attach(worker_a)
+        sync_b = self.attach(worker_b)
+        for _ in range(3):
+            worker_a.accounts["acc1"].record_conversation()
+        worker_b.accounts["acc1"].record_conversation()
+
+        async def run() -> None:
+            await sync_a.sync()
+            await sync_b.sync()
+            await sync_a.sync()
+
+        asyncio.run(run())
+        self.assertEqual(self.table.rows["acc1"]["conversation_count"], 124)
+        self.assertEqual(worker_a.accounts["acc1"].conversation_count, 124)
+        self.assertEqual(worker_b.accounts["acc1"].conversation_count, 124)
+
+
+class FakeStatsStore:
+    """模拟 storage.stats_merge 的读-改-写（数据库中的共享统计快照）"""
+
+    def __init__(self) -> None:
+        self.value = None
+
+    def merge(self, func) -> dict:
+        self.value = json.loads(json.dumps(func(self.value)))
+        return self.value
+
+
+class StatsWorker:
+    """一个 worker 的本地统计数据，写回流程与 main.save_shared_stats 相同"""
+
+    def __init__(self, loaded: dict) -> None:
+        self.stats = json.loads(json.dumps(loaded))
+        self.counters = RequestCounters.from_stats(self.stats)
+        self.shared = SharedStats("postgres")
+        self.shared.set_base(self.snapshot())
+
+    def snapshot(self) -> dict:
+        return json.loads(json.dumps({**self.stats, "counters": self.counters.to_dict()}))
+
+    def record_request(self, request_id: str, ts: float) -> None:
+        self.stats["total_requests"] += 1
+        self.counters.record_request("gemini-2.5-flash", ts)
+        self.stats["recent_conversations"].append({"request_id": request_id, "start_ts": ts})
+
+    async def flush(self, during_merge=None) -> None:
+        snapshot = self.snapshot()
+        merged = await self.shared.merge(snapshot)
+        if during_merge:
+            during_merge()
+        current = merge_stats(merged, self.snapshot(), snapshot)
+        self.stats.clear()
+        self.stats.update(current)
+        self.counters = RequestCounters.from_stats(self.stats)
+
+
+class SharedStatsMergeTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.store = FakeStatsStore()
+        patch = mock.patch.object(storage, "stats_merge_sync", self.store.merge)
+        patch.start()
+        self.addCleanup(patch.stop)
+        self.now = 1_700_000_000.0
+        history = RequestCounters()
+        for _ in range(5):
+            history.record_request("gemini-2.5-flash", self.now - 120)
+        self.loaded = {
+            "total_visitors": 3,
+            "total_requests": 100,
+            "visitor_ips": {},
+            "account_conversations": {"acc1": 120},
+            "recent_conversations": [],
+            "counters": history.to_dict(),
+        }
+
+    def test_workers_do_not_overwrite_each_other(self) -> None:
+        worker_a = StatsWorker(self.loaded)
+        worker_b = StatsWorker(self.loaded)
+        worker_a.record_request("a1", self.now)
+        worker_a.record_request("a2", self.now + 1)
+        worker_b.record_request("b1", self.now + 2)
+
+        async def run() -> None:
+            await worker_a.flush()
+            await worker_b.flush(during_merge=lambda: worker_b.record_request("b2", self.now + 3))
+            await worker_b.flush()
+            await worker_a.flush()
+
+        asyncio.run(run())
+        self.assertEqual(self.store.value["total_requests"], 104)
+        for worker in (worker_a, worker_b):
+            self.assertEqual(worker.stats["total_requests"], 104)
+            self.assertEqual(worker.counters.requests.count_last(600, now=self.now + 10), 9)
+            self.assertEqual(
+                [entry["request_id"] for entry in worker.stats["recent_conversations"]],
+                ["a1", "a2", "b1", "b2"],
+            )
+
+    def test_idle_merge_keeps_totals(self) -> None:
+        worker = StatsWorker(self.loaded)
+
+        async def run() -> None:
+            await worker.flush()
+            await worker.flush()
+
+        asyncio.run(run())
+        self.assertEqual(self.store.value["total_requests"], 100)
+        self.assertEqual(worker.counters.requests.count_last(600, now=self.now), 5)
+
+    def test_legacy_shared_row_is_migrated(self) -> None:
+        legacy = {
+            "total_visitors": 0,
+            "total_requests": 3,
+            "visitor_ips": {},
+            "account_conversations": {},
+            "recent_conversations": [],
+            "request_timestamps": [self.now - 60] * 3,
+            "failure_timestamps": [],
+            "rate_limit_timestamps": [],
+            "model_request_timestamps": {"gemini-2.5-flash": [self.now - 60] * 3},
+        }
+        self.store.value = json.loads(json.dumps(legacy))
+        worker_a = StatsWorker(legacy)
+        worker_b = StatsWorker(legacy)
+
+        async def run() -> None:
+            for count in (10, 5, 5):
+                for index in range(count):
+                    worker_a.record_request(f"a{count}-{index}", self.now)
+                await worker_a.flush()
+            await worker_b.flush()
+
+        with mock.patch("time.time", return_value=self.now):
+            asyncio.run(run())
+        self.assertFalse(set(RequestCounters.LEGACY_KEYS) & self.store.value.keys())
+        self.assertEqual(self.store.value["total_requests"], 23)
+        for worker in (worker_a, worker_b):
+            self.assertEqual(worker.counters.requests.count_last(3600, now=self.now), 23)
+            self.assertEqual(worker.counters.models["gemini-2.5-flash"].count_last(3600, now=self.now), 23)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+"""
+JSON 编解码层
+
+导入时按 orjson > ujson > 标准库 json 的顺序选择最快的可用后端，
+对话热路径（SSE 分块编码、上游对象解码、非流式聚合）统一通过本模块完成。
+
+- `dumps()` 直接返回 UTF-8 字节，StreamingResponse 无需再把 str 编码一遍
+- `loads()` 与旧代码中的 `json.loads(..., strict=False)` 语义一致：
+  快速后端拒绝的输入（例如字符串中的原始控制字符）会回退到标准库宽松解析
+"""
+import json
+from typing import Any, Tuple, Union
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+# 宽松解码器：允许字符串中出现控制字符（与上游实际返回的数据保持兼容）
+_LENIENT_DECODER = json.JSONDecoder(strict=False)
+
+if orjson is not None:
+    BACKEND = "orjson"
+
+    def dumps(obj: Any) -> bytes:
+        """序列化为紧凑的 UTF-8 JSON 字节"""
+        return orjson.dumps(obj)
+
+    def _fast_loads(data):
+        return orjson.loads(data)
+
+elif ujson is not None:
+    BACKEND = "ujson"
+
+    def dumps(obj: Any) -> bytes:
+        """序列化为紧凑的 UTF-8 JSON 字节"""
+        return ujson.dumps(obj, ensure_ascii=False, escape_forward_slashes=False).encode("utf-8")
+
+    def _fast_loads(data):
+        return ujson.loads(data)
+
+else:
+    BACKEND = "json"
+
+    def dumps(obj: Any) -> bytes:
+        """序列化为紧凑的 UTF-8 JSON 字节"""
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    _fast_loads = None
+
+
+def dumps_str(obj: Any) -> str:
+    """序列化为紧凑的 JSON 字符串（用于需要 str 的场景）"""
+    return dumps(obj).decode("utf-8")
+
+
+def loads(data: Union[bytes, bytearray, memoryview, str]) -> Any:
+    """
+    解析 JSON。
+
+    Raises:
+        json.JSONDecodeError: 输入不是合法 JSON（快速后端与标准库都无法解析）。
+    """
+    if _fast_loads is not None:
+        try:
+            return _fast_loads(data)
+        except (ValueError, TypeError):
+            # orjson / ujson 的解析异常都是 ValueError 的子类，交给宽松解码器兜底
+            pass
+    if not isinstance(data, str):
+        data = bytes(data).decode("utf-8")
+    return _LENIENT_DECODER.decode(data)
+
+
+def raw_decode(text: str, idx: int = 0) -> Tuple[Any, int]:
+    """
+    从 text[idx] 开始解析一个 JSON 值，返回 (对象, 结束位置)。
+
+    快速后端都不支持定位值的结束位置，因此这里固定使用标准库的 C 扫描器；
+    流式解析器依赖它同时完成边界识别与解码。
+
+    Raises:
+        json.JSONDecodeError: 从 idx 开始的内容不完整或不是合法 JSON。
+    """
+    return _LENIENT_DECODER.raw_decode(text, idx)
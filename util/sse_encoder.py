@@ -0,0 +1,49 @@
+"""
+OpenAI chat.completion.chunk 的 SSE 编码器
+
+同一次补全中，除 delta 之外的字段（id、object、created、model、logprobs、
+finish_reason、system_fingerprint）都保持不变。ChunkEncoder 在补全开始时
+把这些字段预先序列化成前缀/后缀字节，之后每个增量只需转义 delta 文本并拼接。
+"""
+from typing import Optional
+
+from util import json_codec
+
+_CONTENT_OPEN = b'{"content":'
+_REASONING_OPEN = b'{"reasoning_content":'
+
+
+class ChunkEncoder:
+    """单次补全的分块编码器（输出完整的 `data: ...\\n\\n` SSE 事件字节）"""
+
+    __slots__ = ("_prefix", "_suffix")
+
+    def __init__(self, chat_id: str, created: int, model: str) -> None:
+        envelope = json_codec.dumps({
+            "id": chat_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+        })
+        # 去掉结尾的 '}'，后面接上 choices 数组
+        self._prefix = b"data: " + envelope[:-1] + b',"choices":[{"index":0,"delta":'
+        self._suffix = b',"logprobs":null,"finish_reason":null}],"system_fingerprint":null}\n\n'
+
+    def content(self, text: str) -> bytes:
+        """编码正文增量"""
+        return self._prefix + _CONTENT_OPEN + json_codec.dumps(text) + b"}" + self._suffix
+
+    def reasoning(self, text: str) -> bytes:
+        """编码思考过程增量"""
+        return self._prefix + _REASONING_OPEN + json_codec.dumps(text) + b"}" + self._suffix
+
+    def encode(self, delta: dict, finish_reason: Optional[str] = None) -> bytes:
+        """编码任意 delta（非热点路径，例如首个 role 分块和结束分块）"""
+        if finish_reason is None:
+            suffix = self._suffix
+        else:
+            suffix = (
+                b',"logprobs":null,"finish_reason":' + json_codec.dumps(finish_reason)
+                + b'}],"system_fingerprint":null}\n\n'
+            )
+        return self._prefix + json_codec.dumps(delta) + suffix
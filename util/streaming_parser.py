@@ -1,123 +1,209 @@
+import codecs
 import json
-from typing import Iterator, Dict, Any, Iterable, AsyncIterator
-from itertools import chain
+import re
+from typing import Iterator, Dict, Any, Iterable, AsyncIterator, List, Union
 
-def parse_json_array_stream(line_iterator: Iterable[str]) -> Iterator[Dict[str, Any]]:
-    """
-    解析一个由文本行组成的、格式化的(pretty-printed)JSON数组流。
+from util import json_codec
 
-    这个函数是一个生成器，它会为在流中发现的每个第一层级的JSON对象
-    产出(yield)一个完整的Python字典。它的设计目标是高内存效率，
-    因为它会逐行处理流，而不是一次性加载所有内容。
+# 边界扫描：一次匹配一个完整的字符串字面量或一个括号，字符串内容由正则引擎在
+# C 层整体跳过；末尾的单个 '"' 表示字符串被块边界截断
+_TOKEN = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"|[{}]|"', re.DOTALL)
+# 字符串被截断时，从字符串内部一次跳到结尾引号（或块尾）之前
+_STRING_REST = re.compile(r'[^"\\]*(?:\\.[^"\\]*)*', re.DOTALL)
 
-    Args:
-        line_iterator: 一个产生响应行的迭代器。例如，`requests.Response.iter_lines()`
-                       解码后的结果。
 
-    Yields:
-        一个从流中解析出的JSON对象的字典。
-
-    Raises:
-        ValueError: 如果流看起来不像是以JSON数组开始，或者其格式错误
-                    导致无法按对象进行解析。
+class JsonArrayStreamParser:
     """
-    # 状态变量
-    buffer = []
-    brace_level = 0
-    in_array = False
-
-    # 1. 寻找数组的起始符 '['，并忽略之前的所有行
-    for line in line_iterator:
-        stripped_line = line.strip()
-        if not stripped_line:
-            continue
-
-        if stripped_line.startswith('['):
-            in_array = True
-            # 去掉起始的 '[' 字符，剩下的部分继续处理
-            line = stripped_line[1:]
-            # 使用 chain 连接剩余行，避免转换为列表（内存优化）
-            line_iterator = chain([line], line_iterator)
-            break
-    
-    if not in_array:
-        raise ValueError("数据流不是以一个JSON数组 ( '[' ) 开始。")
-
-    # 2. 遍历流，逐个字符地构建和解析对象
-    in_string = False  # 是否在字符串内部
-    escape_next = False  # 下一个字符是否被转义
-
-    for line in line_iterator:
-        for char in line:
-            # 处理转义字符
-            if escape_next:
-                if brace_level > 0:
-                    buffer.append(char)
-                escape_next = False
-                continue
+    增量式 JSON 数组流解析器。
 
-            # 检查是否是转义符
-            if char == '\\':
-                if brace_level > 0:
-                    buffer.append(char)
-                escape_next = True
-                continue
+    调用方可以把任意切分的字节块（或文本块）依次喂给 `feed()`，
+    每当第一层级的 JSON 对象完整闭合时就产出对应的字典，不再逐字符拼接字符串。
+
+    对每个第一层级对象：
+    1. 快速路径：用 `str.find` 定位 '{'，直接交给 C 实现的 `raw_decode`，
+       一次完成边界识别和解码；
+    2. 对象跨越块边界时，改用正则扫描（整体跳过字符串字面量）增量地寻找
+       对象结尾：已扫描的片段暂存在列表中，每块只扫描新到达的文本，对象闭合时
+       拼接一次交给 `json_codec.loads`，总开销与对象大小成线性关系。
+    """
 
-            # 检查字符串边界（只在对象内部时才处理）
-            if char == '"' and brace_level > 0:
-                in_string = not in_string
-                buffer.append(char)
+    def __init__(self) -> None:
+        # 按 UTF-8 增量解码，多字节字符被块边界截断时会等待下一块
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+        self._buffer = ""        # 找到数组起始符之前的前导内容
+        self._parts: List[str] = []  # 跨块对象已扫描过的片段
+        self._carry = ""         # 需要与下一块一起扫描的尾部（被截断的转义符）
+        self._obj_start = -1     # 跨块对象在当前文本中的起点（-1 表示不在扫描模式）
+        self._depth = 0
+        self._in_string = False
+        self._in_array = False
+
+    @property
+    def depth(self) -> int:
+        """当前未闭合的括号层级"""
+        return self._depth
+
+    @property
+    def started(self) -> bool:
+        """是否已经找到数组起始符 '['"""
+        return self._in_array
+
+    def feed(self, data: Union[bytes, bytearray, str]) -> List[Dict[str, Any]]:
+        """
+        喂入一段数据，返回本次新解析出的完整对象列表。
+
+        Raises:
+            ValueError: 对象内容不是合法 JSON。
+        """
+        if isinstance(data, str):
+            # 文本输入视为按行迭代的结果：数组开始前补回换行，保证按行跳过前导内容
+            text = data if self._in_array else data + "\n"
+        else:
+            text = self._utf8.decode(data)
+        if not text:
+            return []
+        if not self._in_array:
+            self._buffer += text
+            if not self._find_array_start():
+                return []
+            text, self._buffer = self._buffer, ""
+
+        objects = []
+        buf = self._carry + text if self._carry else text
+        pos = 0
+        end = len(buf)
+        if self._obj_start >= 0:
+            # 跨块对象在本块中从头继续
+            self._obj_start = 0
+
+        while pos < end:
+            if self._obj_start < 0:
+                idx = buf.find("{", pos)
+                if idx < 0:
+                    pos = end
+                    break
+                try:
+                    obj, pos = json_codec.raw_decode(buf, idx)
+                    objects.append(obj)
+                    continue
+                except json.JSONDecodeError:
+                    # 对象不完整（或格式错误）：转入扫描模式，由扫描结果决定
+                    self._obj_start = idx
+                    self._depth = 0
+                    self._in_string = False
+                    pos = idx
+
+            pos, complete = self._scan(buf, pos, end)
+            if not complete:
+                break
+            obj_text = buf[self._obj_start:pos]
+            if self._parts:
+                self._parts.append(obj_text)
+                obj_text = "".join(self._parts)
+                self._parts = []
+            self._obj_start = -1
+            objects.append(self._decode(obj_text))
+
+        # 对象未闭合：保存已扫描的片段，下一块只扫描新数据；对象之间的内容（逗号、空白）直接丢弃
+        if self._obj_start >= 0:
+            self._parts.append(buf[self._obj_start:pos])
+            self._carry = buf[pos:]
+        else:
+            self._carry = ""
+        return objects
+
+    def _scan(self, buf: str, pos: int, end: int) -> tuple:
+        """从 pos 继续寻找当前对象的结尾，返回 (新位置, 是否已闭合)"""
+        depth = self._depth
+        in_string = self._in_string
+        complete = False
+
+        while pos < end:
+            if in_string:
+                idx = _STRING_REST.match(buf, pos).end()
+                if idx >= end:
+                    pos = end
+                    break
+                if buf[idx] == "\\":
+                    # 转义符位于块尾，等待下一块数据再处理
+                    pos = idx
+                    break
+                in_string = False
+                pos = idx + 1
                 continue
 
-            # 只有在非字符串内部时，才处理括号
-            if not in_string:
-                # 当遇到 '{' 时，增加嵌套层级
-                if char == '{':
-                    # 如果是第一层级的对象，清空缓冲区，准备接收新对象
-                    if brace_level == 0:
-                        buffer = []
-                    brace_level += 1
-
-                # 只有在对象内部时 (brace_level > 0)，才将字符加入缓冲区
-                if brace_level > 0:
-                    buffer.append(char)
-
-                # 当遇到 '}' 时，减少嵌套层级
-                if char == '}':
-                    brace_level -= 1
-                    # 当层级回到0时，说明一个第一层级的对象已经完整
-                    if brace_level == 0 and buffer:
-                        obj_str = "".join(buffer)
-                        try:
-                            # 解析这个完整的对象字符串并产出结果
-                            # 使用 strict=False 允许控制字符
-                            yield json.loads(obj_str, strict=False)
-                        except json.JSONDecodeError as e:
-                            # 如果解析失败，抛出带上下文的异常
-                            raise ValueError(f"解析JSON对象失败: {e}\n内容: {obj_str}") from e
-                        finally:
-                            # 重置缓冲区，为下一个对象做准备
-                            buffer = []
-                            in_string = False  # 重置字符串状态
+            match = _TOKEN.search(buf, pos)
+            if match is None:
+                pos = end
+                break
+            start = match.start()
+            pos = match.end()
+            char = buf[start]
+
+            if char == '"':
+                if pos - start == 1:
+                    # 字符串在当前块内没有闭合，转入逐段扫描
+                    in_string = True
+            elif char == "{":
+                depth += 1
             else:
-                # 在字符串内部，直接添加字符
-                if brace_level > 0:
-                    buffer.append(char)
-
-    # 3. 检查流结束后，是否还有未闭合的对象
-    if brace_level != 0:
-        print(f"警告: JSON流意外结束，括号层级为 {brace_level}，可能数据不完整。")
-
-async def parse_json_array_stream_async(line_iterator: AsyncIterator[str]) -> AsyncIterator[Dict[str, Any]]:
+                depth -= 1
+                if depth == 0:
+                    complete = True
+                    break
+
+        self._depth = depth
+        self._in_string = in_string
+        return pos, complete
+
+    def close(self) -> None:
+        """
+        标记数据流结束。
+
+        Raises:
+            ValueError: 如果整个数据流中都没有找到 JSON 数组起始符。
+        """
+        if not self._in_array:
+            raise ValueError("数据流不是以一个JSON数组 ( '[' ) 开始。")
+        if self._obj_start >= 0:
+            print(f"警告: JSON流意外结束，括号层级为 {self._depth}，可能数据不完整。")
+
+    def _find_array_start(self) -> bool:
+        """跳过 '[' 之前的行，找到数组起点后把扫描位置移到其后"""
+        while True:
+            stripped = self._buffer.lstrip()
+            if not stripped:
+                self._buffer = ""
+                return False
+            if stripped[0] == "[":
+                self._buffer = stripped[1:]
+                self._in_array = True
+                return True
+            # 与旧实现一致：忽略不以 '[' 开头的整行
+            newline = stripped.find("\n")
+            if newline < 0:
+                self._buffer = stripped
+                return False
+            self._buffer = stripped[newline + 1:]
+
+    @staticmethod
+    def _decode(obj_text: str) -> Dict[str, Any]:
+        try:
+            return json_codec.loads(obj_text)
+        except ValueError as e:
+            raise ValueError(f"解析JSON对象失败: {e}\n内容: {obj_text}") from e
+
+
+def parse_json_array_stream(chunk_iterator: Iterable[Union[bytes, str]]) -> Iterator[Dict[str, Any]]:
     """
-    异步版本：解析一个由文本行组成的、格式化的(pretty-printed)JSON数组流。
+    解析一个 JSON 数组流。
 
-    这个函数是一个异步生成器，它会为在流中发现的每个第一层级的JSON对象
-    产出(yield)一个完整的Python字典。它的设计目标是高内存效率，
-    因为它会逐行处理流，而不是一次性加载所有内容。
+    这个函数是一个生成器，它会为在流中发现的每个第一层级的JSON对象
+    产出(yield)一个完整的Python字典。输入可以是任意切分的字节块或文本行，
+    例如 `requests.Response.iter_content()` 或 `iter_lines()` 的结果。
 
     Args:
-        line_iterator: 一个产生响应行的异步迭代器。例如，`httpx.Response.aiter_lines()`
+        chunk_iterator: 一个产生字节块（或文本行）的迭代器。
 
     Yields:
         一个从流中解析出的JSON对象的字典。
@@ -126,130 +212,31 @@ async def parse_json_array_stream_async(line_iterator: AsyncIterator[str]) -> As
         ValueError: 如果流看起来不像是以JSON数组开始，或者其格式错误
                     导致无法按对象进行解析。
     """
-    # 状态变量
-    buffer = []
-    brace_level = 0
-    in_array = False
-
-    # 1. 寻找数组的起始符 '['，并忽略之前的所有行
-    in_string = False
-    escape_next = False
-
-    async for line in line_iterator:
-        stripped_line = line.strip()
-        if not stripped_line:
-            continue
-
-        if stripped_line.startswith('['):
-            in_array = True
-            # 去掉起始的 '[' 字符，剩下的部分继续处理
-            line = stripped_line[1:]
-            # 处理剩余部分（使用相同的字符串状态跟踪逻辑）
-            for char in line:
-                if escape_next:
-                    if brace_level > 0:
-                        buffer.append(char)
-                    escape_next = False
-                    continue
+    parser = JsonArrayStreamParser()
+    for chunk in chunk_iterator:
+        yield from parser.feed(chunk)
+    parser.close()
 
-                if char == '\\':
-                    if brace_level > 0:
-                        buffer.append(char)
-                    escape_next = True
-                    continue
 
-                if char == '"' and brace_level > 0:
-                    in_string = not in_string
-                    buffer.append(char)
-                    continue
-
-                if not in_string:
-                    if char == '{':
-                        if brace_level == 0:
-                            buffer = []
-                        brace_level += 1
-
-                    if brace_level > 0:
-                        buffer.append(char)
-
-                    if char == '}':
-                        brace_level -= 1
-                        if brace_level == 0 and buffer:
-                            obj_str = "".join(buffer)
-                            try:
-                                yield json.loads(obj_str, strict=False)
-                            except json.JSONDecodeError as e:
-                                raise ValueError(f"解析JSON对象失败: {e}\n内容: {obj_str}") from e
-                            finally:
-                                buffer = []
-                                in_string = False
-                else:
-                    if brace_level > 0:
-                        buffer.append(char)
-            break
-
-    if not in_array:
-        raise ValueError("数据流不是以一个JSON数组 ( '[' ) 开始。")
-
-    # 2. 遍历流，逐个字符地构建和解析对象（保持第一行处理后的状态）
-    async for line in line_iterator:
-        for char in line:
-            # 处理转义字符
-            if escape_next:
-                if brace_level > 0:
-                    buffer.append(char)
-                escape_next = False
-                continue
-
-            # 检查是否是转义符
-            if char == '\\':
-                if brace_level > 0:
-                    buffer.append(char)
-                escape_next = True
-                continue
+async def parse_json_array_stream_async(chunk_iterator: AsyncIterator[Union[bytes, str]]) -> AsyncIterator[Dict[str, Any]]:
+    """
+    异步版本：解析一个 JSON 数组流。
 
-            # 检查字符串边界（只在对象内部时才处理）
-            if char == '"' and brace_level > 0:
-                in_string = not in_string
-                buffer.append(char)
-                continue
+    推荐直接传入 `httpx.Response.aiter_bytes()`，省去按行解码的开销；
+    为了兼容，`httpx.Response.aiter_lines()` 这类文本迭代器同样可用。
 
-            # 只有在非字符串内部时，才处理括号
-            if not in_string:
-                # 当遇到 '{' 时，增加嵌套层级
-                if char == '{':
-                    # 如果是第一层级的对象，清空缓冲区，准备接收新对象
-                    if brace_level == 0:
-                        buffer = []
-                    brace_level += 1
-
-                # 只有在对象内部时 (brace_level > 0)，才将字符加入缓冲区
-                if brace_level > 0:
-                    buffer.append(char)
-
-                # 当遇到 '}' 时，减少嵌套层级
-                if char == '}':
-                    brace_level -= 1
-                    # 当层级回到0时，说明一个第一层级的对象已经完整
-                    if brace_level == 0 and buffer:
-                        obj_str = "".join(buffer)
-                        try:
-                            # 解析这个完整的对象字符串并产出结果
-                            # 使用 strict=False 允许控制字符
-                            yield json.loads(obj_str, strict=False)
-                        except json.JSONDecodeError as e:
-                            # 如果解析失败，抛出带上下文的异常
-                            raise ValueError(f"解析JSON对象失败: {e}\n内容: {obj_str}") from e
-                        finally:
-                            # 重置缓冲区，为下一个对象做准备
-                            buffer = []
-                            in_string = False  # 重置字符串状态
-            else:
-                # 在字符串内部，直接添加字符
-                if brace_level > 0:
-                    buffer.append(char)
+    Args:
+        chunk_iterator: 一个产生字节块（或文本行）的异步迭代器。
 
-    # 3. 检查流结束后，是否还有未闭合的对象
-    if brace_level != 0:
-        print(f"警告: JSON流意外结束，括号层级为 {brace_level}，可能数据不完整。")
+    Yields:
+        一个从流中解析出的JSON对象的字典。
 
+    Raises:
+        ValueError: 如果流看起来不像是以JSON数组开始，或者其格式错误
+                    导致无法按对象进行解析。
+    """
+    parser = JsonArrayStreamParser()
+    async for chunk in chunk_iterator:
+        for obj in parser.feed(chunk):
+            yield obj
+    parser.close()